@@ -1,15 +1,27 @@
+import hashlib
 import os
 import shutil
 import subprocess
+import threading
+import time
 from pathlib import Path
+from typing import TYPE_CHECKING, Any, Callable, Dict, Optional, Sequence, Tuple
 
 import requests
+import requests.adapters
 
 import df
 import df.config
-import df.ui
+import df.fingerprint
+import df.metrics
+import df.timeouts
+import df.trace
 from df.config import ModuleConfig
 
+if TYPE_CHECKING:
+    # Only imported when the TUI is started, so the CLI never loads textual
+    import df.ui
+
 DOTFILES_DIR: str  # The directory where the dotfiles are stored, can be used by modules
 DOTFILES_PATH: Path  # The path to the dotfiles directory
 
@@ -77,6 +89,7 @@ def ensure_parent_exists(path: Path) -> None:
         parent.mkdir(parents=True, exist_ok=True)
 
 
+@df.trace.traced("fs")
 def move_path(source: Path, target: Path) -> None:
     """Move the source path to the target path.
     Will work with files, symlinks, folders and over filesystem boundaries,
@@ -88,6 +101,7 @@ def move_path(source: Path, target: Path) -> None:
     shutil.move(source, target)
 
 
+@df.trace.traced("fs")
 def symlink_path(source: Path, target: Path) -> None:
     """Symlink the source path to the target path"""
     # Use pathlib symlink, ensure parent exists
@@ -97,8 +111,22 @@ def symlink_path(source: Path, target: Path) -> None:
         subprocess.check_call('mklink /J "%s" "%s"' % (target, source), shell=True)
     else:  # Unix/Linux
         target.symlink_to(source)
+    df.fingerprint.record(target, source)
+
+
+def run_process(args: Sequence[Any], phase: Optional[str] = None, **kwargs: Any) -> "subprocess.CompletedProcess[Any]":
+    """subprocess.run, recorded as a phase of the running module action (see
+    df.metrics), named after the executable (e.g. "fc-cache") by default.
+    The command is killed when it runs out of time (see df.timeouts.run).
+    """
+    with df.metrics.Phase(phase or os.path.basename(str(args[0]))):
+        with df.trace.span(" ".join(map(str, args)), "process") as span_args:
+            result = df.timeouts.run(args, **kwargs)
+            span_args["returncode"] = result.returncode
+            return result
 
 
+@df.trace.traced("fs")
 def create_backup(path: Path, config: ModuleConfig, key: str) -> None:
     """Create a backup of the given path if needed
     Will save the backup path in the config under the given key,
@@ -119,6 +147,7 @@ def create_backup(path: Path, config: ModuleConfig, key: str) -> None:
         config.unset(key)
 
 
+@df.trace.traced("fs")
 def restore_backup(path: Path, config: ModuleConfig, key: str) -> None:
     """Restore a backup of the given path
     If available, will restore the given path as it was before calling
@@ -145,16 +174,311 @@ def restore_backup(path: Path, config: ModuleConfig, key: str) -> None:
     config.unset(key)
 
 
-def download_file(url: str, path: Path) -> None:
-    """Download a file from the given url to the given path"""
-    r = requests.get(url)
-    r.raise_for_status()
-    ensure_parent_exists(path)
-    with path.open("wb") as f:
-        f.write(r.content)
+# Shared HTTP session, all network access should go through it so that
+# connections (and TLS handshakes) to e.g. github.com are reused
+HTTP_POOL_SIZE = int(os.environ.get("DF_HTTP_POOL_SIZE", "16"))
+HTTP_CONNECT_TIMEOUT = float(os.environ.get("DF_HTTP_CONNECT_TIMEOUT", "10"))
+HTTP_READ_TIMEOUT = float(os.environ.get("DF_HTTP_READ_TIMEOUT", "60"))
+HTTP_RETRIES = 3
+
+_http_session: Optional[requests.Session] = None
+_http_session_lock = threading.Lock()
+
+
+class _PooledSession(requests.Session):
+    """Session with a default timeout for all requests"""
+
+    def __init__(self, timeout: Tuple[float, float]) -> None:
+        super().__init__()
+        self.default_timeout = timeout
+
+    def request(self, *args: Any, **kwargs: Any) -> requests.Response:
+        kwargs.setdefault("timeout", self.default_timeout)
+        method = args[0] if args else kwargs.get("method")
+        url = args[1] if len(args) > 1 else kwargs.get("url")
+        with df.trace.span(f"{method} {url}", "http") as span_args:
+            response = super().request(*args, **kwargs)
+            span_args["status"] = response.status_code
+            return response
+
+
+def configure_http(
+    pool_size: Optional[int] = None,
+    connect_timeout: Optional[float] = None,
+    read_timeout: Optional[float] = None,
+) -> None:
+    """Change the settings of the shared HTTP session
+    The session is recreated the next time it is used
+    """
+    global HTTP_POOL_SIZE, HTTP_CONNECT_TIMEOUT, HTTP_READ_TIMEOUT, _http_session
+    with _http_session_lock:
+        if pool_size is not None:
+            HTTP_POOL_SIZE = pool_size
+        if connect_timeout is not None:
+            HTTP_CONNECT_TIMEOUT = connect_timeout
+        if read_timeout is not None:
+            HTTP_READ_TIMEOUT = read_timeout
+        if _http_session is not None:
+            _http_session.close()
+            _http_session = None
+
+
+def http_session() -> requests.Session:
+    """Returns the process wide HTTP session
+    It keeps connections alive, pools up to HTTP_POOL_SIZE connections per
+    host (so it can be used from multiple threads), retries failed
+    connections and applies a default (connect, read) timeout.
+    """
+    global _http_session
+    with _http_session_lock:
+        if _http_session is None:
+            session = _PooledSession((HTTP_CONNECT_TIMEOUT, HTTP_READ_TIMEOUT))
+            retries = requests.adapters.Retry(
+                total=HTTP_RETRIES,
+                backoff_factor=0.5,
+                status_forcelist=[502, 503, 504],
+                allowed_methods=["GET", "HEAD"],
+                raise_on_status=False,
+            )
+            adapter = requests.adapters.HTTPAdapter(
+                pool_connections=HTTP_POOL_SIZE,
+                pool_maxsize=HTTP_POOL_SIZE,
+                max_retries=retries,
+            )
+            session.mount("https://", adapter)
+            session.mount("http://", adapter)
+            session.headers["User-Agent"] = "dotfiles-manager (python-requests)"
+            _http_session = session
+        return _http_session
+
+
+def http_get(url: str, **kwargs: Any) -> requests.Response:
+    """requests.get, but using the shared HTTP session"""
+    return http_session().get(url, **kwargs)
+
+
+DOWNLOAD_CHUNK_SIZE = 256 * 1024
+DOWNLOAD_RETRIES = 3
+# Set DF_NO_ARTIFACT_CACHE=1 to always download files directly
+ARTIFACT_CACHE_ENABLED = not os.environ.get("DF_NO_ARTIFACT_CACHE")
+
+# Called with (downloaded bytes, total bytes or None, bytes per second)
+ProgressCallback = Callable[[int, Optional[int], float], None]
+# Called with (offset in the file, data) for every downloaded chunk
+ChunkCallback = Callable[[int, bytes], None]
+
+
+class ChecksumMismatchError(Exception):
+    """Raised when a downloaded file does not have the expected sha256 digest"""
+
+    def __init__(self, url: str, expected: str, actual: str) -> None:
+        super().__init__(f"Checksum mismatch for {url}: expected sha256 {expected}, got {actual}")
+        self.url = url
+        self.expected = expected
+        self.actual = actual
+
+
+class StreamingHash:
+    """The sha256 of a file, computed from the chunks while it is downloaded
+    (pass update as on_chunk). If the download does not start at the
+    beginning (it was resumed), the existing part of the file is read once.
+    """
+
+    def __init__(self, path: Path) -> None:
+        self.path = path
+        self.sha256 = hashlib.sha256()
+        self.position = 0
+
+    def _rehash(self, end: int) -> None:
+        self.sha256 = hashlib.sha256()
+        self.position = end
+        if end == 0:
+            return
+        with self.path.open("rb") as f:
+            remaining = end
+            while remaining > 0 and (chunk := f.read(min(remaining, DOWNLOAD_CHUNK_SIZE))):
+                self.sha256.update(chunk)
+                remaining -= len(chunk)
+
+    def update(self, offset: int, chunk: bytes) -> None:
+        if offset != self.position:
+            self._rehash(offset)
+        self.sha256.update(chunk)
+        self.position += len(chunk)
+
+    def hexdigest(self) -> str:
+        """Returns the digest of the complete file, call after the download"""
+        size = self.path.stat().st_size
+        if size != self.position:
+            self._rehash(size)
+        return self.sha256.hexdigest()
+
+
+def chain_chunk_callbacks(*callbacks: Optional[ChunkCallback]) -> ChunkCallback:
+    """Returns a ChunkCallback calling all given callbacks"""
+    active = [callback for callback in callbacks if callback is not None]
+
+    def on_chunk(offset: int, chunk: bytes) -> None:
+        for callback in active:
+            callback(offset, chunk)
+
+    return on_chunk
+
+
+def download_file(
+    url: str,
+    path: Path,
+    progress: Optional[ProgressCallback] = None,
+    chunk_size: int = DOWNLOAD_CHUNK_SIZE,
+    retries: int = DOWNLOAD_RETRIES,
+    cache: bool = True,
+    sha256: Optional[str] = None,
+) -> None:
+    """Download a file from the given url to the given path
+    The file is streamed in chunks, so memory usage does not depend on the
+    file size. Interrupted downloads are resumed with a HTTP Range request.
+    If cache is true (and the artifact cache is enabled), the file is served
+    from the artifact cache (see df.artifacts), which only downloads it again
+    if it changed upstream.
+    If given, progress is called after every chunk.
+    If sha256 is given, the file is verified (hashed while it is downloaded)
+    and ChecksumMismatchError is raised if it does not match. If a lockfile
+    is used, the locked digest of url is used by default (see df.lockfile).
+    Files prefetched in this process (see df.prefetch) are used directly.
+    """
+    import df.lockfile
+
+    with df.metrics.Phase("download"):
+        ensure_parent_exists(path)
+        if sha256 is None:
+            sha256 = df.lockfile.locked_digest(url)
+        if cache and ARTIFACT_CACHE_ENABLED:
+            import df.artifacts
+            import df.prefetch
+
+            cached_path = df.prefetch.prefetched_path(url)
+            if cached_path is not None and cached_path.exists():
+                df.artifacts.verify_blob(url, cached_path, sha256)
+            else:
+                cached_path = df.artifacts.artifact_cache().fetch(url, progress, chunk_size, retries, sha256=sha256)
+            shutil.copyfile(cached_path, path)
+            return
+        part_path = path.with_name(path.name + ".part")
+        hasher = StreamingHash(part_path)
+        download_resumable(url, part_path, progress, chunk_size, retries, on_chunk=hasher.update)
+        verify_digest(url, part_path, hasher, sha256)
+        os.replace(part_path, path)
 
 
-def main(dotfiles_dir: str, config_file: str) -> df.ui.DotfilesApp:
+def verify_digest(url: str, part_path: Path, hasher: StreamingHash, sha256: Optional[str]) -> None:
+    """Raise ChecksumMismatchError (and delete part_path) if the downloaded file
+    does not have the digest sha256 (if given)
+    """
+    if sha256 is None:
+        return
+    actual = hasher.hexdigest()
+    if actual != sha256.lower():
+        part_path.unlink(missing_ok=True)
+        raise ChecksumMismatchError(url, sha256, actual)
+
+
+def download_resumable(
+    url: str,
+    part_path: Path,
+    progress: Optional[ProgressCallback] = None,
+    chunk_size: int = DOWNLOAD_CHUNK_SIZE,
+    retries: int = DOWNLOAD_RETRIES,
+    headers: Optional[Dict[str, str]] = None,
+    on_chunk: Optional[ChunkCallback] = None,
+) -> Optional[Dict[str, str]]:
+    """Download url into part_path, resuming if part_path already exists
+    Connection errors are retried (up to retries times) by resuming with a
+    HTTP Range request. Calling this function again later with the same
+    part_path also resumes the download.
+    headers are sent with the first request (e.g. conditional headers).
+    If given, on_chunk is called with every chunk written to part_path.
+    Returns the headers of the response, or None if the server answered
+    with 304 Not Modified.
+    """
+    ensure_parent_exists(part_path)
+    validator_path = part_path.with_name(part_path.name + ".validator")
+    attempt = 0
+    while True:
+        try:
+            response_headers = _download_part(url, part_path, validator_path, progress, chunk_size, headers or {}, on_chunk)
+            break
+        except (requests.ConnectionError, requests.exceptions.ChunkedEncodingError):
+            attempt += 1
+            if attempt > retries:
+                raise
+    validator_path.unlink(missing_ok=True)
+    return response_headers
+
+
+def _download_part(
+    url: str,
+    part_path: Path,
+    validator_path: Path,
+    progress: Optional[ProgressCallback],
+    chunk_size: int,
+    extra_headers: Dict[str, str],
+    on_chunk: Optional[ChunkCallback] = None,
+) -> Optional[Dict[str, str]]:
+    """Download url into part_path, appending to it if it already exists
+    The ETag (or Last-Modified) of the response is saved in validator_path,
+    it is sent as If-Range when resuming, so that a changed file is
+    downloaded again from the start instead of being corrupted.
+    """
+    # Content encodings would break byte offsets, we want the raw file
+    headers = {"Accept-Encoding": "identity"}
+    offset = part_path.stat().st_size if part_path.exists() else 0
+    if offset > 0:
+        headers["Range"] = f"bytes={offset}-"
+        if validator_path.exists():
+            headers["If-Range"] = validator_path.read_text()
+    else:
+        headers.update(extra_headers)
+    with http_get(url, headers=headers, stream=True) as r:
+        if offset == 0 and r.status_code == 304:
+            return None
+        if offset > 0 and r.status_code == 416:
+            # The part file is larger than the file, start from scratch
+            part_path.unlink()
+            validator_path.unlink(missing_ok=True)
+            return _download_part(url, part_path, validator_path, progress, chunk_size, extra_headers, on_chunk)
+        r.raise_for_status()
+        if r.status_code != 206:
+            # The server sent the whole file (no support for ranges or the file changed)
+            offset = 0
+        validator = r.headers.get("ETag") or r.headers.get("Last-Modified")
+        if validator:
+            validator_path.write_text(validator)
+        else:
+            validator_path.unlink(missing_ok=True)
+        length = r.headers.get("Content-Length")
+        total = offset + int(length) if length is not None else None
+
+        downloaded = offset
+        start = time.monotonic()
+        with part_path.open("ab" if offset > 0 else "wb") as f:
+            for chunk in r.iter_content(chunk_size=chunk_size):
+                df.timeouts.check()
+                f.write(chunk)
+                df.metrics.count_bytes(len(chunk))
+                if on_chunk is not None:
+                    on_chunk(downloaded, chunk)
+                downloaded += len(chunk)
+                if progress is not None:
+                    elapsed = time.monotonic() - start
+                    speed = (downloaded - offset) / elapsed if elapsed > 0 else 0.0
+                    progress(downloaded, total, speed)
+        response_headers = dict(r.headers)
+    if total is not None and downloaded < total:
+        raise requests.exceptions.ChunkedEncodingError(f"Download of {url} ended after {downloaded} of {total} bytes")
+    return response_headers
+
+
+def main(dotfiles_dir: str, config_file: str) -> "df.ui.DotfilesApp":
     """
     Main entry point for the this tool
 
@@ -172,8 +496,11 @@ def main(dotfiles_dir: str, config_file: str) -> df.ui.DotfilesApp:
     # Load the config file
 
     config = df.config.Config(config_file)
+    df.trace.start_from_env()
 
     # Start the GUI
-    app = df.ui.DotfilesApp(config)
+    from df.ui import DotfilesApp
+
+    app = DotfilesApp(config)
     app.run()
     return app
@@ -0,0 +1,44 @@
+"""
+Entry point for running df as a package (python -m df) or as a zipapp
+(see scripts/build-zipapp.py). Unlike dotfiles.py, this does not set up a
+venv, the dependencies must already be importable (they are bundled into
+the zipapp).
+
+The dotfiles directory is $DF_DOTFILES_DIR if set, otherwise the directory
+containing the df package (or the zipapp).
+"""
+
+import os
+import sys
+
+
+def dotfiles_dir() -> str:
+    """Returns the directory where the dotfiles are stored"""
+    if os.environ.get("DF_DOTFILES_DIR"):
+        return os.path.realpath(os.environ["DF_DOTFILES_DIR"])
+    root = os.path.dirname(os.path.dirname(os.path.realpath(__file__)))
+    if os.path.isfile(root):
+        # Running from a zipapp, root is the archive itself
+        root = os.path.dirname(root)
+    return root
+
+
+def main() -> None:
+    import df.profiling
+
+    # Started after df was imported, use dotfiles.py to include its imports
+    df.profiling.start_from_args(sys.argv[1:])
+    directory = dotfiles_dir()
+    config_file = os.path.join(directory, "config.json")
+    if len(sys.argv) > 1:
+        import df.cli
+
+        sys.exit(df.cli.main_cli(directory, config_file, sys.argv[1:]))
+    else:
+        import df
+
+        df.main(directory, config_file)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,250 @@
+"""
+Content addressed cache for downloaded artifacts (release archives, fonts, ...)
+
+Files are stored by their sha256 in ~/.cache/df/artifacts/blobs, an index
+maps each URL to the blob it resolved to last time, together with the ETag
+and Last-Modified headers of that response. A cached URL is revalidated with
+If-None-Match/If-Modified-Since, so unchanged files are served from disk
+after a 304 answer. The cache is bounded in size, least recently used blobs
+are evicted first. Blobs used since the cache was opened by this process are
+never evicted, since a running action (or the prefetcher) may still read them.
+The index is shared by concurrent dotfiles processes: the changes of this
+process are merged into the index on disk (under a df.locking.FileLock)
+whenever it is written.
+Downloads into the part file of a URL (kept to resume interrupted downloads)
+are serialized between threads and processes by a lock file next to it.
+Files are hashed while they are downloaded. If the expected digest of a
+file is known (e.g. pinned in a lockfile), a cached blob with that digest is
+used without asking the server at all.
+"""
+
+import hashlib
+import json
+import os
+import threading
+import time
+from pathlib import Path
+from typing import Any, Dict, Optional, Set
+
+import df
+import df.locking
+import df.paths
+
+# Maximum size of all cached blobs, can be changed with DF_ARTIFACT_CACHE_SIZE (in MiB)
+ARTIFACT_CACHE_MAX_BYTES = int(os.environ.get("DF_ARTIFACT_CACHE_SIZE", "1024")) * 1024 * 1024
+INDEX_VERSION = 1
+
+
+def hash_file(path: Path, chunk_size: int = df.DOWNLOAD_CHUNK_SIZE) -> str:
+    """Returns the sha256 hex digest of the given file"""
+    sha256 = hashlib.sha256()
+    with path.open("rb") as f:
+        while chunk := f.read(chunk_size):
+            sha256.update(chunk)
+    return sha256.hexdigest()
+
+
+class ArtifactCache:
+    """A size bounded, content addressed cache of downloaded files"""
+
+    def __init__(self, root: Path, max_bytes: int = ARTIFACT_CACHE_MAX_BYTES) -> None:
+        self.root = root
+        self.max_bytes = max_bytes
+        self.index_path = root / "index.json"
+        self.lock = threading.Lock()
+        self.url_locks: Dict[str, df.locking.FileLock] = {}
+        self.index = self._load_index()
+        # Entries changed by this process, merged into the index on disk by _save_index
+        self.changed_urls: Set[str] = set()
+        self.changed_blobs: Set[str] = set()
+        self.opened_at = time.time()
+
+    def _load_index(self) -> Dict[str, Any]:
+        try:
+            with self.index_path.open("r") as f:
+                index = json.load(f)
+            if index.get("version") == INDEX_VERSION:
+                return dict(index)
+        except (OSError, ValueError):
+            pass
+        return {"version": INDEX_VERSION, "urls": {}, "blobs": {}}
+
+    def _save_index(self) -> None:
+        """Merge the changes of this process into the index on disk (keeping
+        the entries of other processes), evict blobs if the cache grew too
+        large and atomically write the index
+        Must be called with self.lock held
+        """
+        df.paths.ensure_dir(self.root)
+        with df.locking.FileLock(str(self.root / "index.lock")):
+            index = self._load_index()
+            for url in self.changed_urls:
+                index["urls"][url] = self.index["urls"][url]
+            for sha256 in self.changed_blobs:
+                blob, other = self.index["blobs"][sha256], index["blobs"].get(sha256)
+                if other is None or blob.get("last_used", 0) >= other.get("last_used", 0):
+                    index["blobs"][sha256] = blob
+            self.index = index
+            self.changed_urls.clear()
+            self.changed_blobs.clear()
+            self._evict()
+            tmp_path = self.index_path.with_name(f"index.json.{os.getpid()}.{threading.get_ident()}.tmp")
+            with tmp_path.open("w") as f:
+                json.dump(self.index, f, indent=4)
+            os.replace(tmp_path, self.index_path)
+
+    def _set_url(self, url: str, sha256: str, etag: Optional[str] = None, last_modified: Optional[str] = None) -> None:
+        """Record that url resolved to the blob sha256, must be called with self.lock held"""
+        self.index["urls"][url] = {"sha256": sha256, "etag": etag, "last_modified": last_modified}
+        self.changed_urls.add(url)
+
+    def blob_path(self, sha256: str) -> Path:
+        """Returns the path of the blob with the given sha256"""
+        return self.root / "blobs" / sha256[:2] / sha256
+
+    def _part_path(self, url: str) -> Path:
+        # Stable per url, so interrupted downloads can be resumed by a later run
+        return self.root / "partial" / (hashlib.sha256(url.encode()).hexdigest() + ".part")
+
+    def _url_lock(self, url: str) -> df.locking.FileLock:
+        """Returns the lock held while fetching url, shared by all threads and
+        dotfiles processes, since they download into the same part file
+        """
+        with self.lock:
+            if url not in self.url_locks:
+                part_path = self._part_path(url)
+                df.paths.ensure_dir(part_path.parent)
+                self.url_locks[url] = df.locking.FileLock(str(part_path.with_suffix(".lock")))
+            return self.url_locks[url]
+
+    def lookup(self, url: str) -> Optional[Path]:
+        """Returns the cached file for url (without revalidating it), or None"""
+        with self.lock:
+            entry = self.index["urls"].get(url)
+        if entry is None:
+            return None
+        path = self.blob_path(entry["sha256"])
+        return path if path.exists() else None
+
+    def fetch(
+        self,
+        url: str,
+        progress: Optional[df.ProgressCallback] = None,
+        chunk_size: int = df.DOWNLOAD_CHUNK_SIZE,
+        retries: int = df.DOWNLOAD_RETRIES,
+        on_chunk: Optional[df.ChunkCallback] = None,
+        sha256: Optional[str] = None,
+    ) -> Path:
+        """Returns the path of a cached, up to date copy of url
+        The file is revalidated if it is cached, otherwise downloaded.
+        If given, on_chunk is called with every downloaded chunk (not if the
+        cached file is still up to date).
+        If sha256 is given, a cached blob with this digest is returned
+        directly, a downloaded file with another digest raises
+        df.ChecksumMismatchError (and is not cached).
+        The returned path must not be modified.
+        """
+        if sha256 is not None:
+            sha256 = sha256.lower()
+            if self.blob_path(sha256).exists():
+                return self._use_blob(url, sha256)
+        with self._url_lock(url):
+            # Another process may have fetched url while waiting for the lock
+            if sha256 is not None and self.blob_path(sha256).exists():
+                return self._use_blob(url, sha256)
+            with self.lock:
+                entry = self._load_index()["urls"].get(url) or self.index["urls"].get(url)
+            headers = {}
+            if entry is not None and self.blob_path(entry["sha256"]).exists():
+                if entry.get("etag"):
+                    headers["If-None-Match"] = entry["etag"]
+                if entry.get("last_modified"):
+                    headers["If-Modified-Since"] = entry["last_modified"]
+
+            part_path = self._part_path(url)
+            if not headers:
+                # Nothing to revalidate, start (or resume) a normal download
+                entry = None
+            hasher = df.StreamingHash(part_path)
+            response_headers = df.download_resumable(
+                url, part_path, progress, chunk_size, retries, headers, df.chain_chunk_callbacks(hasher.update, on_chunk)
+            )
+            if response_headers is None and entry is not None:
+                # 304 Not Modified, the cached blob is up to date
+                verify_blob(url, self.blob_path(entry["sha256"]), sha256)
+                with self.lock:
+                    self._touch(entry["sha256"])
+                    self._save_index()
+                return self.blob_path(entry["sha256"])
+            if response_headers is None:
+                raise ValueError(f"Unexpected 304 response for {url}")
+
+            df.verify_digest(url, part_path, hasher, sha256)
+            sha256 = hasher.hexdigest()
+            blob_path = self.blob_path(sha256)
+            size = part_path.stat().st_size
+            if blob_path.exists():
+                # Same content as another url (or a previous version)
+                part_path.unlink()
+            else:
+                df.paths.ensure_dir(blob_path.parent)
+                os.replace(part_path, blob_path)
+            with self.lock:
+                self._set_url(url, sha256, response_headers.get("ETag"), response_headers.get("Last-Modified"))
+                self.index["blobs"][sha256] = {"size": size, "last_used": time.time()}
+                self.changed_blobs.add(sha256)
+                self._save_index()
+            return blob_path
+
+    def _use_blob(self, url: str, sha256: str) -> Path:
+        """Returns the cached blob sha256 for url, without asking the server"""
+        with self.lock:
+            self._touch(sha256)
+            if url not in self.index["urls"]:
+                self._set_url(url, sha256)
+            self._save_index()
+        return self.blob_path(sha256)
+
+    def _touch(self, sha256: str) -> None:
+        blob = self.index["blobs"].setdefault(sha256, {"size": self.blob_path(sha256).stat().st_size})
+        blob["last_used"] = time.time()
+        self.changed_blobs.add(sha256)
+
+    def _evict(self) -> None:
+        """Remove the least recently used blobs until the cache fits into
+        max_bytes, blobs used since this process opened the cache are kept
+        (even if the cache stays too large)
+        Must be called with self.lock and the index lock held
+        """
+        blobs = self.index["blobs"]
+        total = sum(blob["size"] for blob in blobs.values())
+        for sha256, blob in sorted(blobs.items(), key=lambda item: item[1].get("last_used", 0)):
+            if total <= self.max_bytes:
+                break
+            if blob.get("last_used", 0) >= self.opened_at:
+                continue
+            self.blob_path(sha256).unlink(missing_ok=True)
+            del blobs[sha256]
+            total -= blob["size"]
+        self.index["urls"] = {url: entry for url, entry in self.index["urls"].items() if entry["sha256"] in blobs}
+
+
+def verify_blob(url: str, blob_path: Path, sha256: Optional[str]) -> None:
+    """Raise df.ChecksumMismatchError if the cached blob_path (named by its
+    digest) is not the expected sha256 (if given)
+    """
+    if sha256 is not None and blob_path.name != sha256.lower():
+        raise df.ChecksumMismatchError(url, sha256, blob_path.name)
+
+
+_artifact_cache: Optional[ArtifactCache] = None
+_artifact_cache_lock = threading.Lock()
+
+
+def artifact_cache() -> ArtifactCache:
+    """Returns the artifact cache of this user (~/.cache/df/artifacts)"""
+    global _artifact_cache
+    with _artifact_cache_lock:
+        if _artifact_cache is None:
+            _artifact_cache = ArtifactCache(df.paths.cache_dir("artifacts"))
+        return _artifact_cache
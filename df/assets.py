@@ -0,0 +1,175 @@
+"""
+Installer for single binaries published as GitHub release assets
+
+A module declares a BinaryRelease with the repository, the name pattern of
+the asset for every supported host and the name of the binary in it:
+
+    RELEASE = df.assets.BinaryRelease(
+        "ajeetdsouza/zoxide",
+        "zoxide",
+        {
+            "linux": "zoxide-{version}-{arch}-unknown-linux-musl.tar.gz",
+            "windows-x86_64": "zoxide-{version}-x86_64-pc-windows-msvc.zip",
+        },
+    )
+
+Patterns are looked up by "<os>-<arch>-<libc>", "<os>-<arch>" and "<os>"
+(see df.host for the names), the first one found is used. They may contain
+{tag}, {version} (the tag without a leading "v"), {os}, {arch} and {libc} and are
+matched (as glob patterns, ignoring case) against the assets of the release
+from df.releases.release_assets(), so resolving a release needs no network
+access once the latest tag and the asset list are cached. Only the binary
+is extracted from the downloaded archive (see df.extract), after the
+archive was verified against the checksum published upstream.
+"""
+
+import fnmatch
+from pathlib import Path
+from typing import Dict, List, Optional, Union
+
+import df.extract
+import df.fingerprint
+import df.host
+import df.lockfile
+import df.releases
+from df.config import ModuleConfig
+
+BIN_DIR = Path.home() / ".local" / "bin"
+
+
+class AssetNotFoundError(Exception):
+    """Raised when a release has no asset for this host"""
+
+
+class ReleaseAsset:
+    """An asset of a release, chosen for this host"""
+
+    def __init__(self, name: str, url: str, tag: str, repo: str, sha256: Optional[str] = None) -> None:
+        self.name = name
+        self.url = url
+        self.tag = tag
+        self.repo = repo
+        self.locked_sha256 = sha256
+
+    def sha256(self) -> Optional[str]:
+        """Returns the locked sha256, or the one published upstream (None if there is none)"""
+        if self.locked_sha256 is not None:
+            return self.locked_sha256
+        return df.releases.asset_digest(self.repo, self.tag, self.name)
+
+
+class BinaryRelease:
+    """
+    A binary installed from the GitHub releases of repo
+    binary: name of the executable in the archive (without .exe) and of the
+        installed file in BIN_DIR
+    assets: asset name patterns by host, see the module docstring
+    arch_names: names used by the project for the normalized architectures,
+        e.g. {"aarch64": "arm64"}
+    strip_v: save the version without the leading "v" of the tag
+    """
+
+    def __init__(
+        self,
+        repo: str,
+        binary: str,
+        assets: Dict[str, str],
+        arch_names: Optional[Dict[str, str]] = None,
+        strip_v: bool = False,
+    ) -> None:
+        self.repo = repo
+        self.binary = binary
+        self.assets = assets
+        self.arch_names = arch_names or {}
+        self.strip_v = strip_v
+
+    def pattern(self) -> Optional[str]:
+        """Returns the asset name pattern for this host, or None if it is not supported"""
+        host = df.host.facts()
+        for key in (f"{host.os}-{host.arch}-{host.libc}", f"{host.os}-{host.arch}", host.os):
+            if key in self.assets:
+                return self.assets[key]
+        return None
+
+    def is_compatible(self) -> Union[bool, str]:
+        if self.pattern() is None:
+            host = df.host.facts()
+            return f"No release of {self.binary} for {host.system} {host.arch}"
+        return True
+
+    def latest_tag(self) -> str:
+        return df.releases.latest_tag(self.repo)
+
+    def version(self, tag: str) -> str:
+        """Returns the version saved in the config for tag"""
+        return tag[1:] if self.strip_v and tag.startswith("v") else tag
+
+    def resolve(self, tag: Optional[str] = None) -> ReleaseAsset:
+        """Returns the asset of release tag (default: the latest) for this host
+        If a lockfile is used, the locked asset is returned without any lookup.
+        """
+        pattern = self.pattern()
+        if pattern is None:
+            raise AssetNotFoundError(str(self.is_compatible()))
+        if tag is None:
+            tag = self.latest_tag()
+        locked = df.lockfile.locked_asset(self.repo, tag)
+        if locked is not None:
+            return ReleaseAsset(locked["name"], locked["url"], tag, self.repo, locked["sha256"])
+        host = df.host.facts()
+        name_pattern = pattern.format(
+            tag=tag,
+            version=tag[1:] if tag.startswith("v") else tag,
+            os=host.os,
+            arch=self.arch_names.get(host.arch, host.arch),
+            libc=host.libc or "",
+        ).lower()
+        # The cached asset list may be incomplete, if nothing matches it is fetched again
+        for refresh in (False, True):
+            assets = df.releases.release_assets(self.repo, tag, refresh)
+            for name, asset in sorted(assets.items()):
+                if fnmatch.fnmatchcase(name.lower(), name_pattern):
+                    return ReleaseAsset(name, str(asset["url"]), tag, self.repo)
+        raise AssetNotFoundError(f"{self.repo} {tag} has no asset matching {name_pattern}")
+
+    def download_urls(self) -> List[str]:
+        return [self.resolve().url]
+
+    def executable_name(self) -> str:
+        return f"{self.binary}.exe" if df.host.facts().os == "windows" else self.binary
+
+    def installed_path(self) -> Path:
+        return BIN_DIR / self.executable_name()
+
+    def install(self, config: Optional[ModuleConfig] = None, tag: Optional[str] = None, sha256: Optional[str] = None) -> Path:
+        """
+        Download the release (default: the latest) and install its binary into
+        BIN_DIR, the version is saved as "version" in config if given.
+        The download is verified against sha256 if given, otherwise against
+        the checksum published upstream (if any).
+        Returns the path of the installed binary.
+        """
+        asset = self.resolve(tag)
+        target = self.installed_path()
+        if sha256 is None:
+            sha256 = asset.sha256()
+        if sha256 is None:
+            print(f"Downloading {asset.name} (no checksum published, not verified)...")
+        else:
+            print(f"Downloading {asset.name}...")
+        # Only the binary is extracted, it replaces the old one atomically (it may still be running)
+        df.extract.download_and_extract(asset.url, {self.executable_name(): target}, sha256=sha256)
+        target.chmod(0o755)
+        df.fingerprint.record(target)
+        if config is not None:
+            config.set("version", self.version(asset.tag))
+        return target
+
+    def uninstall(self) -> None:
+        self.installed_path().unlink(missing_ok=True)
+
+    def has_update(self, config: ModuleConfig) -> Union[bool, str]:
+        latest_version = self.version(self.latest_tag())
+        if str(config.get("version", "")) != latest_version:
+            return latest_version
+        return False
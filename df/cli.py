@@ -5,15 +5,31 @@ Designed for automated installs in devcontainers and headless environments.
 """
 
 import argparse
+import concurrent.futures
 import io
+import os
+import shutil
+import subprocess
 import sys
+import threading
+import time
 import traceback
 from pathlib import Path
-from typing import List
+from typing import Any, Callable, ContextManager, Dict, List, Optional, Tuple
 
 import df
 import df.config
-import df.ui
+import df.fingerprint
+import df.host
+import df.lockfile
+import df.metrics
+import df.paths
+import df.plan
+import df.prefetch
+import df.releases
+import df.scheduler
+import df.timeouts
+import df.trace
 from df.modules import MODULES
 
 
@@ -23,6 +39,7 @@ class CLIOutput:
     def __init__(self, verbose: bool = False, quiet: bool = False):
         self.verbose = verbose
         self.quiet = quiet
+        self.print_lock = threading.Lock()
 
     def info(self, message: str) -> None:
         """Print info message unless quiet mode"""
@@ -43,6 +60,19 @@ class CLIOutput:
         if not self.quiet:
             print(f"[WARN] {message}")
 
+    def module_printer(self, module_id: str) -> Callable[..., None]:
+        """Returns a print function for a module, that prefixes each line with
+        the module id, used when multiple modules run in parallel
+        """
+
+        def module_print(*args: Any, sep: str = " ", end: str = "\n", **kwargs: Any) -> None:
+            text = sep.join(map(str, args)) + end
+            lines = [f"[{module_id}] {line}" for line in text.splitlines()]
+            with self.print_lock:
+                print("\n".join(lines), **kwargs)
+
+        return module_print
+
 
 def resolve_dependencies(module_ids: List[str], output: CLIOutput) -> List[str]:
     """
@@ -124,7 +154,7 @@ def check_compatibility(module_ids: List[str], output: CLIOutput) -> bool:
 
     for module_id in module_ids:
         module = MODULES[module_id]
-        compatibility = module.is_compatible()
+        compatibility = df.host.is_compatible(module)
 
         if compatibility is not True:
             reason = compatibility if isinstance(compatibility, str) else "Unknown reason"
@@ -134,9 +164,22 @@ def check_compatibility(module_ids: List[str], output: CLIOutput) -> bool:
     return not incompatible_found
 
 
-def install_module(module_id: str, config: df.config.Config, output: CLIOutput, force: bool = False) -> bool:
+def locked_module(module_id: str, config: df.config.Config, output: CLIOutput) -> ContextManager[df.config.ModuleConfig]:
+    """
+    Lock a module for an action, so no other dotfiles process can run an
+    action on it at the same time. Yields the config of the module.
+    """
+    return config.locked_module(
+        module_id,
+        lambda: output.info(f"Waiting for module '{module_id}' to be unlocked (by another process or a background check)..."),
+    )
+
+
+def install_module(module_id: str, config: df.config.Config, output: CLIOutput, force: bool = False, rerun: bool = False) -> bool:
     """
     Install a single module.
+    Forced reinstalls are skipped if the inputs of the module did not change
+    since it was installed (see df.fingerprint), unless rerun is set.
     Returns True on success, False on failure.
     """
     if module_id not in MODULES:
@@ -144,38 +187,41 @@ def install_module(module_id: str, config: df.config.Config, output: CLIOutput,
         return False
 
     module = MODULES[module_id]
-    module_config = config.get_module(module_id)
-
-    # Check if already installed
-    if module_config.get_installed() and not force:
-        output.verbose_info(f"Module '{module_id}' is already installed (use --force to reinstall)")
-        return True
+    with locked_module(module_id, config, output) as module_config:
+        # Check if already installed
+        if module_config.get_installed() and not force:
+            output.verbose_info(f"Module '{module_id}' is already installed (use --force to reinstall)")
+            return True
+        if module_config.get_installed() and not rerun and df.fingerprint.unchanged(module, module_config):
+            output.verbose_info(f"Module '{module_id}' is unchanged since it was installed (use --rerun to reinstall)")
+            return True
 
-    try:
-        output.info(f"Installing module '{module_id}' ({module.NAME})...")
+        try:
+            output.info(f"Installing module '{module_id}' ({module.NAME})...")
 
-        # Create a string buffer to capture module output
-        stdout_buffer = io.StringIO()
+            # Create a string buffer to capture module output
+            stdout_buffer = io.StringIO()
 
-        # Install the module
-        module.install(module_config, stdout_buffer)
+            # Install the module
+            with df.metrics.Phase("install", module_id), df.fingerprint.recording(module, module_config):
+                module.install(module_config, stdout_buffer)
 
-        # Mark as installed
-        module_config.set_installed(True)
+            # Mark as installed
+            module_config.set_installed(True)
 
-        # Show module output if verbose
-        module_output = stdout_buffer.getvalue().strip()
-        if module_output:
-            output.verbose_info(f"Module output:\n{module_output}")
+            # Show module output if verbose
+            module_output = stdout_buffer.getvalue().strip()
+            if module_output:
+                output.verbose_info(f"Module output:\n{module_output}")
 
-        output.info(f"Successfully installed module '{module_id}'")
-        return True
+            output.info(f"Successfully installed module '{module_id}'")
+            return True
 
-    except Exception as e:
-        output.error(f"Failed to install module '{module_id}': {str(e)}")
-        if output.verbose:
-            output.error(traceback.format_exc())
-        return False
+        except Exception as e:
+            output.error(f"Failed to install module '{module_id}': {str(e)}")
+            if output.verbose:
+                output.error(traceback.format_exc())
+            return False
 
 
 def uninstall_module(module_id: str, config: df.config.Config, output: CLIOutput) -> bool:
@@ -188,41 +234,69 @@ def uninstall_module(module_id: str, config: df.config.Config, output: CLIOutput
         return False
 
     module = MODULES[module_id]
-    module_config = config.get_module(module_id)
+    with locked_module(module_id, config, output) as module_config:
+        # Check if installed
+        if not module_config.get_installed():
+            output.verbose_info(f"Module '{module_id}' is not installed")
+            return True
 
-    # Check if installed
-    if not module_config.get_installed():
-        output.verbose_info(f"Module '{module_id}' is not installed")
-        return True
+        try:
+            output.info(f"Uninstalling module '{module_id}' ({module.NAME})...")
 
-    try:
-        output.info(f"Uninstalling module '{module_id}' ({module.NAME})...")
+            # Create a string buffer to capture module output
+            stdout_buffer = io.StringIO()
 
-        # Create a string buffer to capture module output
-        stdout_buffer = io.StringIO()
+            # Uninstall the module
+            with df.metrics.Phase("uninstall", module_id):
+                module.uninstall(module_config, stdout_buffer)
+            df.fingerprint.clear(module_config)
 
-        # Uninstall the module
-        module.uninstall(module_config, stdout_buffer)
+            # Mark as not installed
+            module_config.set_installed(False)
 
-        # Mark as not installed
-        module_config.set_installed(False)
+            # Show module output if verbose
+            module_output = stdout_buffer.getvalue().strip()
+            if module_output:
+                output.verbose_info(f"Module output:\n{module_output}")
 
-        # Show module output if verbose
-        module_output = stdout_buffer.getvalue().strip()
-        if module_output:
-            output.verbose_info(f"Module output:\n{module_output}")
+            output.info(f"Successfully uninstalled module '{module_id}'")
+            return True
 
-        output.info(f"Successfully uninstalled module '{module_id}'")
-        return True
+        except Exception as e:
+            output.error(f"Failed to uninstall module '{module_id}': {str(e)}")
+            if output.verbose:
+                output.error(traceback.format_exc())
+            return False
 
-    except Exception as e:
-        output.error(f"Failed to uninstall module '{module_id}': {str(e)}")
-        if output.verbose:
-            output.error(traceback.format_exc())
-        return False
 
+class UpdateChecks:
+    """
+    Results of has_update of the modules of a run, so the prefetcher and
+    update_module do not both ask upstream. A result is only reused while
+    the config entry of its module did not change.
+    """
 
-def update_module(module_id: str, config: df.config.Config, output: CLIOutput) -> bool:
+    def __init__(self) -> None:
+        self.results: Dict[str, Tuple[str, Any]] = {}
+        self.lock = threading.Lock()
+
+    def has_update(self, module: Any, module_config: df.config.ModuleConfig) -> Any:
+        """Returns module.has_update(module_config), must be called with the module locked"""
+        snapshot = module_config.snapshot()
+        with self.lock:
+            cached = self.results.get(module.ID)
+        if cached is not None and cached[0] == snapshot:
+            return cached[1]
+        with df.metrics.Phase("has_update", module.ID):
+            update_info = module.has_update(module_config)
+        with self.lock:
+            self.results[module.ID] = (snapshot, update_info)
+        return update_info
+
+
+def update_module(
+    module_id: str, config: df.config.Config, output: CLIOutput, update_checks: Optional[UpdateChecks] = None
+) -> bool:
     """
     Update a single module.
     Returns True on success, False on failure.
@@ -232,47 +306,89 @@ def update_module(module_id: str, config: df.config.Config, output: CLIOutput) -
         return False
 
     module = MODULES[module_id]
-    module_config = config.get_module(module_id)
+    with locked_module(module_id, config, output) as module_config:
+        # Check if installed
+        if not module_config.get_installed():
+            output.warning(f"Module '{module_id}' is not installed, cannot update")
+            return False
+
+        # Check if module supports updates
+        if not hasattr(module, "has_update") or not hasattr(module, "update"):
+            output.verbose_info(f"Module '{module_id}' does not support updates")
+            return True
 
-    # Check if installed
-    if not module_config.get_installed():
-        output.warning(f"Module '{module_id}' is not installed, cannot update")
-        return False
+        try:
+            # Check if update is needed (unless the prefetcher already did)
+            update_info = (update_checks or UpdateChecks()).has_update(module, module_config)
+            if not update_info:
+                output.verbose_info(f"Module '{module_id}' is already up to date")
+                return True
 
-    # Check if module supports updates
-    if not hasattr(module, "has_update") or not hasattr(module, "update"):
-        output.verbose_info(f"Module '{module_id}' does not support updates")
-        return True
+            # Only modules with a GITHUB_REPO have their upstream in the fingerprint
+            if hasattr(module, "GITHUB_REPO") and df.fingerprint.unchanged(module, module_config):
+                output.verbose_info(f"Module '{module_id}' is unchanged since it was installed")
+                return True
 
-    try:
-        # Check if update is needed
-        update_info = module.has_update(module_config)
-        if not update_info:
-            output.verbose_info(f"Module '{module_id}' is already up to date")
-            return True
+            update_version = update_info if isinstance(update_info, str) else "latest"
+            output.info(f"Updating module '{module_id}' to {update_version}...")
 
-        update_version = update_info if isinstance(update_info, str) else "latest"
-        output.info(f"Updating module '{module_id}' to {update_version}...")
+            # Create a string buffer to capture module output
+            stdout_buffer = io.StringIO()
 
-        # Create a string buffer to capture module output
-        stdout_buffer = io.StringIO()
+            # Update the module
+            with df.metrics.Phase("update", module_id), df.fingerprint.recording(module, module_config):
+                module.update(module_config, stdout_buffer)
 
-        # Update the module
-        module.update(module_config, stdout_buffer)
+            # Show module output if verbose
+            module_output = stdout_buffer.getvalue().strip()
+            if module_output:
+                output.verbose_info(f"Module output:\n{module_output}")
 
-        # Show module output if verbose
-        module_output = stdout_buffer.getvalue().strip()
-        if module_output:
-            output.verbose_info(f"Module output:\n{module_output}")
+            output.info(f"Successfully updated module '{module_id}'")
+            return True
 
-        output.info(f"Successfully updated module '{module_id}'")
-        return True
+        except Exception as e:
+            output.error(f"Failed to update module '{module_id}': {str(e)}")
+            if output.verbose:
+                output.error(traceback.format_exc())
+            return False
+
+
+def run_module_actions(
+    module_ids: List[str],
+    action: Callable[[str], bool],
+    jobs: int,
+    continue_on_error: bool,
+    output: CLIOutput,
+    timeout: Optional[float] = None,
+) -> Dict[str, str]:
+    """Run action for the given modules with up to jobs in parallel
+    A module is only started after all of its dependencies (in module_ids)
+    succeeded, each has timeout seconds to finish (see df.timeouts).
+    Returns the df.scheduler state of every module.
+    """
 
-    except Exception as e:
-        output.error(f"Failed to update module '{module_id}': {str(e)}")
-        if output.verbose:
-            output.error(traceback.format_exc())
-        return False
+    def dependencies(module_id: str) -> List[str]:
+        return list(MODULES[module_id].DEPENDENCIES) if module_id in MODULES else []
+
+    if jobs <= 1:
+        return df.scheduler.run_graph(module_ids, dependencies, action, 1, continue_on_error, timeout=timeout)
+
+    def run_prefixed(module_id: str) -> bool:
+        if module_id not in MODULES:
+            return action(module_id)
+        # Prefix the output of modules, so parallel output stays readable
+        module = MODULES[module_id]
+        module.print = output.module_printer(module_id)
+        try:
+            return action(module_id)
+        finally:
+            try:
+                del module.print
+            except AttributeError:
+                pass
+
+    return df.scheduler.run_graph(module_ids, dependencies, run_prefixed, jobs, continue_on_error, timeout=timeout)
 
 
 def list_modules(config: df.config.Config, output: CLIOutput, show_all: bool = True) -> None:
@@ -286,6 +402,10 @@ def list_modules(config: df.config.Config, output: CLIOutput, show_all: bool = T
                 print(module_id)
         return
 
+    # Resolve the upstream versions of all installed modules in one pass
+    installed_modules = [MODULES[id] for id in MODULES if config.get_module(id).get_installed()]
+    df.releases.resolve_modules(installed_modules)
+
     print("Available modules:")
     print("-" * 60)
 
@@ -319,6 +439,13 @@ def list_modules(config: df.config.Config, output: CLIOutput, show_all: bool = T
             print()
 
 
+def print_plan(plan: df.plan.Plan) -> int:
+    """Print the plan of a run (--plan), instead of running it"""
+    plan.collect()
+    print("\n".join(plan.format()))
+    return 0
+
+
 def cmd_install(args: argparse.Namespace, config: df.config.Config, output: CLIOutput) -> int:
     """Handle the install command"""
 
@@ -353,19 +480,44 @@ def cmd_install(args: argparse.Namespace, config: df.config.Config, output: CLIO
         else:
             output.warning("Forcing installation despite conflicts")
 
-    # Install modules
-    failed_modules = []
-    for module_id in resolved_modules:
-        if not install_module(module_id, config, output, args.force):
-            failed_modules.append(module_id)
-            if not args.continue_on_error:
-                break
+    if args.plan:
+        return print_plan(df.plan.plan_install(resolved_modules, config, args.force, args.rerun, args.jobs))
+
+    def will_install(module: Any) -> bool:
+        module_config = config.get_module(module.ID)
+        if not module_config.get_installed():
+            return True
+        return args.force and (args.rerun or not df.fingerprint.unchanged(module, module_config))
+
+    # Download the files of all modules in the background, while installing
+    prefetcher = df.prefetch.start((MODULES[id] for id in resolved_modules if id in MODULES), will_install)
+
+    # Install modules, independent modules run in parallel with --jobs
+    try:
+        states = run_module_actions(
+            resolved_modules,
+            lambda module_id: install_module(module_id, config, output, args.force, args.rerun),
+            args.jobs,
+            args.continue_on_error,
+            output,
+            args.timeout,
+        )
+    finally:
+        prefetcher.shutdown()
+    failed_modules = [id for id, state in states.items() if state == df.scheduler.FAILED]
+    timed_out_modules = [id for id, state in states.items() if state == df.scheduler.TIMEOUT]
+    skipped_modules = [id for id, state in states.items() if state == df.scheduler.SKIPPED]
 
     # Save configuration
     config.save()
 
+    if skipped_modules:
+        output.error(f"Skipped modules because a dependency failed: {', '.join(skipped_modules)}")
+    if timed_out_modules:
+        output.error(f"Timed out installing modules: {', '.join(timed_out_modules)}")
     if failed_modules:
         output.error(f"Failed to install modules: {', '.join(failed_modules)}")
+    if failed_modules or timed_out_modules:
         return 1
 
     output.info(f"Successfully installed {len(resolved_modules)} module(s)")
@@ -379,19 +531,29 @@ def cmd_uninstall(args: argparse.Namespace, config: df.config.Config, output: CL
         output.error("No modules specified for uninstall")
         return 1
 
-    # Uninstall modules
-    failed_modules = []
+    if args.plan:
+        return print_plan(df.plan.plan_uninstall(args.modules, config))
+
+    # Uninstall modules, each within its own deadline
+    failed_modules: List[str] = []
+    timed_out_modules: List[str] = []
     for module_id in args.modules:
-        if not uninstall_module(module_id, config, output):
-            failed_modules.append(module_id)
+        deadline = df.timeouts.ActionDeadline(module_id, args.timeout)
+        with df.timeouts.running(deadline):
+            success = uninstall_module(module_id, config, output)
+        if not success:
+            (timed_out_modules if deadline.timed_out else failed_modules).append(module_id)
             if not args.continue_on_error:
                 break
 
     # Save configuration
     config.save()
 
+    if timed_out_modules:
+        output.error(f"Timed out uninstalling modules: {', '.join(timed_out_modules)}")
     if failed_modules:
         output.error(f"Failed to uninstall modules: {', '.join(failed_modules)}")
+    if failed_modules or timed_out_modules:
         return 1
 
     output.info(f"Successfully uninstalled {len(args.modules)} module(s)")
@@ -402,6 +564,10 @@ def cmd_update(args: argparse.Namespace, config: df.config.Config, output: CLIOu
     """Handle the update command"""
 
     modules_to_update = args.modules if args.modules else []
+    unknown = [id for id in modules_to_update if id not in MODULES]
+    if unknown:
+        output.error(f"Unknown modules: {', '.join(unknown)}")
+        return 1
 
     # If no modules specified, update all installed modules
     if not modules_to_update:
@@ -414,29 +580,160 @@ def cmd_update(args: argparse.Namespace, config: df.config.Config, output: CLIOu
         output.info("No modules to update")
         return 0
 
-    # Update modules
-    failed_modules = []
-    updated_count = 0
+    # Resolve the upstream versions of all modules in one pass
+    df.releases.resolve_modules(MODULES[id] for id in modules_to_update if id in MODULES)
 
-    for module_id in modules_to_update:
-        if update_module(module_id, config, output):
-            updated_count += 1
-        else:
-            failed_modules.append(module_id)
-            if not args.continue_on_error:
-                break
+    if args.plan:
+        return print_plan(df.plan.plan_update(modules_to_update, config, args.jobs))
+
+    update_checks = UpdateChecks()
+
+    def will_update(module: Any) -> bool:
+        if not hasattr(module, "has_update"):
+            return False
+        with config.locked_module(module.ID) as module_config:
+            return module_config.get_installed() and bool(update_checks.has_update(module, module_config))
+
+    # Download the files of all updatable modules in the background
+    prefetcher = df.prefetch.start((MODULES[id] for id in modules_to_update if id in MODULES), will_update)
+
+    # Update modules, independent modules run in parallel with --jobs
+    try:
+        states = run_module_actions(
+            modules_to_update,
+            lambda module_id: update_module(module_id, config, output, update_checks),
+            args.jobs,
+            args.continue_on_error,
+            output,
+            args.timeout,
+        )
+    finally:
+        prefetcher.shutdown()
+    failed_modules = [id for id, state in states.items() if state == df.scheduler.FAILED]
+    timed_out_modules = [id for id, state in states.items() if state == df.scheduler.TIMEOUT]
+    skipped_modules = [id for id, state in states.items() if state == df.scheduler.SKIPPED]
 
     # Save configuration
     config.save()
 
+    if skipped_modules:
+        output.error(f"Skipped modules because a dependency failed: {', '.join(skipped_modules)}")
+    if timed_out_modules:
+        output.error(f"Timed out updating modules: {', '.join(timed_out_modules)}")
     if failed_modules:
         output.error(f"Failed to update modules: {', '.join(failed_modules)}")
+    if failed_modules or timed_out_modules:
         return 1
 
     output.info(f"Successfully processed {len(modules_to_update)} module(s)")
     return 0
 
 
+def cmd_wheelhouse(args: argparse.Namespace, config: df.config.Config, output: CLIOutput) -> int:
+    """Handle the wheelhouse command"""
+    requirements = os.path.join(df.DOTFILES_DIR, "requirements.txt")
+    wheelhouse = df.paths.wheelhouse_dir(df.DOTFILES_DIR)
+    # The wheelhouse is a symlink to a versioned directory. The new version is
+    # built next to it and the link is replaced atomically at the end, so
+    # machines installing from it at the same time never see a partial or a
+    # missing wheelhouse. The previous version is kept for installs that are
+    # still reading it.
+    version = wheelhouse.with_name(f"{wheelhouse.name}.{int(time.time())}.{os.getpid()}")
+    output.info(f"Downloading wheels for {requirements} into {wheelhouse}...")
+    # The venv has pip, the system interpreter (used to run in process) may not
+    python = df.paths.venv_python(df.DOTFILES_DIR)
+    if not python.exists():
+        python = Path(sys.executable)
+    pip_args = [str(python), "-m", "pip", "wheel", "--wheel-dir", str(version), "-r", requirements]
+    if output.quiet:
+        pip_args.append("--quiet")
+    try:
+        subprocess.run(pip_args, check=True)
+    except subprocess.CalledProcessError:
+        shutil.rmtree(version, ignore_errors=True)
+        output.error("Failed to download the wheels")
+        return 1
+    if os.name == "nt":
+        # No symlinks on Windows (without developer mode): swap the directories,
+        # there is no wheelhouse for a moment (bootstraps then fall back to PyPI)
+        old = wheelhouse.with_name(f"{wheelhouse.name}.{os.getpid()}.old")
+        if wheelhouse.exists():
+            os.replace(wheelhouse, old)
+        os.replace(version, wheelhouse)
+        shutil.rmtree(old, ignore_errors=True)
+    else:
+        previous = wheelhouse.with_name(os.readlink(wheelhouse)) if wheelhouse.is_symlink() else None
+        if wheelhouse.exists() and previous is None:
+            # A plain directory (built by an older version), moved aside once
+            previous = wheelhouse.with_name(f"{wheelhouse.name}.0.{os.getpid()}")
+            os.replace(wheelhouse, previous)
+        link = wheelhouse.with_name(f"{wheelhouse.name}.{os.getpid()}.link")
+        link.unlink(missing_ok=True)
+        link.symlink_to(version.name)
+        os.replace(link, wheelhouse)
+        # Remove the versions before the one that was just replaced (not newer
+        # ones, which may be built by another run right now)
+        if previous is not None:
+            for path in wheelhouse.parent.glob(f"{wheelhouse.name}.*.*"):
+                if path.is_dir() and not path.is_symlink() and path.name < previous.name:
+                    shutil.rmtree(path, ignore_errors=True)
+    output.info(f"Wheelhouse ready with {len(list(wheelhouse.glob('*.whl')))} wheel(s)")
+    return 0
+
+
+def cmd_lock(args: argparse.Namespace, config: df.config.Config, output: CLIOutput) -> int:
+    """Handle the lock command"""
+    path = df.lockfile.default_path()
+    try:
+        lockfile = df.lockfile.Lockfile.load(path, missing_ok=True)
+    except df.lockfile.LockfileError as e:
+        output.error(str(e))
+        return 1
+    module_ids = args.modules or list(MODULES)
+    unknown = [id for id in module_ids if id not in MODULES]
+    if unknown:
+        output.error(f"Unknown modules: {', '.join(unknown)}")
+        return 1
+
+    # Resolve the upstream versions of all modules in one pass
+    df.releases.resolve_modules(MODULES[id] for id in module_ids)
+
+    failed_modules = []
+    with concurrent.futures.ThreadPoolExecutor(max_workers=df.releases.RELEASE_MAX_WORKERS) as executor:
+        futures = {id: executor.submit(lockfile.lock_module, MODULES[id]) for id in module_ids}
+        for module_id, future in futures.items():
+            try:
+                entry = future.result()
+            except Exception as e:
+                output.error(f"Failed to lock module '{module_id}': {e}")
+                failed_modules.append(module_id)
+                continue
+            if entry:
+                output.verbose_info(f"Locked {module_id} {entry.get('tag', '')}".rstrip())
+    if not args.modules:
+        lockfile.prune(MODULES)
+    lockfile.save()
+    output.info(f"Wrote {path} ({len(lockfile.modules)} module(s) locked)")
+    return 1 if failed_modules else 0
+
+
+def cmd_stats(args: argparse.Namespace, config: df.config.Config, output: CLIOutput) -> int:
+    """Handle the stats command"""
+    stats = df.metrics.summarize(df.metrics.load(), args.modules, args.phase)
+    if not stats:
+        output.info(f"No recorded runs in {df.metrics.metrics_path()}")
+        return 0
+    width = max(len(s.module_id or "-") for s in stats)
+    print(f"{'MODULE':{width}}  {'PHASE':12} {'RUNS':>5} {'FAILED':>6} {'P50':>8} {'P95':>8} {'P50 SIZE':>10}")
+    for s in stats:
+        size = df.plan.format_size(df.metrics.percentile(s.bytes, 50)) if s.bytes else "-"
+        print(
+            f"{s.module_id or '-':{width}}  {s.phase:12} {len(s.seconds):>5} {s.failed:>6} "
+            f"{df.plan.format_duration(s.p50):>8} {df.plan.format_duration(s.p95):>8} {size:>10}"
+        )
+    return 0
+
+
 def cmd_list(args: argparse.Namespace, config: df.config.Config, output: CLIOutput) -> int:
     """Handle the list command"""
     list_modules(config, output, show_all=not args.installed)
@@ -470,10 +767,18 @@ def main_cli(dotfiles_dir: str, config_file: str, args: List[str]) -> int:
 Examples:
   dotfiles install git_config zsh_config    # Install specific modules
   dotfiles install --all                    # Install all compatible modules
+  dotfiles install --all --jobs 4           # Install up to 4 independent modules in parallel
+  dotfiles install --all --jobs 4 --plan    # Show the stages, download size and estimated duration
   dotfiles uninstall zsh_config             # Uninstall a module
   dotfiles update                           # Update all installed modules
+  dotfiles lock                             # Pin versions, URLs and digests in dotfiles.lock
+  dotfiles install --all --locked           # Install exactly what dotfiles.lock pins
+  dotfiles stats zoxide --phase download    # Show how long past downloads of zoxide took
   dotfiles list                             # List all modules
   dotfiles list --installed                # List only installed modules
+  dotfiles wheelhouse                       # Refresh the wheels used to create the venv offline
+  dotfiles --profile-startup list --quiet   # Show where the startup time is spent
+  dotfiles --trace run.json install --all -j 4  # Trace the run, open run.json in Perfetto
 
 For devcontainers, use:
   dotfiles install --quiet --force git_config nvim_config_lazyvim
@@ -488,6 +793,28 @@ For devcontainers, use:
         action="store_true",
         help="Continue processing other modules if one fails",
     )
+    parser.add_argument(
+        "--offline",
+        action="store_true",
+        help="Only use cached upstream release information (no version lookups)",
+    )
+    # Handled before df is imported, see df/profiling.py
+    parser.add_argument(
+        "--profile-startup",
+        action="store_true",
+        help="Print the time spent in imports and module loads at exit",
+    )
+    parser.add_argument(
+        "--profile-startup-trace",
+        metavar="FILE",
+        help="Like --profile-startup, but write a Chrome trace (speedscope compatible) to FILE",
+    )
+
+    parser.add_argument(
+        "--trace",
+        metavar="FILE",
+        help="Write a Chrome trace (Perfetto/speedscope) of the run to FILE, also DF_TRACE=FILE",
+    )
 
     # Subcommands
     subparsers = parser.add_subparsers(dest="command", help="Available commands")
@@ -506,19 +833,112 @@ For devcontainers, use:
         action="store_true",
         help="Force installation (ignore conflicts and compatibility)",
     )
+    install_parser.add_argument(
+        "--rerun",
+        action="store_true",
+        help="With --force, also reinstall modules which did not change since they were installed",
+    )
+    install_parser.add_argument(
+        "-j",
+        "--jobs",
+        type=int,
+        default=1,
+        help="Number of modules to install in parallel (dependencies are respected)",
+    )
+    install_parser.add_argument(
+        "--locked",
+        action="store_true",
+        help="Install the versions pinned in dotfiles.lock (no version lookups)",
+    )
+    install_parser.add_argument(
+        "--timeout",
+        type=float,
+        default=df.timeouts.ACTION_TIMEOUT,
+        metavar="SECONDS",
+        help="Seconds each module may take to install before it is cancelled (default: %(default)s, or $DF_ACTION_TIMEOUT)",
+    )
+    install_parser.add_argument(
+        "--plan",
+        action="store_true",
+        help=(
+            "Only show what would be installed, the download size and the estimated duration "
+            "(queries release metadata, downloads nothing)"
+        ),
+    )
 
     # Uninstall command
     uninstall_parser = subparsers.add_parser("uninstall", help="Uninstall modules")
     uninstall_parser.add_argument("modules", nargs="+", help="Module IDs to uninstall")
+    uninstall_parser.add_argument(
+        "--timeout",
+        type=float,
+        default=df.timeouts.ACTION_TIMEOUT,
+        metavar="SECONDS",
+        help="Seconds each module may take to uninstall before it is cancelled (default: %(default)s, or $DF_ACTION_TIMEOUT)",
+    )
+    uninstall_parser.add_argument(
+        "--plan",
+        action="store_true",
+        help="Only show what would be uninstalled and the estimated duration",
+    )
 
     # Update command
     update_parser = subparsers.add_parser("update", help="Update modules")
     update_parser.add_argument("modules", nargs="*", help="Module IDs to update (default: all installed)")
+    update_parser.add_argument(
+        "-j",
+        "--jobs",
+        type=int,
+        default=1,
+        help="Number of modules to update in parallel (dependencies are respected)",
+    )
+    update_parser.add_argument(
+        "--locked",
+        action="store_true",
+        help="Update to the versions pinned in dotfiles.lock (no version lookups)",
+    )
+    update_parser.add_argument(
+        "--timeout",
+        type=float,
+        default=df.timeouts.ACTION_TIMEOUT,
+        metavar="SECONDS",
+        help="Seconds each module may take to update before it is cancelled (default: %(default)s, or $DF_ACTION_TIMEOUT)",
+    )
+    update_parser.add_argument(
+        "--plan",
+        action="store_true",
+        help=(
+            "Only show what would be updated, the download size and the estimated duration "
+            "(queries release metadata, downloads nothing)"
+        ),
+    )
+
+    # Lock command
+    lock_parser = subparsers.add_parser(
+        "lock",
+        help="Record the current upstream versions, URLs and digests in dotfiles.lock",
+    )
+    lock_parser.add_argument("modules", nargs="*", help="Module IDs to lock (default: all)")
+
+    # Stats command
+    stats_parser = subparsers.add_parser("stats", help="Show p50/p95 durations of past runs per module and phase")
+    stats_parser.add_argument("modules", nargs="*", help="Module IDs to show (default: all)")
+    stats_parser.add_argument(
+        "--phase",
+        action="append",
+        help="Only show this phase (e.g. install, download, extract, fc-cache), can be given multiple times",
+    )
 
     # List command
     list_parser = subparsers.add_parser("list", help="List modules")
     list_parser.add_argument("--installed", action="store_true", help="Show only installed modules")
 
+    # Wheelhouse command
+    subparsers.add_parser(
+        "wheelhouse",
+        help="Download wheels of all requirements, so the venv can be created without network access",
+    )
+
     # GUI command (for backwards compatibility)
     subparsers.add_parser("gui", help="Launch graphical interface")
 
@@ -531,12 +951,25 @@ For devcontainers, use:
 
     # Set up output handler
     output = CLIOutput(verbose=parsed_args.verbose, quiet=parsed_args.quiet)
+    if parsed_args.offline:
+        df.releases.set_offline(True)
+    if getattr(parsed_args, "locked", False):
+        try:
+            df.lockfile.use(df.lockfile.Lockfile.load(df.lockfile.default_path()))
+        except df.lockfile.LockfileError as e:
+            output.error(str(e))
+            return 1
+
+    if parsed_args.trace:
+        df.trace.start(parsed_args.trace)
+    else:
+        df.trace.start_from_env()
 
     # Handle --all flag for install command
     if parsed_args.command == "install" and parsed_args.all:
         compatible_modules = []
         for module_id, module in MODULES.items():
-            if module.is_compatible() is True:
+            if df.host.is_compatible(module) is True:
                 compatible_modules.append(module_id)
         parsed_args.modules = compatible_modules
         output.verbose_info(f"Installing all compatible modules: {', '.join(compatible_modules)}")
@@ -544,17 +977,28 @@ For devcontainers, use:
     # Execute command
     try:
         if parsed_args.command == "install":
-            return cmd_install(parsed_args, config, output)
+            with df.trace.span("dotfiles install", "run", modules=parsed_args.modules):
+                return cmd_install(parsed_args, config, output)
         elif parsed_args.command == "uninstall":
-            return cmd_uninstall(parsed_args, config, output)
+            with df.trace.span("dotfiles uninstall", "run", modules=parsed_args.modules):
+                return cmd_uninstall(parsed_args, config, output)
         elif parsed_args.command == "update":
-            return cmd_update(parsed_args, config, output)
+            with df.trace.span("dotfiles update", "run", modules=parsed_args.modules):
+                return cmd_update(parsed_args, config, output)
         elif parsed_args.command == "list":
             return cmd_list(parsed_args, config, output)
+        elif parsed_args.command == "stats":
+            return cmd_stats(parsed_args, config, output)
+        elif parsed_args.command == "wheelhouse":
+            return cmd_wheelhouse(parsed_args, config, output)
+        elif parsed_args.command == "lock":
+            return cmd_lock(parsed_args, config, output)
         elif parsed_args.command == "gui":
             # Launch the GUI
             output.info("Launching graphical interface...")
-            app = df.ui.DotfilesApp(config)
+            from df.ui import DotfilesApp
+
+            app = DotfilesApp(config)
             app.run()
             return 0
         else:
@@ -1,6 +1,15 @@
+import contextlib
 import json
+import os
 from os import path
-from typing import Any, List, Union
+from typing import Any, Callable, Dict, Iterator, List, Optional, Tuple, Union
+
+import df.locking
+import df.paths
+import df.timeouts
+
+# The journal is compacted into the config file once it grows beyond this size
+JOURNAL_COMPACT_BYTES = 64 * 1024
 
 
 class ModuleConfig:
@@ -32,8 +41,7 @@ class ModuleConfig:
         """
         Set the installed status of the module
         """
-        self.config.config["modules"][self.id]["installed"] = installed
-        self.config.modified = True
+        self.config.apply({"op": "installed", "module": self.id, "value": installed})
 
     def get_installed_version(self) -> Union[str, None]:
         """
@@ -50,9 +58,13 @@ class ModuleConfig:
         Set the installed version of the module
         This will also set the installed status to True
         """
-        self.config.config["modules"][self.id]["installed_version"] = version
-        self.config.config["modules"][self.id]["installed"] = True
-        self.config.modified = True
+        self.config.apply({"op": "installed_version", "module": self.id, "value": version})
+
+    def snapshot(self) -> str:
+        """
+        Returns the whole entry serialized, to detect whether it changed
+        """
+        return json.dumps(self.config.config["modules"][self.id], sort_keys=True)
 
     def get(self, key: str, default: Any = None) -> Any:
         """
@@ -72,43 +84,166 @@ class ModuleConfig:
             json.dumps(value)
         except TypeError:
             raise ValueError("Value is not json serializable") from None
-        self.config.config["modules"][self.id]["data"][key] = value
-        self.config.modified = True
+        self.config.apply({"op": "set", "module": self.id, "key": key, "value": value})
 
     def unset(self, key: str) -> None:
         """
         Remove a config value, if it exists
         """
-        try:
-            del self.config.config["modules"][self.id]["data"][key]
-            self.config.modified = True
-        except KeyError:
-            pass
+        if key in self.config.config["modules"][self.id]["data"]:
+            self.config.apply({"op": "unset", "module": self.id, "key": key})
 
 
 class Config:
     """
     Wrapper class for the config file. The config file is loaded when the
-    object is created and saved when the object is deleted
+    object is created and saved with save()
+
+    Every change of a module entry is also appended to a journal next to
+    the config file (<config file>.journal), so changes are persisted
+    immediately without rewriting the whole config file. The journal is
+    replayed when the config is loaded and compacted into the config file
+    by save() (or once it grows beyond JOURNAL_COMPACT_BYTES).
+    Concurrent dotfiles processes are synchronized with a lock file
+    (<config file>.lock), see df.locking.
     """
 
     def __init__(self, filepath):
         self.filepath = filepath
-        self.config = {}
+        self.journal_path = filepath + ".journal"
+        # Held (exclusively) while writing the config file or the journal,
+        # other dotfiles processes take it shared while reading them
+        self.lock = df.locking.FileLock(filepath + ".lock")
+        self.module_locks: Dict[str, df.locking.FileLock] = {}
         self.modified = True  # True if the config has been modified
-        if path.exists(filepath):
-            with open(filepath, "r") as f:
-                self.config = json.load(f)
-                self.modified = False  # The config has not been modified yet
-        self.config.setdefault("modules", {})
+        with df.locking.FileLock(filepath + ".lock", shared=True):
+            self.config, replayed = self._read()
+        if path.exists(filepath) and not replayed:
+            self.modified = False  # The config has not been modified yet
+
+    def _read(self) -> Tuple[Dict[str, Any], bool]:
+        """
+        Read the config file and apply the changes of the journal
+        Returns the config and whether any journal entries were applied
+        Must be called with the lock held (shared or exclusive)
+        """
+        config: Dict[str, Any] = {}
+        if path.exists(self.filepath):
+            with open(self.filepath, "r") as f:
+                config = json.load(f)
+        config.setdefault("modules", {})
+        replayed = False
+        try:
+            with open(self.journal_path, "r") as f:
+                lines = f.readlines()
+        except FileNotFoundError:
+            lines = []
+        for line in lines:
+            try:
+                entry = json.loads(line)
+            except ValueError:
+                # A partially written entry (e.g. after a crash)
+                continue
+            self._apply_entry(config, entry)
+            replayed = True
+        return config, replayed
+
+    @staticmethod
+    def _apply_entry(config: Dict[str, Any], entry: Dict[str, Any]) -> None:
+        module = config["modules"].setdefault(entry["module"], {})
+        module.setdefault("data", {})
+        module.setdefault("installed", False)
+        if entry["op"] == "set":
+            module["data"][entry["key"]] = entry["value"]
+        elif entry["op"] == "unset":
+            module["data"].pop(entry["key"], None)
+        elif entry["op"] == "installed":
+            module["installed"] = entry["value"]
+        elif entry["op"] == "installed_version":
+            module["installed_version"] = entry["value"]
+            module["installed"] = True
+
+    def apply(self, entry: Dict[str, Any]) -> None:
+        """
+        Apply a change to a module entry and append it to the journal
+        Raises df.timeouts.ActionTimeoutError (without applying the change)
+        if called by an action that ran out of time, so an action abandoned by
+        the scheduler can not change the config after it was saved.
+        """
+        with self.lock:
+            df.timeouts.check()
+            self._apply_entry(self.config, entry)
+            self.modified = True
+            # The journal is shared with other processes (and removed when it is
+            # compacted), so it is only opened while the lock is held
+            with open(self.journal_path, "a+b") as f:
+                size = f.seek(0, os.SEEK_END)
+                if size > 0:
+                    f.seek(-1, os.SEEK_END)
+                    if f.read(1) != b"\n":
+                        # Terminate a partially written entry of a crashed process
+                        f.write(b"\n")
+                f.write(json.dumps(entry).encode() + b"\n")
+                size = f.tell()
+            if size > JOURNAL_COMPACT_BYTES:
+                self.save()
 
     def save(self) -> None:
         """
-        Save the config file to disk
+        Save the config file to disk and compact the journal into it
+        Changes of other processes (in the config file or the journal) are
+        merged, changes of this process are in the journal and win over
+        older ones. The file is replaced atomically, so it is never
+        partially written.
         """
-        with open(self.filepath, "w") as f:
-            json.dump(self.config, f, indent=4)
-        self.modified = False
+        with self.lock:
+            config, _ = self._read()
+            # Keep (empty) entries of modules that were only looked at
+            for id, module in self.config["modules"].items():
+                config["modules"].setdefault(id, module)
+            tmp_path = f"{self.filepath}.{os.getpid()}.tmp"
+            with open(tmp_path, "w") as f:
+                json.dump(config, f, indent=4)
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp_path, self.filepath)
+            # All changes of the journal are now in the config file
+            try:
+                os.remove(self.journal_path)
+            except FileNotFoundError:
+                pass
+            self.config = config
+            self.modified = False
+
+    def _module_lock(self, id: str) -> df.locking.FileLock:
+        with self.lock:
+            if id not in self.module_locks:
+                lock_dir = df.paths.ensure_dir(df.paths.cache_dir("locks"))
+                self.module_locks[id] = df.locking.FileLock(str(lock_dir / f"{id}.lock"))
+            return self.module_locks[id]
+
+    @contextlib.contextmanager
+    def locked_module(self, id: str, on_wait: Optional[Callable[[], None]] = None) -> Iterator[ModuleConfig]:
+        """
+        Hold the lock that must be held while running an action (install,
+        uninstall, update) on the module with the given id
+        Yields the config entry of the module, reloaded from disk, since
+        another process may have changed it. If the module is locked by
+        someone else, on_wait is called before waiting for the lock.
+        """
+        lock = self._module_lock(id)
+        if not lock.acquire(blocking=False):
+            if on_wait is not None:
+                on_wait()
+            lock.acquire()
+        try:
+            with self.lock:
+                config, _ = self._read()
+                if id in config["modules"]:
+                    self.config["modules"][id] = config["modules"][id]
+            yield self.get_module(id)
+        finally:
+            lock.release()
 
     def get_module_ids(self) -> List[str]:
         """
@@ -0,0 +1,282 @@
+"""
+Selective extraction of release archives
+
+Only the requested members of an archive are extracted, straight to their
+final location (written to <target>.part and renamed once the download is
+complete and verified), the rest of the archive is never written to disk.
+Tar archives are extracted while they are downloaded: the chunks of the
+download are fed to a tar stream reader in a background thread. Zip
+archives need their central directory (at the end of the file), they are
+extracted from the downloaded file. If streaming is not possible (the
+download was resumed, the cached file was still up to date, ...), the
+members are extracted from the downloaded file as well.
+"""
+
+import os
+import queue
+import shutil
+import tarfile
+import tempfile
+import threading
+import zipfile
+import zlib
+from pathlib import Path
+from typing import IO, Dict, Optional, cast
+
+import df
+import df.artifacts
+import df.metrics
+import df.prefetch
+
+# Maximum number of downloaded chunks buffered for the stream reader
+STREAM_BUFFER_CHUNKS = 16
+TAR_SUFFIXES = (".tar", ".tar.gz", ".tgz", ".tar.xz", ".txz", ".tar.bz2", ".tbz2")
+
+# Maps member names (the full path in the archive or only its file name) to target paths
+Members = Dict[str, Path]
+
+_ABORT = object()
+
+
+class MemberNotFoundError(Exception):
+    """Raised when a requested member is not in the archive"""
+
+
+def part_path(target: Path) -> Path:
+    """Returns the path members are written to before they are complete"""
+    return target.with_name(target.name + ".part")
+
+
+def _member_target(name: str, members: Members) -> Optional[Path]:
+    if name in members:
+        return members[name]
+    return members.get(name.rsplit("/", 1)[-1])
+
+
+def _write_member(source: IO[bytes], target: Path) -> None:
+    target.parent.mkdir(parents=True, exist_ok=True)
+    with part_path(target).open("wb") as f:
+        shutil.copyfileobj(source, f)
+
+
+def _extract_tar(tar_file: tarfile.TarFile, members: Members) -> Dict[str, Path]:
+    """Extract the members from tar_file (also works in stream mode), stops
+    as soon as all members were found. Returns the extracted members.
+    """
+    extracted: Dict[str, Path] = {}
+    for member in tar_file:
+        target = _member_target(member.name, members)
+        if target is None or not member.isfile() or target in extracted.values():
+            continue
+        member_file = tar_file.extractfile(member)
+        assert member_file is not None
+        with member_file:
+            _write_member(member_file, target)
+        extracted[member.name] = target
+        if len(extracted) == len(members):
+            break
+    return extracted
+
+
+def _extract_zip(zip_file: zipfile.ZipFile, members: Members) -> Dict[str, Path]:
+    extracted: Dict[str, Path] = {}
+    for info in zip_file.infolist():
+        target = _member_target(info.filename, members)
+        if target is None or info.is_dir() or target in extracted.values():
+            continue
+        with zip_file.open(info) as member_file:
+            _write_member(member_file, target)
+        extracted[info.filename] = target
+    return extracted
+
+
+def _finish(extracted: Dict[str, Path], members: Members) -> None:
+    """Rename the extracted members to their targets, or raise if members are missing"""
+    missing = set(members.values()) - set(extracted.values())
+    if missing:
+        _discard(members)
+        names = [name for name, target in members.items() if target in missing]
+        raise MemberNotFoundError(f"Not found in the archive: {', '.join(sorted(names))}")
+    for target in extracted.values():
+        os.replace(part_path(target), target)
+
+
+def _discard(members: Members) -> None:
+    for target in members.values():
+        part_path(target).unlink(missing_ok=True)
+
+
+def extract_members(archive: Path, members: Members) -> None:
+    """
+    Extract the members from archive (a tar or zip file) to their targets.
+    If archive is not an archive, it is copied to the (only) target.
+    """
+    if zipfile.is_zipfile(archive):
+        with zipfile.ZipFile(archive) as zip_file:
+            extracted = _extract_zip(zip_file, members)
+    elif tarfile.is_tarfile(archive):
+        with tarfile.open(archive) as tar_file:
+            extracted = _extract_tar(tar_file, members)
+    elif len(members) == 1:
+        # Not an archive, it is the file itself
+        target = next(iter(members.values()))
+        target.parent.mkdir(parents=True, exist_ok=True)
+        shutil.copyfile(archive, part_path(target))
+        extracted = {archive.name: target}
+    else:
+        raise MemberNotFoundError(f"{archive.name} is not an archive")
+    _finish(extracted, members)
+
+
+class _ChunkPipe:
+    """A file like object, which reads the chunks fed by a download"""
+
+    def __init__(self, max_chunks: int = STREAM_BUFFER_CHUNKS) -> None:
+        self.queue: "queue.Queue[object]" = queue.Queue(max_chunks)
+        self.buffer = b""
+        self.position = 0
+        self.eof = False
+        # Set by the reader when it stops reading, the feeder then drops all chunks
+        self.closed = False
+
+    def _put(self, item: object) -> None:
+        while not self.closed:
+            try:
+                self.queue.put(item, timeout=0.1)
+                return
+            except queue.Full:
+                pass
+
+    def feed(self, offset: int, chunk: bytes) -> None:
+        if self.closed:
+            return
+        if offset != self.position:
+            # The download was resumed or restarted, the stream is broken
+            self._put(_ABORT)
+            self.closed = True
+            return
+        self.position += len(chunk)
+        self._put(chunk)
+
+    def finish(self) -> None:
+        self._put(None)
+
+    def abort(self) -> None:
+        self._put(_ABORT)
+
+    def read(self, size: int = -1) -> bytes:
+        while not self.eof and (size < 0 or len(self.buffer) < size):
+            item = self.queue.get()
+            if item is _ABORT:
+                raise OSError("Download stream interrupted")
+            if item is None:
+                self.eof = True
+            else:
+                assert isinstance(item, bytes)
+                self.buffer += item
+        if size < 0:
+            size = len(self.buffer)
+        data, self.buffer = self.buffer[:size], self.buffer[size:]
+        return data
+
+
+class StreamingExtractor:
+    """Extracts members from a tar archive while it is downloaded, feed()
+    must be called with every chunk of the download (see df.ChunkCallback)
+    """
+
+    def __init__(self, members: Members) -> None:
+        self.members = members
+        self.pipe = _ChunkPipe()
+        self.extracted: Optional[Dict[str, Path]] = None
+        self.thread = threading.Thread(target=self._run, name="extract", daemon=True)
+        self.thread.start()
+
+    def _run(self) -> None:
+        try:
+            with tarfile.open(fileobj=cast(IO[bytes], self.pipe), mode="r|*") as tar_file:
+                self.extracted = _extract_tar(tar_file, self.members)
+        except (tarfile.TarError, OSError, EOFError, zlib.error):
+            self.extracted = None
+        finally:
+            self.pipe.closed = True
+
+    def feed(self, offset: int, chunk: bytes) -> None:
+        self.pipe.feed(offset, chunk)
+
+    def abort(self) -> None:
+        """Stop the extraction (the download failed), nothing is renamed"""
+        self.pipe.abort()
+        self.thread.join()
+        _discard(self.members)
+
+    def finish(self) -> bool:
+        """Wait for the extraction after the download is complete (and
+        verified), returns True if all members were extracted (and renamed
+        to their targets)
+        """
+        self.pipe.finish()
+        self.thread.join()
+        if self.extracted is None or len(self.extracted) != len(self.members):
+            _discard(self.members)
+            return False
+        _finish(self.extracted, self.members)
+        return True
+
+
+def is_tar_name(name: str) -> bool:
+    return name.lower().endswith(TAR_SUFFIXES)
+
+
+def download_and_extract(
+    url: str, members: Members, progress: Optional[df.ProgressCallback] = None, sha256: Optional[str] = None
+) -> None:
+    """
+    Download the archive at url and extract the members to their targets.
+    The download goes through the artifact cache (if enabled), prefetched
+    downloads (see df.prefetch) are extracted directly.
+    If sha256 is given, the archive is verified before any member is renamed
+    to its target, df.ChecksumMismatchError is raised if it does not match.
+    """
+    if df.ARTIFACT_CACHE_ENABLED:
+        path = df.prefetch.prefetched_path(url)
+        if path is not None and path.exists():
+            df.artifacts.verify_blob(url, path, sha256)
+        else:
+            extractor = StreamingExtractor(members) if is_tar_name(url) else None
+            try:
+                with df.metrics.Phase("download"):
+                    path = df.artifacts.artifact_cache().fetch(
+                        url, progress, on_chunk=extractor.feed if extractor else None, sha256=sha256
+                    )
+            except BaseException:
+                if extractor is not None:
+                    extractor.abort()
+                raise
+            if extractor is not None:
+                with df.metrics.Phase("extract", streamed=True):
+                    if extractor.finish():
+                        return
+        with df.metrics.Phase("extract"):
+            extract_members(path, members)
+        return
+    with tempfile.TemporaryDirectory() as temp_dir_str:
+        download_path = Path(temp_dir_str) / "download.part"
+        hasher = df.StreamingHash(download_path)
+        extractor = StreamingExtractor(members) if is_tar_name(url) else None
+        try:
+            with df.metrics.Phase("download"):
+                df.download_resumable(
+                    url,
+                    download_path,
+                    progress,
+                    on_chunk=df.chain_chunk_callbacks(hasher.update, extractor.feed if extractor else None),
+                )
+                df.verify_digest(url, download_path, hasher, sha256)
+        except BaseException:
+            if extractor is not None:
+                extractor.abort()
+            raise
+        with df.metrics.Phase("extract", streamed=extractor is not None):
+            if extractor is None or not extractor.finish():
+                extract_members(download_path, members)
@@ -0,0 +1,144 @@
+"""
+Fingerprints of module actions, to skip reinstalls and updates that would
+not change anything
+
+While a module is installed or updated, the paths it creates through
+df.symlink_path or a df.assets.BinaryRelease are recorded. Afterwards a
+fingerprint of the action's inputs is saved in the module config: the hash
+of the module source, the resolved upstream release (for modules with a
+GITHUB_REPO), the files in the dotfiles directory that were linked and the
+inode/mtime of every created target.
+If the fingerprint still matches when the action is run again (e.g. by
+`install --force` or an update from the TUI), the action is skipped.
+Modules without recorded targets are never skipped, since there is nothing
+to verify. Modules with side effects that are not recorded (e.g. bob, which
+installs Neovim with `bob install stable`) opt out with FINGERPRINT = False,
+other files created by a module can be recorded with record().
+"""
+
+import contextlib
+import hashlib
+import os
+import threading
+from pathlib import Path
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+import df.releases
+from df.config import ModuleConfig
+
+CONFIG_KEY = "_fingerprint"
+FINGERPRINT_VERSION = 1
+# Directories not included in the signature of linked directories
+IGNORED_DIRS = {".git", "__pycache__"}
+
+_recording = threading.local()
+
+
+def record(target: Path, source: Optional[Path] = None) -> None:
+    """Record that the running action created target (linked to source, if
+    given). Called by df.symlink_path and df.assets, does nothing if the
+    current thread is not recording.
+    """
+    paths: Optional[List[Tuple[str, Optional[str]]]] = getattr(_recording, "paths", None)
+    if paths is not None:
+        paths.append((str(target), str(source) if source is not None else None))
+
+
+def _source_signature(path: Path) -> Optional[str]:
+    """Returns a signature of a file or directory, which changes when any file in it changes"""
+    try:
+        if not path.is_dir():
+            stat = path.stat()
+            return f"{stat.st_size}:{stat.st_mtime_ns}"
+        sha256 = hashlib.sha256()
+        for root, dirs, files in os.walk(path):
+            dirs[:] = sorted(d for d in dirs if d not in IGNORED_DIRS)
+            for name in sorted(files):
+                file_path = os.path.join(root, name)
+                stat = os.lstat(file_path)
+                sha256.update(f"{os.path.relpath(file_path, path)}:{stat.st_size}:{stat.st_mtime_ns}\n".encode())
+        return sha256.hexdigest()
+    except OSError:
+        return None
+
+
+def _target_signature(path: Path) -> Optional[str]:
+    """Returns the inode, mtime and link target of path, None if it does not exist"""
+    try:
+        stat = path.lstat()
+    except OSError:
+        return None
+    link = os.readlink(path) if path.is_symlink() else ""
+    return f"{stat.st_ino}:{stat.st_mtime_ns}:{link}"
+
+
+def _upstream(module: Any) -> Optional[str]:
+    """Returns the resolved upstream release of module, "" if it has none"""
+    repo = getattr(module, "GITHUB_REPO", None)
+    if repo is None:
+        return ""
+    try:
+        return df.releases.latest_tag(repo)
+    except Exception:
+        return None
+
+
+def compute(module: Any, paths: List[Tuple[str, Optional[str]]]) -> Optional[Dict[str, Any]]:
+    """Returns the fingerprint of module with the given recorded paths, or
+    None if it can not be computed (e.g. the upstream release is unknown)
+    """
+    upstream = _upstream(module)
+    if upstream is None:
+        return None
+    return {
+        "version": FINGERPRINT_VERSION,
+        "module": getattr(module, "_sha256", None),
+        "upstream": upstream,
+        "paths": [list(path) for path in paths],
+        "sources": {source: _source_signature(Path(source)) for _, source in paths if source is not None},
+        "targets": {target: _target_signature(Path(target)) for target, _ in paths},
+    }
+
+
+def unchanged(module: Any, config: ModuleConfig) -> bool:
+    """Returns True if the last action of module was fingerprinted, its
+    inputs did not change since and all of its targets are still in place
+    """
+    if not getattr(module, "FINGERPRINT", True):
+        return False
+    stored = config.get(CONFIG_KEY)
+    if not stored or stored.get("version") != FINGERPRINT_VERSION or not stored.get("paths"):
+        return False
+    paths = [(target, source) for target, source in stored["paths"]]
+    for target, source in paths:
+        # Verify the targets, links must still point to their source
+        if source is not None and not (Path(target).is_symlink() and os.readlink(target) == source):
+            return False
+        if _target_signature(Path(target)) is None:
+            return False
+    return bool(compute(module, paths) == stored)
+
+
+@contextlib.contextmanager
+def recording(module: Any, config: ModuleConfig) -> Iterator[None]:
+    """Record the paths created by the action run in the with block, and save
+    its fingerprint in config if it succeeds. Actions without recorded paths
+    clear the fingerprint.
+    """
+    previous = getattr(_recording, "paths", None)
+    _recording.paths = []
+    try:
+        yield
+        paths = list(dict.fromkeys(_recording.paths))
+    finally:
+        _recording.paths = previous
+    fingerprint = compute(module, paths) if paths and getattr(module, "FINGERPRINT", True) else None
+    if fingerprint is not None:
+        config.set(CONFIG_KEY, fingerprint)
+    else:
+        config.unset(CONFIG_KEY)
+
+
+def clear(config: ModuleConfig) -> None:
+    """Forget the fingerprint (e.g. after uninstalling)"""
+    config.unset(CONFIG_KEY)
@@ -0,0 +1,171 @@
+"""
+Facts about the host, probed once and shared by all modules
+
+Modules should use facts() instead of calling platform.machine(),
+platform.libc_ver() or shutil.which() themselves, so every probe runs once
+per process and architecture names are normalized in one place.
+The probed facts (not the executables) are also cached on disk for the
+current boot, so later runs skip the slow probes (platform.libc_ver() reads
+the Python binary).
+
+Conditions in the module level code of modules must still use
+platform.system(), since only those can be evaluated by the module index.
+"""
+
+import hashlib
+import json
+import os
+import platform
+import shutil
+import sys
+import threading
+from typing import Any, Dict, Optional, Union
+
+import df.paths
+
+CACHE_VERSION = 1
+# Values of platform.machine() for the normalized architectures
+ARCH_ALIASES = {
+    "amd64": "x86_64",
+    "x64": "x86_64",
+    "arm64": "aarch64",
+    "armv8l": "aarch64",
+}
+# Files which only exist inside of (docker, podman, ...) containers
+CONTAINER_MARKERS = ["/.dockerenv", "/run/.containerenv"]
+
+
+class HostFacts:
+    """
+    Normalized facts about the host:
+    system: result of platform.system(), e.g. "Linux", "Darwin" or "Windows"
+    os: lowercase system, e.g. "linux", "darwin" or "windows"
+    arch: normalized architecture, e.g. "x86_64" or "aarch64"
+    libc: "gnu" or "musl" on Linux, None otherwise
+    """
+
+    def __init__(
+        self, system: str, arch: str, libc: Optional[str], in_container: bool, in_distrobox: bool, in_termux: bool
+    ) -> None:
+        self.system = system
+        self.os = system.lower()
+        self.arch = arch
+        self.libc = libc
+        self.in_container = in_container
+        self.in_distrobox = in_distrobox
+        self.in_termux = in_termux
+        self._executables: Dict[str, Optional[str]] = {}
+
+    @classmethod
+    def probe(cls) -> "HostFacts":
+        """Probe the facts of this host"""
+        system = platform.system()
+        machine = platform.machine().lower()
+        libc = None
+        if system == "Linux":
+            libc = "gnu" if platform.libc_ver()[0] == "glibc" else "musl"
+        in_distrobox = bool(os.environ.get("DISTROBOX_ENTER_PATH"))
+        in_container = in_distrobox or bool(os.environ.get("container")) or any(os.path.exists(p) for p in CONTAINER_MARKERS)
+        in_termux = bool(os.environ.get("PREFIX") and os.environ.get("TERMUX_VERSION"))
+        return cls(system, ARCH_ALIASES.get(machine, machine), libc, in_container, in_distrobox, in_termux)
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "system": self.system,
+            "arch": self.arch,
+            "libc": self.libc,
+            "in_container": self.in_container,
+            "in_distrobox": self.in_distrobox,
+            "in_termux": self.in_termux,
+        }
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> "HostFacts":
+        return cls(data["system"], data["arch"], data["libc"], data["in_container"], data["in_distrobox"], data["in_termux"])
+
+    @property
+    def key(self) -> str:
+        """Identifies hosts running the same binaries (e.g. linux-x86_64-gnu)"""
+        return f"{self.os}-{self.arch}-{self.libc}" if self.libc else f"{self.os}-{self.arch}"
+
+    def which(self, name: str) -> Optional[str]:
+        """shutil.which, but every executable is only looked up once"""
+        if name not in self._executables:
+            self._executables[name] = shutil.which(name)
+        return self._executables[name]
+
+    def has_executable(self, name: str) -> bool:
+        return self.which(name) is not None
+
+
+def _cache_key() -> Optional[str]:
+    """
+    Returns the key of the facts cache entry, or None if the facts should
+    not be cached (no boot id available).
+    Containers (e.g. distrobox) share the boot id and often the home
+    directory with the host, so the key also covers the environment.
+    """
+    try:
+        with open("/proc/sys/kernel/random/boot_id") as f:
+            boot_id = f.read().strip()
+    except OSError:
+        return None
+    parts = [
+        boot_id,
+        sys.executable,
+        os.environ.get("CONTAINER_ID", ""),
+        os.environ.get("DISTROBOX_ENTER_PATH", ""),
+        os.environ.get("container", ""),
+        os.environ.get("TERMUX_VERSION", ""),
+        *(str(os.path.exists(p)) for p in CONTAINER_MARKERS),
+    ]
+    return hashlib.sha256("\0".join(parts).encode()).hexdigest()
+
+
+def _load_cached() -> HostFacts:
+    key = _cache_key()
+    if key is None:
+        return HostFacts.probe()
+    cache_file = df.paths.cache_dir("host-facts.json")
+    try:
+        with open(cache_file) as f:
+            cache = json.load(f)
+        if cache.get("version") == CACHE_VERSION and cache.get("key") == key:
+            return HostFacts.from_dict(cache["facts"])
+    except (OSError, ValueError, KeyError, TypeError):
+        pass
+    facts = HostFacts.probe()
+    try:
+        df.paths.ensure_dir(cache_file.parent)
+        tmp_path = cache_file.with_name(f"host-facts.json.{os.getpid()}.tmp")
+        with open(tmp_path, "w") as f:
+            json.dump({"version": CACHE_VERSION, "key": key, "facts": facts.to_dict()}, f)
+        os.replace(tmp_path, cache_file)
+    except OSError:
+        pass  # The cache is only an optimization
+    return facts
+
+
+_facts: Optional[HostFacts] = None
+_compatibility: Dict[str, Union[bool, str]] = {}
+_lock = threading.Lock()
+
+
+def facts() -> HostFacts:
+    """Returns the facts of this host, probed on the first call"""
+    global _facts
+    if _facts is None:
+        with _lock:
+            if _facts is None:
+                _facts = _load_cached()
+    return _facts
+
+
+def is_compatible(module: Any) -> Union[bool, str]:
+    """
+    Returns module.is_compatible(), the check of every module only runs
+    once per process since it only depends on the host
+    """
+    if module.ID not in _compatibility:
+        _compatibility[module.ID] = module.is_compatible()
+    return _compatibility[module.ID]
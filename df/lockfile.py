@@ -0,0 +1,184 @@
+"""
+Lockfile of the resolved upstream versions (dotfiles.lock)
+
+`dotfiles lock` records for every module the release tag of its
+GITHUB_REPO, the asset of its BinaryRelease (see df.assets) for this host
+with its url and sha256, and the sha256 of all other files it downloads
+(see download_urls()). Assets are recorded per host (see
+df.host.HostFacts.key), running `dotfiles lock` on another kind of host
+adds its assets to the same lockfile.
+
+With `install --locked` or `update --locked` the lockfile is activated
+(see use()): latest tags come from the lockfile instead of GitHub, and
+downloads are verified against the locked digests, which also lets the
+artifact cache serve them without asking the server.
+"""
+
+import json
+import os
+import tempfile
+import threading
+import time
+from pathlib import Path
+from typing import Any, Dict, Iterable, Optional
+
+import df
+import df.artifacts
+import df.host
+import df.releases
+
+LOCKFILE_NAME = "dotfiles.lock"
+LOCKFILE_VERSION = 1
+
+
+class LockfileError(Exception):
+    """Raised when the lockfile is missing, invalid or has no entry for something needed"""
+
+
+def default_path() -> Path:
+    """Returns the path of the lockfile in the dotfiles directory"""
+    return Path(df.DOTFILES_DIR) / LOCKFILE_NAME
+
+
+class Lockfile:
+    """The contents of a lockfile, see the module docstring"""
+
+    def __init__(self, path: Path, data: Optional[Dict[str, Any]] = None) -> None:
+        self.path = path
+        self.data = data if data is not None else {"version": LOCKFILE_VERSION, "modules": {}}
+        self.lock = threading.Lock()
+
+    @classmethod
+    def load(cls, path: Path, missing_ok: bool = False) -> "Lockfile":
+        try:
+            with path.open("r") as f:
+                data = json.load(f)
+        except FileNotFoundError:
+            if missing_ok:
+                return cls(path)
+            raise LockfileError(f"{path} does not exist, create it with 'dotfiles lock'") from None
+        except (OSError, ValueError) as e:
+            raise LockfileError(f"Could not read {path}: {e}") from e
+        if data.get("version") != LOCKFILE_VERSION:
+            raise LockfileError(f"{path} has an unsupported version, recreate it with 'dotfiles lock'")
+        return cls(path, data)
+
+    def save(self) -> None:
+        """Atomically write the lockfile"""
+        with self.lock:
+            self.data["generated"] = time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime())
+            tmp_path = self.path.with_name(f"{self.path.name}.{os.getpid()}.tmp")
+            with tmp_path.open("w") as f:
+                json.dump(self.data, f, indent=4, sort_keys=True)
+                f.write("\n")
+            os.replace(tmp_path, self.path)
+
+    @property
+    def modules(self) -> Dict[str, Any]:
+        return dict(self.data["modules"])
+
+    def tags(self) -> Dict[str, str]:
+        """Returns the locked tag of every repository"""
+        return {entry["repo"]: entry["tag"] for entry in self.modules.values() if entry.get("repo")}
+
+    def asset(self, repo: str, tag: str, host_key: str) -> Optional[Dict[str, str]]:
+        """Returns the locked asset ({"name", "url", "sha256"}) of repo for host_key"""
+        for entry in self.modules.values():
+            if entry.get("repo") == repo and entry.get("tag") == tag and host_key in entry.get("assets", {}):
+                return dict(entry["assets"][host_key])
+        return None
+
+    def digest(self, url: str) -> Optional[str]:
+        """Returns the locked sha256 of the file at url"""
+        for entry in self.modules.values():
+            if url in entry.get("files", {}):
+                return str(entry["files"][url])
+            for asset in entry.get("assets", {}).values():
+                if asset["url"] == url:
+                    return str(asset["sha256"])
+        return None
+
+    def lock_module(self, module: Any) -> Dict[str, Any]:
+        """Resolve the current upstream state of module and record it"""
+        host = df.host.facts()
+        with self.lock:
+            old_entry = dict(self.data["modules"].get(module.ID, {}))
+        entry: Dict[str, Any] = {}
+        repo = getattr(module, "GITHUB_REPO", None)
+        if repo is not None:
+            entry["repo"] = repo
+            entry["tag"] = df.releases.latest_tag(repo)
+            if old_entry.get("tag") == entry["tag"]:
+                # Keep the assets locked on other hosts
+                entry["assets"] = dict(old_entry.get("assets", {}))
+        compatible = df.host.is_compatible(module) is True
+        release = getattr(module, "RELEASE", None)
+        if release is not None and compatible:
+            asset = release.resolve(entry.get("tag"))
+            entry.setdefault("assets", {})[host.key] = {
+                "name": asset.name,
+                "url": asset.url,
+                "sha256": asset.sha256() or _download_digest(asset.url),
+            }
+        elif hasattr(module, "download_urls") and compatible:
+            entry["files"] = {url: _download_digest(url) for url in module.download_urls()}
+        with self.lock:
+            if entry:
+                self.data["modules"][module.ID] = entry
+            else:
+                # Nothing to lock (e.g. only links files of the dotfiles)
+                self.data["modules"].pop(module.ID, None)
+        return entry
+
+    def prune(self, module_ids: Iterable[str]) -> None:
+        """Remove the entries of all modules not in module_ids"""
+        keep = set(module_ids)
+        with self.lock:
+            self.data["modules"] = {id: entry for id, entry in self.data["modules"].items() if id in keep}
+
+
+def _download_digest(url: str) -> str:
+    """Download url (into the artifact cache, if enabled) and return its sha256"""
+    if df.ARTIFACT_CACHE_ENABLED:
+        # Blobs are named by their digest
+        return df.artifacts.artifact_cache().fetch(url).name
+    with tempfile.TemporaryDirectory() as temp_dir_str:
+        part_path = Path(temp_dir_str) / "download.part"
+        hasher = df.StreamingHash(part_path)
+        df.download_resumable(url, part_path, on_chunk=hasher.update)
+        return hasher.hexdigest()
+
+
+_active: Optional[Lockfile] = None
+
+
+def use(lockfile: Lockfile) -> None:
+    """Resolve everything from lockfile in this process (--locked)"""
+    global _active
+    _active = lockfile
+    df.releases.set_locked_tags(lockfile.tags())
+
+
+def active() -> Optional[Lockfile]:
+    """Returns the lockfile used by this process, or None"""
+    return _active
+
+
+def locked_asset(repo: str, tag: str) -> Optional[Dict[str, str]]:
+    """Returns the locked asset of repo for this host, or None if no lockfile
+    is used. Raises LockfileError if the lockfile has no such asset.
+    """
+    if _active is None:
+        return None
+    host_key = df.host.facts().key
+    asset = _active.asset(repo, tag, host_key)
+    if asset is None:
+        raise LockfileError(f"{_active.path.name} has no asset of {repo} {tag} for {host_key}, run 'dotfiles lock' on this host")
+    return asset
+
+
+def locked_digest(url: str) -> Optional[str]:
+    """Returns the locked sha256 of url, or None (no lockfile or not locked)"""
+    if _active is None:
+        return None
+    return _active.digest(url)
@@ -0,0 +1,79 @@
+"""
+Advisory file locks between dotfiles processes
+
+Used to keep concurrent dotfiles processes (e.g. a scheduled update and an
+interactive TUI session) from overwriting each others config changes or
+running actions on the same module at the same time.
+Locks are taken with flock(2), so they are released automatically if the
+process dies. On systems without fcntl (Windows) locks only apply within
+the current process.
+"""
+
+import os
+import threading
+from typing import Any, Optional
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None  # type: ignore[assignment]
+
+
+class FileLock:
+    """
+    An advisory lock on a file, either shared (multiple readers) or
+    exclusive. The lock is reentrant within the process, other threads of
+    this process wait just like other processes.
+    """
+
+    def __init__(self, path: str, shared: bool = False) -> None:
+        self.path = path
+        self.shared = shared
+        self._lock = threading.RLock()
+        self._count = 0
+        self._fd: Optional[int] = None
+
+    def acquire(self, blocking: bool = True) -> bool:
+        """
+        Acquire the lock, returns False if blocking is False and the lock is
+        held by someone else
+        """
+        if not self._lock.acquire(blocking):
+            return False
+        if self._count == 0:
+            try:
+                fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o644)
+            except OSError:
+                self._lock.release()
+                raise
+            if fcntl is not None:
+                flags = fcntl.LOCK_SH if self.shared else fcntl.LOCK_EX
+                if not blocking:
+                    flags |= fcntl.LOCK_NB
+                try:
+                    fcntl.flock(fd, flags)
+                except BlockingIOError:
+                    os.close(fd)
+                    self._lock.release()
+                    return False
+            self._fd = fd
+        self._count += 1
+        return True
+
+    def release(self) -> None:
+        """
+        Release the lock
+        """
+        self._count -= 1
+        if self._count == 0 and self._fd is not None:
+            # Closing the file descriptor releases the flock
+            os.close(self._fd)
+            self._fd = None
+        self._lock.release()
+
+    def __enter__(self) -> "FileLock":
+        self.acquire()
+        return self
+
+    def __exit__(self, *exc: Any) -> None:
+        self.release()
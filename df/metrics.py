@@ -0,0 +1,246 @@
+"""
+Local store of timings of past runs
+
+Every phase of a module action run by the CLI or the TUI appends a record
+to ~/.cache/df/metrics.jsonl (one JSON object per line), e.g.:
+
+    {"time": 1760000000.0, "run": "1760000000-4242", "module": "zoxide", "phase": "download",
+     "seconds": 1.2, "ok": true, "bytes": 1843200}
+
+Phases are nested: the action itself ("install", "update", "uninstall"),
+and inside of it e.g. "has_update", "resolve", "download", "extract" or the
+name of a command run with df.run_process (e.g. "fc-cache"). Background
+downloads are recorded as "prefetch" (see df.prefetch). Nested phases belong
+to the module of the action they run in (see Phase), downloads add the
+bytes they received to the innermost phase.
+`dotfiles stats` shows p50/p95 of every module and phase, the records are
+also used to estimate how long planned actions will take (see df.plan).
+Records are buffered and appended together once the outermost phase (e.g.
+the action) finished, the file is shared with other dotfiles processes
+through a df.locking.FileLock.
+"""
+
+import atexit
+import contextvars
+import json
+import math
+import os
+import statistics
+import threading
+import time
+from pathlib import Path
+from typing import Any, ContextManager, Dict, Iterable, Iterator, List, Optional, Sequence, Tuple
+
+import df.locking
+import df.paths
+import df.timeouts
+import df.trace
+
+# Only the most recent successful runs of an action are used for estimates
+ESTIMATE_SAMPLES = 10
+# Once the store grows larger, the older half of the records is dropped
+METRICS_MAX_BYTES = 4 * 1024 * 1024
+# Buffered records are written once there are this many (or the outermost phase finished)
+METRICS_BUFFER_RECORDS = 100
+# Identifies the records of this process
+RUN_ID = f"{int(time.time())}-{os.getpid()}"
+
+_lock = threading.Lock()
+_buffer: List[str] = []
+_module: "contextvars.ContextVar[Optional[str]]" = contextvars.ContextVar("df_metrics_module", default=None)
+_phase: "contextvars.ContextVar[Optional[Phase]]" = contextvars.ContextVar("df_metrics_phase", default=None)
+
+
+def metrics_path() -> Path:
+    return df.paths.cache_dir("metrics.jsonl")
+
+
+def _trim(path: Path) -> None:
+    """Drop the older half of the records, must be called with the file lock held"""
+    with path.open("r") as f:
+        lines = f.readlines()
+    tmp_path = path.with_name(f"{path.name}.{os.getpid()}.tmp")
+    with tmp_path.open("w") as f:
+        f.writelines(lines[len(lines) // 2 :])
+    os.replace(tmp_path, path)
+
+
+def record(module_id: Optional[str], phase: str, seconds: float, ok: bool = True, **fields: Any) -> None:
+    """Append a record of phase of module_id (None if it belongs to no module), taking seconds"""
+    entry = {
+        "time": time.time(),
+        "run": RUN_ID,
+        "module": module_id,
+        "phase": phase,
+        "seconds": round(seconds, 4),
+        "ok": ok,
+        **fields,
+    }
+    with _lock:
+        _buffer.append(json.dumps(entry) + "\n")
+        full = len(_buffer) >= METRICS_BUFFER_RECORDS
+    if full or _phase.get() is None:
+        flush()
+
+
+def flush() -> None:
+    """Append the buffered records to the store"""
+    with _lock:
+        lines = list(_buffer)
+        _buffer.clear()
+    if not lines:
+        return
+    path = metrics_path()
+    try:
+        df.paths.ensure_dir(path.parent)
+        with df.locking.FileLock(f"{path}.lock"):
+            with path.open("a") as f:
+                f.writelines(lines)
+                size = f.tell()
+            if size > METRICS_MAX_BYTES:
+                _trim(path)
+    except OSError:
+        pass  # Metrics are never worth failing an action for
+
+
+atexit.register(flush)
+
+
+def load() -> Iterator[Dict[str, Any]]:
+    """Yields all records, oldest first, invalid lines are skipped"""
+    flush()
+    try:
+        with metrics_path().open("r") as f:
+            lines = f.readlines()
+    except OSError:
+        return
+    for line in lines:
+        try:
+            entry = json.loads(line)
+        except ValueError:
+            continue
+        if isinstance(entry, dict) and isinstance(entry.get("seconds"), (int, float)):
+            yield entry
+
+
+class Phase:
+    """Context manager recording how long the with block took (as failed if it raised)
+
+    with df.metrics.Phase("install", "zoxide"):
+        with df.metrics.Phase("download"):
+            ...
+
+    If module_id is not given, the phase belongs to the module of the phase
+    it runs in. Extra fields are added to the record. Phases are limited by
+    df.timeouts.PHASE_TIMEOUTS, a phase of an action out of time does not start.
+    """
+
+    def __init__(self, name: str, module_id: Optional[str] = None, **fields: Any) -> None:
+        self.name = name
+        self.module_id = module_id
+        self.fields = fields
+        self.bytes = 0
+        self.start = 0.0
+        self._tokens: List[contextvars.Token] = []
+        self._span: Optional[ContextManager[Dict[str, Any]]] = None
+        self._timeout: Optional[ContextManager[None]] = None
+
+    def __enter__(self) -> "Phase":
+        self._timeout = df.timeouts.phase(self.name)
+        self._timeout.__enter__()
+        if self.module_id is None:
+            self.module_id = _module.get()
+            span_name = self.name
+        else:
+            self._tokens.append(_module.set(self.module_id))
+            span_name = f"{self.name} {self.module_id}"
+        self._tokens.append(_phase.set(self))
+        self._span = df.trace.span(span_name, "phase", module=self.module_id, **self.fields)
+        self._span_args = self._span.__enter__()
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type: Any, exc: Any, tb: Any) -> None:
+        seconds = time.perf_counter() - self.start
+        _phase.reset(self._tokens.pop())
+        if self._tokens:
+            _module.reset(self._tokens.pop())
+        fields = dict(self.fields)
+        if self.bytes:
+            fields["bytes"] = self.bytes
+        if exc_type is not None and issubclass(exc_type, df.timeouts.ActionTimeoutError):
+            fields["timeout"] = True
+        record(self.module_id, self.name, seconds, ok=exc_type is None, **fields)
+        if self._span is not None:
+            self._span_args.update(fields)
+            self._span.__exit__(exc_type, exc, tb)
+        if self._timeout is not None:
+            self._timeout.__exit__(exc_type, exc, tb)
+
+
+def count_bytes(count: int) -> None:
+    """Add count downloaded bytes to the current phase (if any)"""
+    phase = _phase.get()
+    if phase is not None:
+        phase.bytes += count
+
+
+def estimates(phase: str) -> Dict[str, float]:
+    """Returns the estimated duration of phase for every module with recorded
+    runs: the median of its most recent successful runs
+    """
+    samples: Dict[str, List[float]] = {}
+    for entry in load():
+        if entry.get("phase") == phase and entry.get("ok") and entry.get("module"):
+            samples.setdefault(entry["module"], []).append(float(entry["seconds"]))
+    return {module_id: statistics.median(values[-ESTIMATE_SAMPLES:]) for module_id, values in samples.items()}
+
+
+def percentile(values: Sequence[float], p: float) -> float:
+    """Returns the p-th percentile (nearest rank) of values"""
+    ordered = sorted(values)
+    return ordered[max(0, math.ceil(p / 100 * len(ordered)) - 1)]
+
+
+class PhaseStats:
+    """Statistics of all recorded runs of a phase of a module"""
+
+    def __init__(self, module_id: Optional[str], phase: str) -> None:
+        self.module_id = module_id
+        self.phase = phase
+        self.seconds: List[float] = []
+        self.bytes: List[int] = []
+        self.failed = 0
+
+    def add(self, entry: Dict[str, Any]) -> None:
+        self.seconds.append(float(entry["seconds"]))
+        if entry.get("bytes"):
+            self.bytes.append(int(entry["bytes"]))
+        if not entry.get("ok"):
+            self.failed += 1
+
+    @property
+    def p50(self) -> float:
+        return percentile(self.seconds, 50)
+
+    @property
+    def p95(self) -> float:
+        return percentile(self.seconds, 95)
+
+
+def summarize(
+    entries: Iterable[Dict[str, Any]], module_ids: Optional[List[str]] = None, phases: Optional[List[str]] = None
+) -> List[PhaseStats]:
+    """Group the records by module and phase, optionally only of the given modules and phases"""
+    stats: Dict[Tuple[Optional[str], str], PhaseStats] = {}
+    for entry in entries:
+        module_id, phase = entry.get("module"), str(entry.get("phase"))
+        if module_ids and module_id not in module_ids:
+            continue
+        if phases and phase not in phases:
+            continue
+        key = (module_id, phase)
+        if key not in stats:
+            stats[key] = PhaseStats(module_id, phase)
+        stats[key].add(entry)
+    return sorted(stats.values(), key=lambda s: (s.module_id or "", s.phase))
@@ -1,9 +1,20 @@
+import ast
 import glob
+import hashlib
+import importlib
 import importlib.util
+import json
 import os
+import pkgutil
+import platform
 import re
+import threading
+from typing import Any, Callable, Dict, List, Set, Union
 
-MODULES = {}
+import df.paths
+from df import profiling
+
+MODULES: Dict[str, Any] = {}
 
 # register all modules in this directory
 # each python file contains a module that must define the following
@@ -44,37 +55,310 @@ MODULES = {}
 # - update(config: df.config.ModuleConfig, stdout: io.TextIOWrapper):
 #                    Update the module and its configuration files
 #                    On an error, this function must raise an exception.
+# - download_urls() -> List[str]:
+#                    The urls install()/update() will download with
+#                    df.download_file, they are prefetched in the
+#                    background while other modules are installed
+#                    (see df.prefetch)
 #
 # See the _template.py file for an example module
 # it is recommended to name the module file after the module ID
-module_files = glob.glob(os.path.join(os.path.dirname(__file__), "*.py"))
+#
+# optional variables:
+# - VERSION: str     the version of the module itself, modules with a
+#                    different installed version are shown as updatable
+# - GITHUB_REPO: str "<org>/<repo>" of the upstream GitHub project, used to
+#                    resolve the latest releases of all modules at once
+#                    (see df.releases)
+# - FINGERPRINT: bool False if install()/update() have side effects that are
+#                    not recorded by df.fingerprint (e.g. commands that
+#                    install something), so they are never skipped
+#
+# Modules are not executed when they are registered. The metadata variables
+# (ID, NAME, DESCRIPTION, DEPENDENCIES, CONFLICTING, VERSION and GITHUB_REPO) are read
+# from the source code with an AST pass, so they must be literals. They may
+# be assigned inside `if platform.system() == "..."` blocks. Everything
+# else is loaded on first use (e.g. when install() is called).
+# The extracted metadata is cached in ~/.cache/df/module-index.json.
+
+METADATA_NAMES = ["ID", "NAME", "DESCRIPTION", "DEPENDENCIES", "CONFLICTING", "VERSION", "GITHUB_REPO"]
+INDEX_VERSION = 2
+
+
+class DynamicModuleError(Exception):
+    """Raised when a module can not be analyzed statically"""
+
+
+def _eval_condition(node: ast.expr) -> bool:
+    """Evaluate a top level if condition of a module
+    Only conditions depending on platform.system() are supported,
+    everything else raises DynamicModuleError
+    """
+    if isinstance(node, ast.BoolOp):
+        values = [_eval_condition(value) for value in node.values]
+        return all(values) if isinstance(node.op, ast.And) else any(values)
+    if isinstance(node, ast.UnaryOp) and isinstance(node.op, ast.Not):
+        return not _eval_condition(node.operand)
+    if isinstance(node, ast.Compare) and len(node.ops) == 1:
+        left = node.left
+        is_system_call = (
+            isinstance(left, ast.Call)
+            and not left.args
+            and not left.keywords
+            and isinstance(left.func, ast.Attribute)
+            and left.func.attr == "system"
+            and isinstance(left.func.value, ast.Name)
+            and left.func.value.id == "platform"
+        )
+        if is_system_call:
+            try:
+                right = ast.literal_eval(node.comparators[0])
+            except ValueError:
+                raise DynamicModuleError("unsupported comparison") from None
+            op = node.ops[0]
+            system = platform.system()
+            if isinstance(op, ast.Eq):
+                return bool(system == right)
+            if isinstance(op, ast.NotEq):
+                return bool(system != right)
+            if isinstance(op, ast.In):
+                return system in right
+            if isinstance(op, ast.NotIn):
+                return system not in right
+    raise DynamicModuleError("unsupported condition")
+
+
+def _assigned_names(node: ast.stmt) -> Set[str]:
+    """Returns all names a top level statement binds"""
+    names: Set[str] = set()
+    for child in ast.walk(node):
+        if isinstance(child, ast.Name) and isinstance(child.ctx, ast.Store):
+            names.add(child.id)
+        elif isinstance(child, (ast.FunctionDef, ast.AsyncFunctionDef, ast.ClassDef)):
+            names.add(child.name)
+        elif isinstance(child, (ast.Import, ast.ImportFrom)):
+            for alias in child.names:
+                names.add((alias.asname or alias.name).split(".")[0])
+    return names
+
+
+def analyze_source(source: str, filename: str = "<module>") -> Dict[str, Any]:
+    """Extract the metadata of a module without executing it
+
+    Returns a dict with the metadata variables, the names of the top level
+    functions and all other top level names. Raises DynamicModuleError if the
+    metadata can not be determined statically.
+    """
+    tree = ast.parse(source, filename)
+    metadata: Dict[str, Any] = {}
+    functions: Set[str] = set()
+    names: Set[str] = set()
+
+    def visit(body: List[ast.stmt]) -> None:
+        for stmt in body:
+            names.update(_assigned_names(stmt))
+            if isinstance(stmt, (ast.FunctionDef, ast.AsyncFunctionDef)):
+                functions.add(stmt.name)
+            elif isinstance(stmt, ast.ImportFrom) and any(alias.name == "*" for alias in stmt.names):
+                raise DynamicModuleError("star imports are not supported")
+            elif isinstance(stmt, (ast.Assign, ast.AnnAssign)):
+                targets = stmt.targets if isinstance(stmt, ast.Assign) else [stmt.target]
+                for target in targets:
+                    if isinstance(target, ast.Name) and target.id in METADATA_NAMES:
+                        if len(targets) != 1 or stmt.value is None:
+                            raise DynamicModuleError(f"{target.id} must be assigned a single literal")
+                        try:
+                            metadata[target.id] = ast.literal_eval(stmt.value)
+                        except ValueError:
+                            raise DynamicModuleError(f"{target.id} is not a literal") from None
+            elif isinstance(stmt, ast.If) and _assigned_names(stmt) & set(METADATA_NAMES):
+                visit(stmt.body if _eval_condition(stmt.test) else stmt.orelse)
+            elif _assigned_names(stmt) & set(METADATA_NAMES):
+                raise DynamicModuleError("metadata must be assigned at the top level")
+
+    visit(tree.body)
+    return {
+        "metadata": metadata,
+        "functions": sorted(functions),
+        "names": sorted(names),
+    }
+
+
+class ModuleProxy:
+    """A registered module, which is only executed when it is first used
+
+    The metadata variables are available without loading the module.
+    Accessing a function returns a wrapper, that loads the module when it
+    is called. All other attributes load the module on access.
+    """
+
+    def __init__(self, name: str, path: str, sha256: str, info: Dict[str, Any]) -> None:
+        object.__setattr__(self, "_name", name)
+        object.__setattr__(self, "_path", path)
+        object.__setattr__(self, "_sha256", sha256)
+        object.__setattr__(self, "_functions", set(info["functions"]))
+        object.__setattr__(self, "_names", set(info["names"]))
+        object.__setattr__(self, "_module", None)
+        object.__setattr__(self, "_lock", threading.Lock())
+        for key, value in info["metadata"].items():
+            object.__setattr__(self, key, value)
+
+    def _load(self) -> Any:
+        """Execute the module (only once) and return it"""
+        with self._lock, profiling.span(f"load {self._name}", "module"):
+            if self._module is None:
+                if not os.path.isfile(self._path):
+                    # Running from a zipapp, use the regular import machinery
+                    module = importlib.import_module(f"{__name__}.{self._name}")
+                else:
+                    spec = importlib.util.spec_from_file_location(self._name, self._path)
+                    if spec is None or spec.loader is None:
+                        raise ValueError(f"Could not load module from {self._path}")
+                    module = importlib.util.module_from_spec(spec)
+                    spec.loader.exec_module(module)
+                object.__setattr__(self, "_module", module)
+            return self._module
 
-# import all modules and register them in the modules list
-for module_file in module_files:
+    def _make_lazy_function(self, name: str) -> Callable[..., Any]:
+        def lazy_function(*args: Any, **kwargs: Any) -> Any:
+            return getattr(self._load(), name)(*args, **kwargs)
+
+        lazy_function.__name__ = name
+        return lazy_function
+
+    def __getattr__(self, name: str) -> Any:
+        if name.startswith("__"):
+            raise AttributeError(name)
+        if self._module is not None:
+            return getattr(self._module, name)
+        if name in self._functions:
+            return self._make_lazy_function(name)
+        if name not in self._names:
+            raise AttributeError(f"Module '{self._name}' has no attribute '{name}'")
+        return getattr(self._load(), name)
+
+    def __setattr__(self, name: str, value: Any) -> None:
+        # e.g. used to replace print() inside the module
+        setattr(self._load(), name, value)
+
+    def __delattr__(self, name: str) -> None:
+        delattr(self._load(), name)
+
+    def __repr__(self) -> str:
+        state = "loaded" if self._module is not None else "not loaded"
+        return f"<df module '{self._name}' ({state})>"
+
+
+def _load_index(path: str) -> Dict[str, Any]:
+    try:
+        with open(path, "r") as f:
+            index = json.load(f)
+    except (OSError, ValueError):
+        return {}
+    if index.get("version") != INDEX_VERSION or index.get("system") != platform.system():
+        # The index is outdated or was created on another system
+        return {}
+    return dict(index.get("modules", {}))
+
+
+def _save_index(path: str, entries: Dict[str, Any]) -> None:
+    index = {"version": INDEX_VERSION, "system": platform.system(), "modules": entries}
+    try:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(index, f, indent=4)
+        os.replace(tmp_path, path)
+    except OSError:
+        # The cache is optional, we will just analyze the modules next time
+        pass
+
+
+def _index_module(module_file: str, cached: Union[Dict[str, Any], None]) -> Dict[str, Any]:
+    """Returns the index entry for the given module file
+    The cached entry is reused if the mtime and size match, or if the
+    content hash is unchanged. The "info" of modules that can not be
+    analyzed statically is None.
+    """
+    if os.path.isfile(module_file):
+        stat = os.stat(module_file)
+        if cached is not None and cached["mtime_ns"] == stat.st_mtime_ns and cached["size"] == stat.st_size:
+            return cached
+        with open(module_file, "rb") as f:
+            source = f.read()
+        mtime_ns, size = stat.st_mtime_ns, stat.st_size
+    else:
+        # Inside a zipapp, only the content hash can be compared
+        source = pkgutil.get_data(__name__, os.path.basename(module_file)) or b""
+        mtime_ns, size = 0, len(source)
+    sha256 = hashlib.sha256(source).hexdigest()
+    entry = {"mtime_ns": mtime_ns, "size": size, "sha256": sha256}
+    if cached is not None and cached["sha256"] == sha256:
+        # Only the mtime changed (e.g. after a git checkout)
+        entry["info"] = cached["info"]
+        return entry
+    try:
+        entry["info"] = analyze_source(source.decode("utf-8"), module_file)
+    except DynamicModuleError:
+        entry["info"] = None
+    return entry
+
+
+def _load_eagerly(name: str, path: str, sha256: str) -> ModuleProxy:
+    """Register a module that can not be analyzed statically by executing it"""
+    proxy = ModuleProxy(name, path, sha256, {"metadata": {}, "functions": [], "names": []})
+    module = proxy._load()
+    for key in METADATA_NAMES:
+        if hasattr(module, key):
+            object.__setattr__(proxy, key, getattr(module, key))
+    return proxy
+
+
+def _module_files() -> List[str]:
+    """Returns the paths of all module files
+    When running from a zipapp, the paths point into the archive.
+    """
+    module_dir = os.path.dirname(__file__)
+    if os.path.isdir(module_dir):
+        return glob.glob(os.path.join(module_dir, "*.py"))
+    return [os.path.join(module_dir, f"{info.name}.py") for info in pkgutil.iter_modules(__path__) if not info.ispkg]
+
+
+module_files = _module_files()
+index_path = str(df.paths.cache_dir("module-index.json"))
+cached_entries = _load_index(index_path)
+index_entries: Dict[str, Any] = {}
+
+# register all modules without executing them
+for module_file in sorted(module_files):
     if os.path.basename(module_file) in ["__init__.py", "_template.py"]:
         continue
     module_name = os.path.basename(module_file)[:-3]
-    spec = importlib.util.spec_from_file_location(module_name, module_file)
-    if spec is None or spec.loader is None:
-        raise ValueError(f"Could not load module from {module_file}")
-    module = importlib.util.module_from_spec(spec)
-    spec.loader.exec_module(module)
+    entry = _index_module(module_file, cached_entries.get(module_name))
+    index_entries[module_name] = entry
+    if entry["info"] is None:
+        module = _load_eagerly(module_name, module_file, entry["sha256"])
+    else:
+        module = ModuleProxy(module_name, module_file, entry["sha256"], entry["info"])
     # test if module.ID is a string from a-z, 0-9 and _
-    if not re.match(r"^[a-z0-9_]+$", module.ID):
-        raise ValueError(f"Invalid module ID '{module.ID}'")
+    if not isinstance(getattr(module, "ID", None), str) or not re.match(r"^[a-z0-9_]+$", module.ID):
+        raise ValueError(f"Invalid module ID '{getattr(module, 'ID', None)}' in {module_file}")
     MODULES[module.ID] = module
 
+if index_entries != cached_entries:
+    _save_index(index_path, index_entries)
+
 # check all modules for errors
 for module in MODULES.values():
     # We allready checked module.ID
     # check if module.NAME is a string
-    if not isinstance(module.NAME, str):
+    if not isinstance(getattr(module, "NAME", None), str):
         raise ValueError(f"Module '{module.ID}' has an invalid name")
     # check if module.DESCRIPTION is a string
-    if not isinstance(module.DESCRIPTION, str):
+    if not isinstance(getattr(module, "DESCRIPTION", None), str):
         raise ValueError(f"Module '{module.ID}' has an invalid description")
     # check if module.DEPENDENCIES is a list of strings
-    if not isinstance(module.DEPENDENCIES, list):
+    if not isinstance(getattr(module, "DEPENDENCIES", None), list):
         raise ValueError(f"Module '{module.ID}' has invalid dependencies")
     for dependency in module.DEPENDENCIES:
         if not isinstance(dependency, str):
@@ -83,7 +367,7 @@ for module in MODULES.values():
         if dependency not in MODULES.keys():
             raise ValueError(f"Module '{module.ID}' has an invalid dependency '{dependency}'")
     # check if module.CONFLICTING is a list of strings
-    if not isinstance(module.CONFLICTING, list):
+    if not isinstance(getattr(module, "CONFLICTING", None), list):
         raise ValueError(f"Module '{module.ID}' has invalid conflicting modules")
     for conflicting in module.CONFLICTING:
         if not isinstance(conflicting, str):
@@ -7,6 +7,7 @@ from pathlib import Path
 from typing import List, Union
 
 import df
+import df.releases
 from df.config import ModuleConfig
 
 ID: str = "fira_code_nerd_font"
@@ -14,10 +15,8 @@ NAME: str = "Fira Code Nerd Font"
 DESCRIPTION: str = "Fira Code: free monospaced font with programming ligatures"
 DEPENDENCIES: List[str] = []
 CONFLICTING: List[str] = []
+GITHUB_REPO: str = "ryanoasis/nerd-fonts"
 
-dl_link = (
-    "https://raw.githubusercontent.com/ryanoasis/nerd-fonts/master/patched-fonts/FiraCode/Medium/FiraCodeNerdFont-Medium.ttf"
-)
 font_name = "Fira Code Medium Nerd Font Complete.ttf"
 if platform.system() == "Windows":
     fonts_folder = Path.home() / "AppData/Local/Microsoft/Windows/Fonts"
@@ -27,6 +26,22 @@ else:
     fonts_folder = Path.home() / ".local/share/fonts/"
 
 
+def dl_link() -> str:
+    """
+    Returns the download link of the font at the latest release (the locked
+    one with --locked), not at the branch head, so it matches the lockfile
+    """
+    tag = df.releases.latest_tag(GITHUB_REPO)
+    return f"https://raw.githubusercontent.com/{GITHUB_REPO}/{tag}/patched-fonts/FiraCode/Medium/FiraCodeNerdFont-Medium.ttf"
+
+
+def download_urls() -> List[str]:
+    """
+    Returns the files downloaded by install, so they can be prefetched
+    """
+    return [dl_link()]
+
+
 def is_compatible() -> Union[bool, str]:
     return platform.system() in ["Linux", "Windows", "Darwin"]
 
@@ -37,7 +52,7 @@ def install(config: ModuleConfig, stdout: io.TextIOWrapper) -> None:
         print("Downloading font...")
         temp_dir = Path(temp_dir_str)
         download_path = temp_dir / font_name
-        df.download_file(dl_link, download_path)
+        df.download_file(dl_link(), download_path)
         print("Installing font...")
         # Install the font by copying it to the local fonts directory
         font_path = fonts_folder / font_name
@@ -66,7 +81,7 @@ def install(config: ModuleConfig, stdout: io.TextIOWrapper) -> None:
             # Update the font cache if fc-cache is installed
             print("Updating font cache...")
             try:
-                subprocess.run(
+                df.run_process(
                     ["fc-cache", "-f"],
                     stdout=subprocess.PIPE,
                     stderr=subprocess.PIPE,
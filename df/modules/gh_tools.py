@@ -1,9 +1,9 @@
 import io
-import shutil
 from pathlib import Path
 from typing import List, Union
 
 import df
+import df.host
 from df.config import ModuleConfig
 
 ID: str = "gh_tools"
@@ -17,7 +17,7 @@ install_dir = Path.home() / ".local" / "bin"
 
 
 def is_compatible() -> Union[bool, str]:
-    if shutil.which("gh") is None:
+    if not df.host.facts().has_executable("gh"):
         return "gh CLI is not installed"
     return True
 
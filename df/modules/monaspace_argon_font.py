@@ -7,6 +7,7 @@ from pathlib import Path
 from typing import List, Union
 
 import df
+import df.releases
 from df.config import ModuleConfig
 
 ID: str = "monaspace_argon_font"
@@ -14,16 +15,17 @@ NAME: str = "Monaspace Argon Font"
 DESCRIPTION: str = "Monaspace Argon: a superfamily of fonts for code"
 DEPENDENCIES: List[str] = []
 CONFLICTING: List[str] = []
+GITHUB_REPO: str = "githubnext/monaspace"
 
-# Font configurations: [(download_url, filename, registry_name)]
+# Font configurations: [(path in the repository, filename, registry_name)]
 fonts = [
     (
-        "https://raw.githubusercontent.com/githubnext/monaspace/main/fonts/NerdFonts/Monaspace%20Argon/MonaspaceArgonNF-Regular.otf",
+        "fonts/NerdFonts/Monaspace%20Argon/MonaspaceArgonNF-Regular.otf",
         "MonaspaceArgonNF-Regular.otf",
         "MonaspaceArgonNF-Regular (OpenType)",
     ),
     (
-        "https://raw.githubusercontent.com/githubnext/monaspace/main/fonts/Variable%20Fonts/Monaspace%20Argon/Monaspace%20Argon%20Var.ttf",
+        "fonts/Variable%20Fonts/Monaspace%20Argon/Monaspace%20Argon%20Var.ttf",
         "Monaspace Argon Var.ttf",
         "Monaspace Argon Var (TrueType)",
     ),
@@ -37,6 +39,22 @@ else:
     fonts_folder = Path.home() / ".local/share/fonts/"
 
 
+def dl_link(path: str) -> str:
+    """
+    Returns the download link of a file of the repository at the latest
+    release (the locked one with --locked), not at the branch head, so it
+    matches the lockfile
+    """
+    return f"https://raw.githubusercontent.com/{GITHUB_REPO}/{df.releases.latest_tag(GITHUB_REPO)}/{path}"
+
+
+def download_urls() -> List[str]:
+    """
+    Returns the files downloaded by install, so they can be prefetched
+    """
+    return [dl_link(path) for path, _, _ in fonts]
+
+
 def is_compatible() -> Union[bool, str]:
     return platform.system() in ["Linux", "Windows", "Darwin"]
 
@@ -46,10 +64,10 @@ def install(config: ModuleConfig, stdout: io.TextIOWrapper) -> None:
     with tempfile.TemporaryDirectory() as temp_dir_str:
         temp_dir = Path(temp_dir_str)
 
-        for dl_link, font_name, registry_name in fonts:
+        for path, font_name, registry_name in fonts:
             print(f"Downloading {font_name}...")
             download_path = temp_dir / font_name
-            df.download_file(dl_link, download_path)
+            df.download_file(dl_link(path), download_path)
 
             print(f"Installing {font_name}...")
             # Install the font by copying it to the local fonts directory
@@ -81,7 +99,7 @@ def install(config: ModuleConfig, stdout: io.TextIOWrapper) -> None:
             # Update the font cache if fc-cache is installed
             print("Updating font cache...")
             try:
-                subprocess.run(
+                df.run_process(
                     ["fc-cache", "-f"], stdout=subprocess.PIPE, stderr=subprocess.PIPE, stdin=subprocess.DEVNULL, text=True
                 )
             except FileNotFoundError:
@@ -1,14 +1,13 @@
 import io
-import platform
 import shutil
 import subprocess
 import tempfile
 from pathlib import Path
 from typing import List, Union
 
-import requests
-
 import df
+import df.host
+import df.releases
 from df.config import ModuleConfig
 
 ID: str = "neovide"
@@ -20,14 +19,28 @@ DESCRIPTION: str = (
 )
 DEPENDENCIES: List[str] = []
 CONFLICTING: List[str] = []
+GITHUB_REPO: str = "neovide/neovide"
 
 VERSION: str = "1.0.3"
 
-release_url = "https://github.com/neovide/neovide/releases/latest"
+
+def dl_link(version: str) -> str:
+    """
+    Returns the download link of the AppImage of the specified version
+    """
+    return f"https://github.com/{GITHUB_REPO}/releases/download/{version}/neovide.AppImage"
+
+
+def download_urls() -> List[str]:
+    """
+    Returns the files downloaded by install, so they can be prefetched
+    """
+    return [dl_link(df.releases.latest_tag(GITHUB_REPO))]
 
 
 def is_compatible() -> Union[bool, str]:
-    return platform.system() == "Linux" and platform.machine() in ["x86_64"]
+    host = df.host.facts()
+    return host.os == "linux" and host.arch == "x86_64"
 
 
 def install(config: ModuleConfig, stdout: io.TextIOWrapper) -> None:
@@ -36,8 +49,9 @@ def install(config: ModuleConfig, stdout: io.TextIOWrapper) -> None:
         print("Downloading Neovide...")
         temp_dir = Path(temp_dir_str)
         download_path = temp_dir / "neovide.AppImage"
-        link = f"{release_url}/download/neovide.AppImage"
-        df.download_file(link, download_path)
+        # The latest release, or the locked one with --locked
+        latest_version = df.releases.latest_tag(GITHUB_REPO)
+        df.download_file(dl_link(latest_version), download_path)
         # print("Unzipping Neovide...")
         # shutil.unpack_archive(download_path, temp_dir)
 
@@ -49,7 +63,7 @@ def install(config: ModuleConfig, stdout: io.TextIOWrapper) -> None:
         # This is especially useful for running inside distrobox containers
         neovide_path = download_path
         neovide_path.chmod(0o755)
-        subprocess.run(
+        df.run_process(
             [neovide_path, "--appimage-extract"],
             cwd=temp_dir,
             stdout=subprocess.PIPE,
@@ -92,7 +106,6 @@ MimeType=text/english;text/plain;text/x-makefile;text/x-c++hdr;text/x-c++src;tex
         icon_path.unlink(missing_ok=True)
         shutil.copyfile(icon_src_path, icon_path)
         # Save the installed version
-        latest_version = requests.get(release_url).url.split("/")[-1]
         config.set("version", latest_version)
 
 
@@ -107,7 +120,7 @@ def uninstall(config: ModuleConfig, stdout: io.TextIOWrapper) -> None:
 
 
 def has_update(config: ModuleConfig) -> Union[bool, str]:
-    latest_version = requests.get(release_url).url.split("/")[-1]
+    latest_version = df.releases.latest_tag(GITHUB_REPO)
     current_version = config.get("version", "")
     return str(current_version) != latest_version
 
@@ -18,6 +18,14 @@ dl_url = "https://raw.githubusercontent.com/ohmyzsh/ohmyzsh/master/tools/install
 oh_my_zsh_path = Path.home() / ".oh-my-zsh"
 
 
+def download_urls() -> List[str]:
+    """
+    Returns the files downloaded by install, so they can be prefetched
+    """
+    # The installer is only used if oh-my-zsh is not installed yet
+    return [] if oh_my_zsh_path.exists() else [dl_url]
+
+
 def is_compatible() -> Union[bool, str]:
     return platform.system() in ["Linux", "Darwin"]
 
@@ -26,7 +34,7 @@ def install(config: ModuleConfig, stdout: io.TextIOWrapper) -> None:
     # If the oh-my-zsh directory already exists, don't install, just update
     if oh_my_zsh_path.exists():
         print("Oh My Zsh already installed, updating...")
-        ret = subprocess.run(
+        ret = df.run_process(
             ["zsh", oh_my_zsh_path / "tools" / "upgrade.sh"],
             check=False,
             stdout=subprocess.PIPE,
@@ -43,7 +51,7 @@ def install(config: ModuleConfig, stdout: io.TextIOWrapper) -> None:
             dl_path = Path(temp_dir) / "install.sh"
             df.download_file(dl_url, dl_path)
             print("Running installer...")
-            subprocess.run(
+            df.run_process(
                 ["sh", dl_path, "--unattended", "--keep-zshrc"],
                 check=True,
                 env={
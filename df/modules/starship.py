@@ -6,9 +6,9 @@ import tempfile
 from pathlib import Path
 from typing import List, Union
 
-import requests
-
 import df
+import df.host
+import df.releases
 from df.config import ModuleConfig
 
 ID: str = "starship"
@@ -18,15 +18,39 @@ DEPENDENCIES: List[str] = []
 if platform.system() == "Windows":
     DEPENDENCIES = ["windows_local_bin"]
 CONFLICTING: List[str] = []
+GITHUB_REPO: str = "starship/starship"
 
-release_url = "https://github.com/starship/starship/releases/latest"
-script_link = "https://starship.rs/install.sh"
 bin_dir = Path.home() / ".local" / "bin"
 
 
+def script_link(version: str) -> str:
+    """
+    Returns the download link of the installer script of the specified version
+    """
+    return f"https://raw.githubusercontent.com/{GITHUB_REPO}/{version}/install/install.sh"
+
+
+def windows_dl_link(version: str) -> str:
+    """
+    Returns the download link of the Windows release for the specified version
+    """
+    arch = df.host.facts().arch
+    return f"https://github.com/starship/starship/releases/download/{version}/starship-{arch}-pc-windows-msvc.zip"
+
+
+def download_urls() -> List[str]:
+    """
+    Returns the files downloaded by install, so they can be prefetched
+    """
+    if platform.system() == "Windows":
+        return [windows_dl_link(df.releases.latest_tag(GITHUB_REPO))]
+    return [script_link(df.releases.latest_tag(GITHUB_REPO))]
+
+
 def is_compatible() -> Union[bool, str]:
-    return (platform.system() in ["Linux", "Darwin"] and platform.machine() in ["x86_64", "aarch64", "arm64"]) or (
-        platform.system() == "Windows" and platform.machine() in ["AMD64", "x86_64"]
+    host = df.host.facts()
+    return (host.os in ["linux", "darwin"] and host.arch in ["x86_64", "aarch64"]) or (
+        host.os == "windows" and host.arch == "x86_64"
     )
 
 
@@ -35,15 +59,8 @@ def install(config: ModuleConfig, stdout: io.TextIOWrapper) -> None:
         with tempfile.TemporaryDirectory() as temp_dir_str:
             temp_dir = Path(temp_dir_str)
             print("Downloading Starship...")
-            latest_version = requests.get(release_url).url.split("/")[-1]
-            arch = platform.machine().lower()
-            if arch in ["amd64", "x86_64"]:
-                arch = "x86_64"
-            elif arch == "aarch64":
-                arch = "aarch64"
-            download_url = (
-                f"https://github.com/starship/starship/releases/download/{latest_version}/starship-{arch}-pc-windows-msvc.zip"
-            )
+            latest_version = df.releases.latest_tag(GITHUB_REPO)
+            download_url = windows_dl_link(latest_version)
             download_path = temp_dir / "starship.zip"
             df.download_file(download_url, download_path)
             print("Unzipping Starship...")
@@ -56,14 +73,16 @@ def install(config: ModuleConfig, stdout: io.TextIOWrapper) -> None:
         with tempfile.TemporaryDirectory() as temp_dir_str:
             temp_dir = Path(temp_dir_str)
             script_path = temp_dir / "install.sh"
+            # The latest release, or the locked one with --locked
+            latest_version = df.releases.latest_tag(GITHUB_REPO)
 
             print("Downloading Starship installer...")
-            df.download_file(script_link, script_path)
+            df.download_file(script_link(latest_version), script_path)
             bin_dir.mkdir(parents=True, exist_ok=True)
 
             print("Installing Starship...")
-            result = subprocess.run(
-                ["sh", str(script_path), "-b", str(bin_dir), "-y"],
+            result = df.run_process(
+                ["sh", str(script_path), "-b", str(bin_dir), "-v", latest_version, "-y"],
                 check=True,
                 stdout=subprocess.PIPE,
                 stderr=subprocess.PIPE,
@@ -74,8 +93,7 @@ def install(config: ModuleConfig, stdout: io.TextIOWrapper) -> None:
                 stdout.write(result.stdout)
             if result.stderr:
                 stdout.write(result.stderr)
-            # Save the (probably) installed version
-            latest_version = requests.get(release_url).url.split("/")[-1]
+            # Save the installed version
             config.set("version", latest_version)
 
 
@@ -88,7 +106,7 @@ def uninstall(config: ModuleConfig, stdout: io.TextIOWrapper) -> None:
 
 
 def has_update(config: ModuleConfig) -> Union[bool, str]:
-    latest_version = requests.get(release_url).url.split("/")[-1]
+    latest_version = df.releases.latest_tag(GITHUB_REPO)
     current_version = config.get("version", "")
     return str(current_version) != latest_version
 
@@ -1,10 +1,10 @@
 import io
-import os
 import subprocess
 from pathlib import Path
 from typing import List, Union
 
 import df
+import df.host
 from df.config import ModuleConfig
 
 ID: str = "termux_config"
@@ -17,17 +17,8 @@ target_path = Path.home() / ".termux/termux.properties"
 target_path_font = Path.home() / ".termux/font.ttf"
 
 
-def running_in_termux() -> bool:
-    prefix = os.environ.get("PREFIX")
-    version = os.environ.get("TERMUX_VERSION")
-    if prefix and version:
-        return True
-    else:
-        return False
-
-
 def is_compatible() -> Union[bool, str]:
-    return running_in_termux()
+    return df.host.facts().in_termux
 
 
 def install(config: ModuleConfig, stdout: io.TextIOWrapper) -> None:
@@ -43,7 +34,7 @@ def install(config: ModuleConfig, stdout: io.TextIOWrapper) -> None:
 
     print("Reloading settings...")
     try:
-        subprocess.run(
+        df.run_process(
             ["termux-reload-settings"],
             stdout=subprocess.PIPE,
             stderr=subprocess.PIPE,
@@ -59,7 +50,7 @@ def uninstall(config: ModuleConfig, stdout: io.TextIOWrapper) -> None:
 
     print("Reloading settings...")
     try:
-        subprocess.run(
+        df.run_process(
             ["termux-reload-settings"],
             stdout=subprocess.PIPE,
             stderr=subprocess.PIPE,
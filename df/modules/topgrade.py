@@ -1,13 +1,8 @@
 import io
 import platform
-import shutil
-import tempfile
-from pathlib import Path
 from typing import List, Union
 
-import requests
-
-import df
+import df.assets
 from df.config import ModuleConfig
 
 ID: str = "topgrade"
@@ -17,72 +12,37 @@ DEPENDENCIES: List[str] = []
 if platform.system() == "Windows":
     DEPENDENCIES = ["windows_local_bin"]
 CONFLICTING: List[str] = []
+GITHUB_REPO: str = "topgrade-rs/topgrade"
+
+RELEASE = df.assets.BinaryRelease(
+    GITHUB_REPO,
+    "topgrade",
+    {
+        "linux-x86_64": "topgrade-{tag}-{arch}-unknown-linux-{libc}.tar.gz",
+        "linux-aarch64": "topgrade-{tag}-{arch}-unknown-linux-{libc}.tar.gz",
+        "darwin": "topgrade-{tag}-{arch}-apple-darwin.tar.gz",
+        "windows-x86_64": "topgrade-{tag}-{arch}-pc-windows-msvc.zip",
+    },
+)
 
 
-def dl_link(pltform: str, arch: str) -> str:
+def download_urls() -> List[str]:
     """
-    Returns the download link for the latest version
+    Returns the files downloaded by install, so they can be prefetched
     """
-    api_url = "https://github.com/topgrade-rs/topgrade/releases/latest"
-    response = requests.get(api_url)
-    latest_version = response.url.split("/")[-1]
-    download_base = "https://github.com/topgrade-rs/topgrade/releases/download"
-    if pltform == "linux":
-        libc, version = platform.libc_ver()
-        libc = "gnu" if libc == "glibc" else "musl"
-        return f"{download_base}/{latest_version}/topgrade-{latest_version}-{arch}-unknown-linux-{libc}.tar.gz"
-    elif pltform == "windows":
-        return f"{download_base}/{latest_version}/topgrade-{latest_version}-x86_64-pc-windows-msvc.zip"
-    elif pltform == "darwin":
-        return f"{download_base}/{latest_version}/topgrade-{latest_version}-{arch}-apple-darwin.tar.gz"
-    else:
-        raise ValueError(f"Unsupported platform {pltform}")
+    return RELEASE.download_urls()
 
 
 def is_compatible() -> Union[bool, str]:
-    return (
-        (platform.system() == "Linux" and platform.machine() in ["x86_64", "aarch64"])
-        or (platform.system() == "Darwin" and platform.machine() in ["x86_64", "aarch64", "arm64"])
-        or (platform.system() == "Windows" and platform.machine() == "AMD64")
-    )
+    return RELEASE.is_compatible()
 
 
 def install(config: ModuleConfig, stdout: io.TextIOWrapper) -> None:
-    with tempfile.TemporaryDirectory() as temp_dir_str:
-        print("Downloading topgrade...")
-        temp_dir = Path(temp_dir_str)
-        pf = platform.system().lower()
-        arch = platform.machine().lower()
-        if arch in ["amd64", "AMD64"]:
-            arch = "x86_64"
-        elif arch == "arm64":
-            arch = "aarch64"
-        link = dl_link(pf, arch)
-        if pf == "windows":
-            download_path = temp_dir / "topgrade.zip"
-            df.download_file(link, download_path)
-            print("Unzipping topgrade...")
-            shutil.unpack_archive(download_path, temp_dir)
-            topgrade_path = temp_dir / "topgrade.exe"
-        else:
-            download_path = temp_dir / "topgrade.tar.gz"
-            df.download_file(link, download_path)
-            print("Unpacking topgrade...")
-            shutil.unpack_archive(download_path, temp_dir)
-            topgrade_path = temp_dir / "topgrade"
-            topgrade_path.chmod(0o755)
-
-        print("Installing topgrade...")
-        bin_dir = Path.home() / ".local" / "bin"
-        bin_dir.mkdir(parents=True, exist_ok=True)
-        topgrade_exec = (bin_dir / "topgrade.exe") if pf == "windows" else (bin_dir / "topgrade")
-        shutil.copy(topgrade_path, topgrade_exec)
+    RELEASE.install(config)
 
 
 def uninstall(config: ModuleConfig, stdout: io.TextIOWrapper) -> None:
-    bin_dir = Path.home() / ".local" / "bin"
-    topgrade_exec = (bin_dir / "topgrade.exe") if platform.system() == "Windows" else (bin_dir / "topgrade")
-    (bin_dir / topgrade_exec).unlink(missing_ok=True)
+    RELEASE.uninstall()
 
 
 def has_update(config: ModuleConfig) -> Union[bool, str]:
@@ -5,6 +5,7 @@ from pathlib import Path
 from typing import List, Union
 
 import df
+import df.fingerprint
 from df.config import ModuleConfig
 
 ID: str = "zsh_config"
@@ -34,6 +35,8 @@ def install(config: ModuleConfig, stdout: io.TextIOWrapper) -> None:
     else:
         print("Local zshrc config already exists, not overwriting")
         print(f"Look at {source_local_path} for an example")
+    # Reinstall if the local config was removed (see df.fingerprint)
+    df.fingerprint.record(target_local_path)
 
 
 def uninstall(config: ModuleConfig, stdout: io.TextIOWrapper) -> None:
@@ -0,0 +1,57 @@
+import os
+from pathlib import Path
+
+
+def cache_dir(*parts: str) -> Path:
+    """Returns the cache directory of this tool (or a subdirectory of it)
+    Uses $XDG_CACHE_HOME if set, otherwise ~/.cache/df
+    The directory is not created, use ensure_dir for that
+    """
+    base = os.environ.get("XDG_CACHE_HOME")
+    root = Path(base) if base else Path.home() / ".cache"
+    return root.joinpath("df", *parts)
+
+
+def ensure_dir(path: Path) -> Path:
+    """Create the given directory (and its parents) if needed and return it"""
+    path.mkdir(parents=True, exist_ok=True)
+    return path
+
+
+def wheelhouse_dir(dotfiles_dir: str) -> Path:
+    """Returns the directory of pre-downloaded wheels for the venv
+    Uses $DF_WHEELHOUSE if set, otherwise <dotfiles_dir>/.wheelhouse
+    (dotfiles.py uses the same directory when creating the venv)
+    """
+    return Path(os.environ.get("DF_WHEELHOUSE") or os.path.join(dotfiles_dir, ".wheelhouse"))
+
+
+def venv_python(dotfiles_dir: str) -> Path:
+    """Returns the interpreter of the venv created by dotfiles.py
+    (sys.executable is the system interpreter when it runs the venv in process)
+    """
+    if os.name == "nt":
+        return Path(dotfiles_dir, ".venv", "Scripts", "python.exe")
+    return Path(dotfiles_dir, ".venv", "bin", "python")
+
+
+def resource_path(name: str) -> Path:
+    """Returns a real filesystem path of the resource file df/<name>
+    When running from a zipapp, the file is extracted into the cache
+    directory on first use (keyed by its content, so it is only extracted
+    again if it changed).
+    """
+    path = Path(__file__).parent / name
+    if path.is_file():
+        return path
+    import hashlib
+    import importlib.resources
+
+    data = importlib.resources.files("df").joinpath(name).read_bytes()
+    extracted = cache_dir("resources", hashlib.sha256(data).hexdigest()[:16], name)
+    if not extracted.is_file():
+        ensure_dir(extracted.parent)
+        tmp_path = extracted.with_name(f"{name}.{os.getpid()}.tmp")
+        tmp_path.write_bytes(data)
+        os.replace(tmp_path, extracted)
+    return extracted
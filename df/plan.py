@@ -0,0 +1,286 @@
+"""
+Dry-run plans of install, update and uninstall runs (--plan)
+
+A plan lists what a run would do to every module, grouped into the stages
+that can run in parallel (see df.scheduler.dependency_levels), together with
+the bytes it would download and an estimate of how long it would take.
+Download sizes come from the artifact cache (already cached files are not
+downloaded again), the release metadata of GitHub or a HEAD request. Durations
+are estimated from the timings of past runs (see df.metrics), the run is
+simulated like df.scheduler.run_graph runs it with --jobs.
+Nothing is installed and no files are downloaded while planning, but
+upstream metadata is queried unless --offline is given: the asset lists of
+releases (for their sizes), HEAD requests for other downloads and, for
+modules whose download_urls() needs it (e.g. starship on Windows), the latest
+release.
+"""
+
+import concurrent.futures
+import heapq
+from typing import Any, Callable, Dict, Iterable, List, Optional, Tuple
+
+import requests
+
+import df
+import df.artifacts
+import df.fingerprint
+import df.lockfile
+import df.metrics
+import df.releases
+import df.scheduler
+from df.config import Config
+from df.modules import MODULES
+
+# Actions, which do not run the module
+SKIP = "skip"
+ERROR = "error"
+# Metrics phase used to estimate each action
+ACTION_PHASES = {"install": "install", "reinstall": "install", "update": "update", "uninstall": "uninstall"}
+
+
+class PlannedAction:
+    """What a run would do to a single module
+    action: "install", "reinstall", "update", "uninstall", SKIP or ERROR
+    reason: why the module is skipped (or fails), shown in the plan
+    downloads: (size in bytes or None if unknown, already cached) by url
+    estimate: estimated duration in seconds, None if there are no recorded runs
+    """
+
+    def __init__(self, module_id: str, action: str, reason: str = "") -> None:
+        self.module_id = module_id
+        self.action = action
+        self.reason = reason
+        self.downloads: Dict[str, Tuple[Optional[int], bool]] = {}
+        self.estimate: Optional[float] = None
+
+    @property
+    def runs(self) -> bool:
+        return self.action not in (SKIP, ERROR)
+
+
+def format_size(size: float) -> str:
+    for unit in ["B", "KiB", "MiB"]:
+        if size < 1024:
+            return f"{size:.0f} {unit}" if unit == "B" else f"{size:.1f} {unit}"
+        size /= 1024
+    return f"{size:.1f} GiB"
+
+
+def format_duration(seconds: float) -> str:
+    if seconds < 1:
+        return f"{seconds * 1000:.0f}ms"
+    if seconds < 60:
+        return f"{seconds:.1f}s"
+    return f"{int(seconds // 60)}m{int(seconds % 60):02d}s"
+
+
+def download_size(url: str, release_size: Optional[int] = None) -> Tuple[Optional[int], bool]:
+    """Returns the size of the file at url (None if unknown) and whether it is
+    already in the artifact cache, which would only revalidate it
+    release_size is the size reported by the release metadata, if known.
+    """
+    if df.ARTIFACT_CACHE_ENABLED:
+        cache = df.artifacts.artifact_cache()
+        sha256 = df.lockfile.locked_digest(url)
+        path = cache.blob_path(sha256) if sha256 is not None else cache.lookup(url)
+        if path is not None and path.exists():
+            return path.stat().st_size, True
+    if release_size is not None:
+        return release_size, False
+    if df.releases.OFFLINE:
+        return None, False
+    try:
+        response = df.http_session().head(url, allow_redirects=True)
+        length = response.headers.get("Content-Length")
+        if response.ok and length is not None:
+            return int(length), False
+    except (requests.RequestException, ValueError):
+        pass
+    return None, False
+
+
+def _module_downloads(module: Any) -> Dict[str, Tuple[Optional[int], bool]]:
+    """Returns the sizes of the downloads of module, see download_size"""
+    if not hasattr(module, "download_urls"):
+        return {}
+    release_sizes: Dict[str, Optional[int]] = {}
+    release = getattr(module, "RELEASE", None)
+    if release is not None:
+        asset = release.resolve()
+        release_sizes[asset.url] = df.releases.asset_size(asset.repo, asset.tag, asset.name)
+    return {url: download_size(url, release_sizes.get(url)) for url in module.download_urls()}
+
+
+def simulate(nodes: List[str], dependencies: Callable[[str], Iterable[str]], durations: Dict[str, float], jobs: int) -> float:
+    """Returns how long running all nodes would take, if they are run like
+    df.scheduler.run_graph runs them and each takes its duration
+    """
+    node_set = set(nodes)
+    deps = {node: {dep for dep in dependencies(node) if dep in node_set and dep != node} for node in nodes}
+    pending = list(nodes)
+    running: List[Tuple[float, str]] = []
+    finished: set = set()
+    now = 0.0
+    while pending or running:
+        for node in list(pending):
+            if len(running) >= max(1, jobs):
+                break
+            if deps[node] <= finished:
+                pending.remove(node)
+                heapq.heappush(running, (now + durations.get(node, 0.0), node))
+        if not running:
+            break
+        now, node = heapq.heappop(running)
+        finished.add(node)
+    return now
+
+
+class Plan:
+    """The planned actions of a run of command ("install", "update" or "uninstall")"""
+
+    def __init__(self, command: str, actions: List[PlannedAction], jobs: int, sequential: bool = False) -> None:
+        self.command = command
+        self.actions = actions
+        self.jobs = 1 if sequential else max(1, jobs)
+        self.sequential = sequential
+
+    def dependencies(self, module_id: str) -> List[str]:
+        if self.sequential:
+            # Each action waits for the previous one
+            ids = [action.module_id for action in self.actions]
+            index = ids.index(module_id)
+            return ids[index - 1 : index]
+        return list(MODULES[module_id].DEPENDENCIES) if module_id in MODULES else []
+
+    def stages(self) -> List[List[PlannedAction]]:
+        by_id = {action.module_id: action for action in self.actions}
+        levels = df.scheduler.dependency_levels(list(by_id), self.dependencies)
+        return [[by_id[id] for id in level] for level in levels]
+
+    def collect(self) -> None:
+        """Look up the download sizes and duration estimates of all actions"""
+        estimates = {phase: df.metrics.estimates(phase) for phase in set(ACTION_PHASES.values())}
+        running = [action for action in self.actions if action.runs]
+        for action in running:
+            action.estimate = estimates[ACTION_PHASES[action.action]].get(action.module_id)
+        # Downloads are only looked up for installs/updates, in parallel since they may need HEAD requests
+        downloading = [action for action in running if action.action != "uninstall"]
+        with concurrent.futures.ThreadPoolExecutor(max_workers=df.releases.RELEASE_MAX_WORKERS) as executor:
+            futures = {action: executor.submit(_module_downloads, MODULES[action.module_id]) for action in downloading}
+            for action, future in futures.items():
+                try:
+                    action.downloads = future.result()
+                except Exception:
+                    # The size is unknown, the run itself reports the error
+                    action.downloads = {}
+
+    def download_bytes(self) -> Tuple[int, int, int]:
+        """Returns the bytes to download, the number of cached files and the number of files of unknown size"""
+        total = cached = unknown = 0
+        for action in self.actions:
+            for size, is_cached in action.downloads.values():
+                if is_cached:
+                    cached += 1
+                elif size is None:
+                    unknown += 1
+                else:
+                    total += size
+        return total, cached, unknown
+
+    def estimated_duration(self) -> float:
+        durations = {action.module_id: action.estimate or 0.0 for action in self.actions}
+        return simulate([action.module_id for action in self.actions], self.dependencies, durations, self.jobs)
+
+    def format(self) -> List[str]:
+        """Returns the lines of the human readable plan"""
+        jobs = "one after another" if self.sequential else f"--jobs {self.jobs}"
+        lines = [f"Plan for {self.command} of {len(self.actions)} module(s) ({jobs}):"]
+        width = max((len(action.module_id) for action in self.actions), default=0)
+        for number, stage in enumerate(self.stages(), 1):
+            lines.append(f"Stage {number}:")
+            for action in stage:
+                details = []
+                if action.reason:
+                    details.append(action.reason)
+                sizes = [size for size, is_cached in action.downloads.values() if not is_cached]
+                known = [size for size in sizes if size is not None]
+                if known:
+                    details.append(f"download {format_size(sum(known))}" + ("+?" if len(known) < len(sizes) else ""))
+                elif sizes:
+                    details.append("download size unknown")
+                if any(is_cached for _, is_cached in action.downloads.values()):
+                    details.append("cached")
+                if action.runs:
+                    details.append(f"~{format_duration(action.estimate)}" if action.estimate is not None else "no timings")
+                lines.append(f"  {action.action:10} {action.module_id:{width}}  {', '.join(details)}".rstrip())
+        total, cached, unknown = self.download_bytes()
+        notes = []
+        if cached:
+            notes.append(f"{cached} file(s) already cached")
+        if unknown:
+            notes.append(f"size of {unknown} file(s) unknown")
+        lines.append(f"Download: {format_size(total)}" + (f" ({', '.join(notes)})" if notes else ""))
+        untimed = [action.module_id for action in self.actions if action.runs and action.estimate is None]
+        duration = f"Estimated duration: ~{format_duration(self.estimated_duration())}"
+        if untimed:
+            duration += f" (no recorded runs of {', '.join(untimed)})"
+        lines.append(duration)
+        return lines
+
+
+def plan_install(module_ids: List[str], config: Config, force: bool, rerun: bool, jobs: int) -> Plan:
+    """Plan installing module_ids (with their dependencies already resolved), like df.cli.install_module"""
+    actions = []
+    for module_id in module_ids:
+        module_config = config.get_module(module_id)
+        if not module_config.get_installed():
+            actions.append(PlannedAction(module_id, "install"))
+        elif not force:
+            actions.append(PlannedAction(module_id, SKIP, "already installed"))
+        elif not rerun and df.fingerprint.unchanged(MODULES[module_id], module_config):
+            actions.append(PlannedAction(module_id, SKIP, "unchanged"))
+        else:
+            actions.append(PlannedAction(module_id, "reinstall"))
+    return Plan("install", actions, jobs)
+
+
+def plan_update(module_ids: List[str], config: Config, jobs: int) -> Plan:
+    """Plan updating module_ids, like df.cli.update_module"""
+    actions = []
+    for module_id in module_ids:
+        if module_id not in MODULES:
+            actions.append(PlannedAction(module_id, ERROR, "unknown module"))
+            continue
+        module = MODULES[module_id]
+        module_config = config.get_module(module_id)
+        if not module_config.get_installed():
+            actions.append(PlannedAction(module_id, ERROR, "not installed"))
+            continue
+        if not hasattr(module, "has_update") or not hasattr(module, "update"):
+            actions.append(PlannedAction(module_id, SKIP, "does not support updates"))
+            continue
+        try:
+            update_info = module.has_update(module_config)
+        except Exception as e:
+            actions.append(PlannedAction(module_id, ERROR, f"update check failed: {e}"))
+            continue
+        if not update_info:
+            actions.append(PlannedAction(module_id, SKIP, "up to date"))
+        elif hasattr(module, "GITHUB_REPO") and df.fingerprint.unchanged(module, module_config):
+            actions.append(PlannedAction(module_id, SKIP, "unchanged"))
+        else:
+            actions.append(PlannedAction(module_id, "update", f"to {update_info}" if isinstance(update_info, str) else ""))
+    return Plan("update", actions, jobs)
+
+
+def plan_uninstall(module_ids: List[str], config: Config) -> Plan:
+    """Plan uninstalling module_ids, like df.cli.uninstall_module (one after another)"""
+    actions = []
+    for module_id in module_ids:
+        if module_id not in MODULES:
+            actions.append(PlannedAction(module_id, ERROR, "unknown module"))
+        elif not config.get_module(module_id).get_installed():
+            actions.append(PlannedAction(module_id, SKIP, "not installed"))
+        else:
+            actions.append(PlannedAction(module_id, "uninstall"))
+    return Plan("uninstall", actions, 1, sequential=True)
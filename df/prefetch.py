@@ -0,0 +1,104 @@
+"""
+Background prefetching of module downloads
+
+As soon as the modules of a run are known, the files they will download
+(see the optional download_urls() function of modules) are fetched into
+the artifact cache in the background. When install() later calls
+df.download_file for a prefetched URL, it waits for the prefetch (if it is
+still running) and uses its result, instead of downloading it again.
+This overlaps the downloads of all modules with the installation of the
+first ones.
+"""
+
+import concurrent.futures
+import threading
+from pathlib import Path
+from typing import Any, Callable, Dict, Iterable, Optional
+
+import df
+import df.metrics
+import df.timeouts
+
+PREFETCH_MAX_WORKERS = 4
+
+_futures: Dict[str, "concurrent.futures.Future[Path]"] = {}
+_futures_lock = threading.Lock()
+
+
+class Prefetcher:
+    """Fetches the downloads of modules into the artifact cache in the background"""
+
+    def __init__(self, max_workers: int = PREFETCH_MAX_WORKERS) -> None:
+        self.executor = concurrent.futures.ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="prefetch")
+
+    def start(self, modules: Iterable[Any], should_fetch: Optional[Callable[[Any], bool]] = None) -> None:
+        """Start prefetching the downloads of the given modules
+        If given, should_fetch is called (in the background) for every module
+        first, its downloads are only fetched if it returns True
+        """
+        for module in modules:
+            if hasattr(module, "download_urls"):
+                self.executor.submit(self._prefetch_module, module, should_fetch)
+
+    def _prefetch_module(self, module: Any, should_fetch: Optional[Callable[[Any], bool]]) -> None:
+        try:
+            if should_fetch is not None and not should_fetch(module):
+                return
+            urls = module.download_urls()
+        except Exception:
+            # The module will report the error when it is installed
+            return
+        with df.metrics.Phase("prefetch", module.ID):
+            for url in urls:
+                self.fetch(url)
+
+    def fetch(self, url: str) -> None:
+        """Start fetching a single url (only once per process, unless it fails)"""
+        import df.artifacts
+        import df.lockfile
+
+        with _futures_lock:
+            if url in _futures:
+                return
+            future: "concurrent.futures.Future[Path]" = concurrent.futures.Future()
+            _futures[url] = future
+        try:
+            future.set_result(df.artifacts.artifact_cache().fetch(url, sha256=df.lockfile.locked_digest(url)))
+        except Exception as e:
+            # Forget the failure, so the url is fetched again if it is retried (e.g. by the TUI)
+            with _futures_lock:
+                if _futures.get(url) is future:
+                    del _futures[url]
+            future.set_exception(e)
+
+    def shutdown(self) -> None:
+        """Stop prefetching, downloads that were not started are cancelled"""
+        self.executor.shutdown(wait=False, cancel_futures=True)
+
+
+def prefetched_path(url: str) -> Optional[Path]:
+    """Returns the path of the prefetched file for url, waiting for the
+    prefetch to finish if it is still running (at most until the deadline
+    of the running action, see df.timeouts).
+    Returns None if url was not prefetched or prefetching it failed.
+    """
+    with _futures_lock:
+        future = _futures.get(url)
+    if future is None:
+        return None
+    try:
+        return future.result(timeout=df.timeouts.remaining())
+    except concurrent.futures.TimeoutError:
+        df.timeouts.check()
+        return None
+    except Exception:
+        return None
+
+
+def start(modules: Iterable[Any], should_fetch: Optional[Callable[[Any], bool]] = None) -> Prefetcher:
+    """Start prefetching the downloads of the given modules, see Prefetcher.start"""
+    prefetcher = Prefetcher()
+    if df.ARTIFACT_CACHE_ENABLED:
+        # Without the artifact cache, downloads are not shared with install()
+        prefetcher.start(modules, should_fetch)
+    return prefetcher
@@ -0,0 +1,190 @@
+"""
+Startup profiler, enabled with --profile-startup or DF_PROFILE_STARTUP=1
+
+Records how long every import, every module load of the registry (see
+df.modules) and every platform probe (platform.system() and friends) takes.
+At exit, a table sorted by self time is printed to stderr, or a Chrome
+trace (also readable by speedscope) is written if a file is given with
+--profile-startup-trace FILE or DF_PROFILE_STARTUP=FILE.json.
+
+This module must not import df, since dotfiles.py loads it (by path) before
+df is imported, so the imports of df itself are included.
+"""
+
+import atexit
+import builtins
+import contextlib
+import functools
+import json
+import os
+import platform
+import sys
+import threading
+import time
+from typing import Any, Callable, Iterator, List, Optional
+
+PLATFORM_PROBES = ["system", "machine", "release", "version", "uname", "node", "libc_ver", "mac_ver", "win32_ver"]
+
+
+class Span:
+    """A timed span, nested spans are its children"""
+
+    def __init__(self, name: str, category: str, start: float, depth: int) -> None:
+        self.name = name
+        self.category = category
+        self.start = start
+        self.end = start
+        self.depth = depth
+        self.children_time = 0.0
+
+    @property
+    def duration(self) -> float:
+        return self.end - self.start
+
+    @property
+    def self_time(self) -> float:
+        return self.duration - self.children_time
+
+
+class StartupProfiler:
+    """Collects spans of the main thread, from start() until exit"""
+
+    def __init__(self, trace_file: Optional[str] = None) -> None:
+        self.trace_file = trace_file
+        self.origin = time.perf_counter()
+        self.spans: List[Span] = []
+        self.stack: List[Span] = []
+        self.thread = threading.get_ident()
+        self.original_import: Callable[..., Any] = builtins.__import__
+
+    @contextlib.contextmanager
+    def span(self, name: str, category: str) -> Iterator[None]:
+        """Record the time spent in the with block (only on the main thread)"""
+        if threading.get_ident() != self.thread:
+            yield
+            return
+        span = Span(name, category, time.perf_counter(), len(self.stack))
+        self.stack.append(span)
+        try:
+            yield
+        finally:
+            span.end = time.perf_counter()
+            self.stack.pop()
+            if self.stack:
+                self.stack[-1].children_time += span.duration
+            self.spans.append(span)
+
+    def _import(self, name: str, globals: Any = None, locals: Any = None, fromlist: Any = (), level: int = 0) -> Any:
+        module_name = _absolute_name(name, globals, level)
+        module = sys.modules.get(module_name)
+        if module is not None:
+            # Already imported, but `from package import submodule` may still import something
+            missing = [item for item in fromlist or () if item != "*" and not hasattr(module, item)]
+            if not missing:
+                return self.original_import(name, globals, locals, fromlist, level)
+            module_name = f"{module_name}.{missing[0]}"
+        with self.span(module_name, "import"):
+            return self.original_import(name, globals, locals, fromlist, level)
+
+    def _wrap_probe(self, name: str) -> None:
+        original = getattr(platform, name)
+
+        @functools.wraps(original)
+        def probe(*args: Any, **kwargs: Any) -> Any:
+            caller = sys._getframe(1).f_globals.get("__name__", "?")
+            if caller == "platform":
+                # Called by another probe
+                return original(*args, **kwargs)
+            with self.span(f"platform.{name}() in {caller}", "probe"):
+                return original(*args, **kwargs)
+
+        setattr(platform, name, probe)
+
+    def start(self) -> None:
+        """Start recording imports and platform probes, report at exit"""
+        builtins.__import__ = self._import
+        for name in PLATFORM_PROBES:
+            if hasattr(platform, name):
+                self._wrap_probe(name)
+        atexit.register(self.report)
+
+    def report(self) -> None:
+        """Print the table or write the trace file"""
+        builtins.__import__ = self.original_import
+        if self.trace_file:
+            self.write_trace(self.trace_file)
+            print(f"Startup trace written to {self.trace_file}", file=sys.stderr)
+        else:
+            self.print_table()
+
+    def print_table(self, limit: int = 40) -> None:
+        total = max((span.end for span in self.spans), default=self.origin) - self.origin
+        top_level = sum(span.duration for span in self.spans if span.depth == 0)
+        print(f"\nStartup profile: {top_level * 1000:.1f} ms measured in {total * 1000:.1f} ms", file=sys.stderr)
+        print(f"{'self ms':>9} {'total ms':>9}  {'category':8}  name", file=sys.stderr)
+        for span in sorted(self.spans, key=lambda span: span.self_time, reverse=True)[:limit]:
+            print(
+                f"{span.self_time * 1000:9.2f} {span.duration * 1000:9.2f}  {span.category:8}  {span.name}",
+                file=sys.stderr,
+            )
+
+    def write_trace(self, path: str) -> None:
+        events = [
+            {
+                "name": span.name,
+                "cat": span.category,
+                "ph": "X",
+                "ts": (span.start - self.origin) * 1e6,
+                "dur": span.duration * 1e6,
+                "pid": os.getpid(),
+                "tid": 1,
+            }
+            for span in sorted(self.spans, key=lambda span: (span.start, -span.end))
+        ]
+        with open(path, "w") as f:
+            json.dump({"traceEvents": events, "displayTimeUnit": "ms"}, f)
+
+
+def _absolute_name(name: str, globals: Any, level: int) -> str:
+    """Returns the absolute name of a (possibly relative) import"""
+    if level == 0 or globals is None:
+        return name
+    package = globals.get("__package__") or globals.get("__name__", "")
+    if level > 1:
+        package = package.rsplit(".", level - 1)[0]
+    return f"{package}.{name}" if name else str(package)
+
+
+_profiler: Optional[StartupProfiler] = None
+
+
+def start_from_args(argv: List[str]) -> Optional[StartupProfiler]:
+    """Start the profiler if it is requested by argv (--profile-startup,
+    --profile-startup-trace FILE) or $DF_PROFILE_STARTUP (1 or a trace file)
+    Returns the running profiler, or None if profiling is disabled.
+    """
+    global _profiler
+    if _profiler is not None:
+        return _profiler
+    env = os.environ.get("DF_PROFILE_STARTUP", "")
+    trace_file: Optional[str] = env if env not in ("", "0", "1") else None
+    enabled = env not in ("", "0")
+    for i, arg in enumerate(argv):
+        if arg == "--profile-startup":
+            enabled = True
+        elif arg == "--profile-startup-trace" and i + 1 < len(argv):
+            enabled, trace_file = True, argv[i + 1]
+        elif arg.startswith("--profile-startup-trace="):
+            enabled, trace_file = True, arg.split("=", 1)[1]
+    if not enabled:
+        return None
+    _profiler = StartupProfiler(trace_file)
+    _profiler.start()
+    return _profiler
+
+
+def span(name: str, category: str) -> Any:
+    """Record a span if the profiler is running, otherwise do nothing"""
+    if _profiler is None:
+        return contextlib.nullcontext()
+    return _profiler.span(name, category)
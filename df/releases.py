@@ -0,0 +1,326 @@
+"""
+Resolver for the latest release of GitHub repositories
+
+The latest release is looked up by following the redirect of
+https://github.com/<repo>/releases/latest (no rate limited REST API calls).
+Answers are cached on disk (~/.cache/df/releases.json) for RELEASE_TTL
+seconds. In offline mode only cached answers are used.
+
+Modules that install GitHub releases should set GITHUB_REPO = "<org>/<repo>"
+so that the versions of all installed modules can be resolved concurrently
+in a single pass with resolve_modules().
+
+The assets of a release (see release_assets()) are cached on disk
+(~/.cache/df/release-assets.json) without expiry, since the assets of a
+published tag rarely change. If an expected asset is missing (e.g. the list
+was fetched while the assets were still being uploaded), the list is fetched
+again once per process. The digests of assets (see asset_digest()) are
+cached as well.
+"""
+
+import concurrent.futures
+import fnmatch
+import json
+import os
+import re
+import threading
+import time
+from typing import Any, Dict, Iterable, List, Optional, Set
+
+import requests
+
+import df
+import df.metrics
+import df.paths
+
+RELEASE_TTL = float(os.environ.get("DF_RELEASE_TTL", "3600"))
+RELEASE_MAX_WORKERS = 8
+OFFLINE = bool(os.environ.get("DF_OFFLINE"))
+
+# Checksum files published for a single asset, and lists of checksums for all assets
+CHECKSUM_FILES = ["{name}.sha256", "{name}.sha256sum", "{name}.sha256.txt"]
+CHECKSUM_LISTS = ["*checksums*.txt", "sha256sums*", "*.sha256sums", "checksums.sha256"]
+
+_cache: Optional[Dict[str, Any]] = None
+_cache_lock = threading.Lock()
+# Tags of a lockfile (see df.lockfile), used instead of looking anything up
+_locked_tags: Optional[Dict[str, str]] = None
+_assets_cache: Optional[Dict[str, Any]] = None
+_assets_cache_lock = threading.Lock()
+# Asset lists fetched by this process, which are not refreshed again
+_fetched_assets: Set[str] = set()
+
+
+class ReleaseLookupError(Exception):
+    """Raised when the latest release of a repository can not be resolved"""
+
+
+def set_offline(offline: bool) -> None:
+    """Enable or disable offline mode, in offline mode only cached answers are used"""
+    global OFFLINE
+    OFFLINE = offline
+
+
+def set_locked_tags(tags: Optional[Dict[str, str]]) -> None:
+    """Use the given tags (from a lockfile) as the latest tags, repositories
+    without a locked tag can not be resolved. None disables this again.
+    """
+    global _locked_tags
+    _locked_tags = tags
+
+
+def _cache_path() -> str:
+    return str(df.paths.cache_dir("releases.json"))
+
+
+def _load_cache() -> Dict[str, Any]:
+    """Returns the cache, must be called with _cache_lock held"""
+    global _cache
+    if _cache is None:
+        try:
+            with open(_cache_path(), "r") as f:
+                _cache = dict(json.load(f))
+        except (OSError, ValueError):
+            _cache = {}
+    return _cache
+
+
+def _save_cache() -> None:
+    """Atomically write the cache to disk, must be called with _cache_lock held"""
+    path = _cache_path()
+    try:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(_cache, f, indent=4)
+        os.replace(tmp_path, path)
+    except OSError:
+        # The cache is optional
+        pass
+
+
+def _lookup_latest_tag(repo: str) -> str:
+    """Ask GitHub for the tag of the latest release of repo"""
+    url = f"https://github.com/{repo}/releases/latest"
+    response = df.http_session().head(url, allow_redirects=False)
+    location = response.headers.get("Location", "")
+    if response.status_code not in (301, 302, 303, 307, 308) or "/releases/tag/" not in location:
+        raise ReleaseLookupError(f"Could not resolve the latest release of {repo} (HTTP {response.status_code})")
+    return location.rstrip("/").split("/")[-1]
+
+
+def latest_tag(repo: str, max_age: Optional[float] = None, save: bool = True) -> str:
+    """Returns the tag of the latest release of the GitHub repository repo
+    (e.g. "MordechaiHadad/bob" -> "v4.0.0")
+    Cached answers younger than max_age seconds (default RELEASE_TTL) are
+    used without network access. In offline mode any cached answer is used.
+    If the lookup fails, an outdated cached answer is used if available.
+    If a lockfile is used (see set_locked_tags), its tag is returned.
+    """
+    if _locked_tags is not None:
+        if repo not in _locked_tags:
+            raise ReleaseLookupError(f"{repo} is not in the lockfile, run 'dotfiles lock'")
+        return _locked_tags[repo]
+    if max_age is None:
+        max_age = RELEASE_TTL
+    with _cache_lock:
+        cached = _load_cache().get(repo)
+    if cached is not None and (OFFLINE or time.time() - cached["checked"] < max_age):
+        return str(cached["tag"])
+    if OFFLINE:
+        raise ReleaseLookupError(f"No cached release for {repo} (offline mode)")
+    try:
+        with df.metrics.Phase("resolve"):
+            tag = _lookup_latest_tag(repo)
+    except (requests.RequestException, ReleaseLookupError):
+        if cached is not None:
+            return str(cached["tag"])
+        raise
+    with _cache_lock:
+        _load_cache()[repo] = {"tag": tag, "checked": time.time()}
+        if save:
+            _save_cache()
+    return tag
+
+
+def resolve_many(repos: Iterable[str]) -> Dict[str, Optional[str]]:
+    """Resolve the latest tag of all given repositories concurrently
+    Returns a dict from repository to tag (None if it could not be resolved).
+    The disk cache is written once at the end.
+    """
+    unique_repos = sorted(set(repos))
+    results: Dict[str, Optional[str]] = {}
+    if not unique_repos:
+        return results
+    with concurrent.futures.ThreadPoolExecutor(max_workers=RELEASE_MAX_WORKERS) as executor:
+        futures = {repo: executor.submit(latest_tag, repo, None, False) for repo in unique_repos}
+        for repo, future in futures.items():
+            try:
+                results[repo] = future.result()
+            except (requests.RequestException, ReleaseLookupError):
+                results[repo] = None
+    with _cache_lock:
+        _load_cache()
+        _save_cache()
+    return results
+
+
+def resolve_modules(modules: Iterable[Any]) -> Dict[str, Optional[str]]:
+    """Resolve the latest release of all given modules, that define GITHUB_REPO
+    Should be called before calling has_update on many modules, so that
+    their lookups are answered from the cache.
+    """
+    repos: List[str] = [module.GITHUB_REPO for module in modules if hasattr(module, "GITHUB_REPO")]
+    return resolve_many(repos)
+
+
+def _assets_cache_path() -> str:
+    return str(df.paths.cache_dir("release-assets.json"))
+
+
+def _load_assets_cache() -> Dict[str, Any]:
+    """Returns the assets cache, must be called with _assets_cache_lock held"""
+    global _assets_cache
+    if _assets_cache is None:
+        try:
+            with open(_assets_cache_path(), "r") as f:
+                _assets_cache = dict(json.load(f))
+        except (OSError, ValueError):
+            _assets_cache = {}
+    return _assets_cache
+
+
+def _save_assets_cache() -> None:
+    """Atomically write the assets cache, must be called with _assets_cache_lock held"""
+    path = _assets_cache_path()
+    try:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(_assets_cache, f, indent=4)
+        os.replace(tmp_path, path)
+    except OSError:
+        pass
+
+
+def _lookup_assets(repo: str, tag: str) -> Dict[str, Dict[str, Any]]:
+    """Ask GitHub for the assets of a release
+    Uses the REST API (authenticated with $GITHUB_TOKEN or $GH_TOKEN if set),
+    which also returns the digests of the assets. If it is rate limited, the
+    asset list of the release page is used instead.
+    """
+    headers = {"Accept": "application/vnd.github+json"}
+    token = os.environ.get("GITHUB_TOKEN") or os.environ.get("GH_TOKEN")
+    if token:
+        headers["Authorization"] = f"Bearer {token}"
+    response = df.http_get(f"https://api.github.com/repos/{repo}/releases/tags/{tag}", headers=headers)
+    if response.ok:
+        return {
+            asset["name"]: {"url": asset["browser_download_url"], "digest": asset.get("digest"), "size": asset.get("size")}
+            for asset in response.json().get("assets", [])
+        }
+    response = df.http_get(f"https://github.com/{repo}/releases/expanded_assets/{tag}")
+    if not response.ok:
+        raise ReleaseLookupError(f"Could not list the assets of {repo} {tag} (HTTP {response.status_code})")
+    assets: Dict[str, Dict[str, Any]] = {}
+    for path in re.findall(rf'href="(/{re.escape(repo)}/releases/download/[^"]+)"', response.text):
+        assets[path.rsplit("/", 1)[-1]] = {"url": f"https://github.com{path}", "digest": None, "size": None}
+    return assets
+
+
+def release_assets(repo: str, tag: str, refresh: bool = False) -> Dict[str, Dict[str, Any]]:
+    """Returns the assets of the release tag of repo, as a dict from asset name
+    to {"url": download url, "digest": "sha256:<hex>" or None, "size": size in bytes or None}
+    With refresh, a cached list is fetched again (unless offline or it was
+    already fetched by this process), e.g. when an expected asset is missing.
+    """
+    key = f"{repo}@{tag}"
+    with _assets_cache_lock:
+        cached = _load_assets_cache().get(key)
+        refresh = refresh and not OFFLINE and key not in _fetched_assets
+    if cached is not None and not refresh:
+        return dict(cached)
+    if OFFLINE:
+        raise ReleaseLookupError(f"No cached assets for {repo} {tag} (offline mode)")
+    with df.metrics.Phase("resolve"):
+        assets = _lookup_assets(repo, tag)
+    with _assets_cache_lock:
+        _fetched_assets.add(key)
+        _load_assets_cache()[key] = assets
+        _save_assets_cache()
+    return assets
+
+
+def _parse_checksums(text: str, name: str, single_file: bool) -> Optional[str]:
+    """Returns the sha256 of name from a checksum file (sha256sum or BSD
+    format), a checksum file of a single asset may contain only the digest
+    """
+    for line in text.splitlines():
+        bsd = re.fullmatch(r"SHA256 \((.+)\) = ([0-9a-fA-F]{64})", line.strip())
+        if bsd is not None and bsd.group(1).rsplit("/", 1)[-1] == name:
+            return bsd.group(2).lower()
+        parts = line.split()
+        if not parts or not re.fullmatch(r"[0-9a-fA-F]{64}", parts[0]):
+            continue
+        if len(parts) == 1 and single_file:
+            return parts[0].lower()
+        if len(parts) > 1 and parts[1].lstrip("*").rsplit("/", 1)[-1] == name:
+            return parts[0].lower()
+    return None
+
+
+def _lookup_digest(assets: Dict[str, Dict[str, Any]], name: str) -> Optional[str]:
+    """Find the sha256 of the asset name in the checksum files of the release"""
+    candidates = [(pattern.format(name=name), True) for pattern in CHECKSUM_FILES]
+    candidates += [(pattern, False) for pattern in CHECKSUM_LISTS]
+    for pattern, single_file in candidates:
+        for asset_name, asset in sorted(assets.items()):
+            if asset_name == name or not fnmatch.fnmatchcase(asset_name.lower(), pattern.lower()):
+                continue
+            response = df.http_get(str(asset["url"]))
+            if not response.ok:
+                # A missing checksum file only means there is no digest to verify against
+                continue
+            digest = _parse_checksums(response.text, name, single_file)
+            if digest is not None:
+                return digest
+    return None
+
+
+def asset_digest(repo: str, tag: str, name: str) -> Optional[str]:
+    """Returns the sha256 hex digest of the asset name of the release tag of
+    repo, taken from the digests GitHub publishes for release assets or from
+    checksum files attached to the release.
+    Returns None if upstream publishes no checksum for the asset (or in
+    offline mode, if it was not looked up before).
+    """
+    assets = release_assets(repo, tag)
+    asset = assets.get(name)
+    if asset is None:
+        return None
+    if asset.get("sha256") is not None:
+        # Looked up before, "" if there is no checksum
+        return asset["sha256"] or None
+    digest = asset.get("digest") or ""
+    if digest.startswith("sha256:"):
+        sha256: Optional[str] = digest[len("sha256:") :].lower()
+    elif OFFLINE:
+        return None
+    else:
+        sha256 = _lookup_digest(assets, name)
+    with _assets_cache_lock:
+        cached = _load_assets_cache().get(f"{repo}@{tag}", {}).get(name)
+        if cached is not None:
+            cached["sha256"] = sha256 or ""
+            _save_assets_cache()
+    return sha256
+
+
+def asset_size(repo: str, tag: str, name: str) -> Optional[int]:
+    """Returns the size in bytes of the asset name of the release tag of repo,
+    None if GitHub did not report it (e.g. the API was rate limited)
+    """
+    asset = release_assets(repo, tag).get(name)
+    if asset is None or asset.get("size") is None:
+        return None
+    return int(asset["size"])
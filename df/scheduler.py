@@ -0,0 +1,199 @@
+"""
+Dependency aware executor for module actions
+
+Runs an action for every node of a dependency graph, up to `jobs` actions
+at the same time. An action is only started once all of its dependencies
+(that are part of the graph) have finished successfully.
+With a timeout, every action gets a deadline (see df.timeouts): once it
+passes, a watchdog cancels the action and kills its commands, actions that
+do not stop within WATCHDOG_GRACE are abandoned and reported as TIMEOUT.
+Before run_graph returns, abandoned actions get another WATCHDOG_GRACE to
+reach a check() and stop. One that is still running afterwards can not
+change the config anymore (df.config.Config.apply checks its deadline), but
+it may still hold its module lock and touch files until it exits.
+"""
+
+import concurrent.futures
+import contextvars
+import math
+import threading
+import time
+from typing import Any, Callable, Dict, Iterable, List, Optional, Set
+
+import df.timeouts
+
+# States of a node
+RUNNING = "running"  # The action was started (only reported to on_state)
+DONE = "done"  # The action was successful
+FAILED = "failed"  # The action returned False or raised an exception
+SKIPPED = "skipped"  # A dependency failed, so the action was not run
+NOT_RUN = "not_run"  # The run was stopped after a failure
+TIMEOUT = "timeout"  # The action did not finish before its deadline
+
+# Seconds an action gets to stop after its deadline passed, before it is abandoned
+WATCHDOG_GRACE = 10.0
+
+
+def dependency_levels(nodes: List[str], dependencies: Callable[[str], Iterable[str]]) -> List[List[str]]:
+    """Group the nodes into stages, all nodes of a stage can run in parallel
+    once all previous stages are done. Dependencies outside of nodes are ignored.
+    """
+    node_set = set(nodes)
+    level: Dict[str, int] = {}
+
+    def visit(node: str, visiting: Set[str]) -> int:
+        if node in level:
+            return level[node]
+        if node in visiting:
+            raise ValueError(f"Circular dependency detected involving module '{node}'")
+        visiting.add(node)
+        deps = [dep for dep in dependencies(node) if dep in node_set]
+        level[node] = 1 + max((visit(dep, visiting) for dep in deps), default=-1)
+        visiting.remove(node)
+        return level[node]
+
+    for node in nodes:
+        visit(node, set())
+    stages: List[List[str]] = [[] for _ in range(max(level.values(), default=-1) + 1)]
+    for node in nodes:
+        stages[level[node]].append(node)
+    return stages
+
+
+def _start(context: contextvars.Context, action: Callable[[str], bool], node: str) -> concurrent.futures.Future:
+    """Run action(node) in context on a new daemon thread, so an abandoned
+    action does not keep the process from exiting
+    """
+    future: concurrent.futures.Future = concurrent.futures.Future()
+
+    def run() -> None:
+        if not future.set_running_or_notify_cancel():
+            return
+        try:
+            future.set_result(context.run(action, node))
+        except BaseException as e:
+            future.set_exception(e)
+
+    threading.Thread(target=run, name=f"action-{node}", daemon=True).start()
+    return future
+
+
+def run_graph(
+    nodes: List[str],
+    dependencies: Callable[[str], Iterable[str]],
+    action: Callable[[str], bool],
+    jobs: int = 1,
+    continue_on_error: bool = False,
+    on_state: Optional[Callable[[str, str], None]] = None,
+    timeout: Optional[float] = None,
+) -> Dict[str, str]:
+    """Run action for all nodes, respecting their dependencies
+
+    Ready nodes are started in the order of nodes, so with jobs=1 this is
+    the same as running them one after another. If an action fails, only
+    the nodes depending on it are skipped if continue_on_error is set,
+    otherwise no new actions are started.
+    Each action runs in a copy of the current context (see contextvars).
+    If given, on_state is called with (node, state) whenever a node is
+    started or finished, from the thread calling run_graph.
+    If timeout is given, each action has timeout seconds to finish, an action
+    running out of time counts as failed. If run_graph is interrupted (e.g. by
+    KeyboardInterrupt), the running actions are cancelled and their commands
+    killed before the exception is raised.
+    Returns the state (DONE, FAILED, TIMEOUT, SKIPPED or NOT_RUN) of every node.
+    """
+    node_set = set(nodes)
+    deps = {node: {dep for dep in dependencies(node) if dep in node_set and dep != node} for node in nodes}
+    # Fail early on cycles
+    dependency_levels(nodes, dependencies)
+
+    states: Dict[str, str] = {}
+    pending = list(nodes)
+    running: Dict[concurrent.futures.Future, str] = {}
+    abandoned: Set[concurrent.futures.Future] = set()
+    stop = False
+
+    def set_state(node: str, state: str) -> None:
+        if state != RUNNING:
+            states[node] = state
+        if on_state is not None:
+            on_state(node, state)
+
+    def watchdog() -> Optional[float]:
+        """Cancel actions past their deadline and abandon those past the grace
+        period, returns the seconds until the next deadline to watch
+        """
+        nonlocal stop
+        now = time.monotonic()
+        next_check: Optional[float] = None
+        for future, node in list(running.items()):
+            deadline = deadlines[node]
+            if math.isinf(deadline.expires_at):
+                continue
+            if now >= deadline.expires_at:
+                deadline.expire()
+            if now >= deadline.expires_at + WATCHDOG_GRACE:
+                del running[future]
+                abandoned.add(future)
+                set_state(node, TIMEOUT)
+                if not continue_on_error:
+                    stop = True
+                continue
+            check_at = deadline.expires_at if not deadline.timed_out else deadline.expires_at + WATCHDOG_GRACE
+            next_check = check_at - now if next_check is None else min(next_check, check_at - now)
+        return max(0.0, next_check) if next_check is not None else None
+
+    deadlines: Dict[str, df.timeouts.ActionDeadline] = {}
+
+    def run_action(node: str) -> Any:
+        with df.timeouts.running(deadlines[node]):
+            return action(node)
+
+    try:
+        while pending or running:
+            # Skip nodes with failed dependencies (also transitively)
+            skipped = True
+            while skipped:
+                skipped = False
+                for node in list(pending):
+                    if any(states.get(dep) in (FAILED, TIMEOUT, SKIPPED) for dep in deps[node]):
+                        set_state(node, SKIPPED)
+                        pending.remove(node)
+                        skipped = True
+            # Start ready nodes
+            if not stop:
+                for node in list(pending):
+                    if len(running) >= max(1, jobs):
+                        break
+                    if all(states.get(dep) == DONE for dep in deps[node]):
+                        pending.remove(node)
+                        set_state(node, RUNNING)
+                        # Without a timeout, the deadline is only used to cancel the action
+                        deadlines[node] = df.timeouts.ActionDeadline(node, timeout if timeout is not None else math.inf)
+                        running[_start(contextvars.copy_context(), run_action, node)] = node
+            if not running:
+                break
+            finished, _ = concurrent.futures.wait(running, timeout=watchdog(), return_when=concurrent.futures.FIRST_COMPLETED)
+            for future in finished:
+                node = running.pop(future)
+                try:
+                    success = future.result()
+                except Exception:
+                    success = False
+                if deadlines[node].timed_out:
+                    set_state(node, TIMEOUT)
+                else:
+                    set_state(node, DONE if success else FAILED)
+                if states[node] != DONE and not continue_on_error:
+                    stop = True
+    except BaseException:
+        # Interrupted (e.g. Ctrl-C, which only reaches this thread): commands run
+        # in their own process group, so they have to be killed explicitly
+        for node in list(running.values()):
+            deadlines[node].expire(f"{node} was interrupted")
+        raise
+    for node in pending:
+        set_state(node, NOT_RUN)
+    # Give abandoned actions a last chance to stop, before the caller saves their results
+    concurrent.futures.wait(abandoned, timeout=WATCHDOG_GRACE)
+    return {node: states[node] for node in nodes}
@@ -0,0 +1,204 @@
+"""
+Timeouts and cancellation of module actions
+
+Every action run by df.scheduler.run_graph gets a deadline (ACTION_TIMEOUT,
+change it with --timeout or DF_ACTION_TIMEOUT), the phases of an action (see
+df.metrics.Phase) are limited by PHASE_TIMEOUTS and every command run with
+df.run_process by COMMAND_TIMEOUT, all of them within the action's deadline.
+
+Python code is cancelled cooperatively: check() raises ActionTimeoutError
+once a deadline passed, it runs whenever a phase starts and for every
+downloaded chunk (single network reads are bounded by the timeouts of
+df.http_session). Commands are started in their own process group, which is
+killed (SIGTERM, then SIGKILL) when their time is up. If an action does not
+reach a check in time, the watchdog of the scheduler expires its deadline
+(which kills its commands) and stops waiting for it.
+"""
+
+import contextlib
+import contextvars
+import math
+import os
+import signal
+import subprocess
+import threading
+import time
+from typing import Any, Iterator, Optional, Sequence, Set, Tuple
+
+ACTION_TIMEOUT = float(os.environ.get("DF_ACTION_TIMEOUT", "1800"))
+COMMAND_TIMEOUT = float(os.environ.get("DF_COMMAND_TIMEOUT", "900"))
+# Limits of phases (see df.metrics.Phase), in seconds
+PHASE_TIMEOUTS = {
+    "has_update": 120.0,
+    "resolve": 120.0,
+    "download": 1200.0,
+    "extract": 300.0,
+    "fc-cache": 300.0,
+}
+# Time a killed process group gets to exit after SIGTERM, before it gets SIGKILL
+KILL_GRACE = 5.0
+
+
+class ActionTimeoutError(Exception):
+    """Raised inside of an action when its deadline (or the limit of one of its phases) passed"""
+
+
+class ActionDeadline:
+    """The deadline of a running action, shared by all of its threads and commands"""
+
+    def __init__(self, name: str, seconds: float) -> None:
+        self.name = name
+        self.seconds = seconds
+        self.expires_at = time.monotonic() + seconds
+        # Why the action timed out, None while it did not
+        self.reason: Optional[str] = None
+        self.processes: Set["subprocess.Popen[Any]"] = set()
+        self.lock = threading.Lock()
+
+    @property
+    def timed_out(self) -> bool:
+        return self.reason is not None
+
+    def expire(self, reason: Optional[str] = None) -> None:
+        """Mark the action as timed out and kill its running commands, the
+        action itself stops at its next check()
+        """
+        with self.lock:
+            if self.reason is None:
+                self.reason = reason or f"{self.name} took longer than {self.seconds:g}s"
+            processes = list(self.processes)
+        for process in processes:
+            kill_process_group(process)
+
+
+_action: "contextvars.ContextVar[Optional[ActionDeadline]]" = contextvars.ContextVar("df_action_deadline", default=None)
+# Name, limit and expiry time of all running phases with a limit
+_phases: "contextvars.ContextVar[Tuple[Tuple[str, float, float], ...]]" = contextvars.ContextVar("df_phase_deadlines", default=())
+
+
+@contextlib.contextmanager
+def running(deadline: ActionDeadline) -> Iterator[ActionDeadline]:
+    """Run the with block as the action of deadline"""
+    token = _action.set(deadline)
+    try:
+        yield deadline
+    finally:
+        _action.reset(token)
+
+
+@contextlib.contextmanager
+def phase(name: str) -> Iterator[None]:
+    """Run the with block as phase name, limited by PHASE_TIMEOUTS[name] (if set)"""
+    check()
+    if name not in PHASE_TIMEOUTS:
+        yield
+        return
+    seconds = PHASE_TIMEOUTS[name]
+    token = _phases.set(_phases.get() + ((name, seconds, time.monotonic() + seconds),))
+    try:
+        yield
+    finally:
+        _phases.reset(token)
+
+
+def check() -> None:
+    """Raise ActionTimeoutError if the running action or one of its phases is out of time"""
+    action = _action.get()
+    now = time.monotonic()
+    if action is not None:
+        if now >= action.expires_at:
+            action.expire()
+        if action.reason is not None:
+            raise ActionTimeoutError(action.reason)
+    for name, seconds, expires_at in _phases.get():
+        if now >= expires_at:
+            reason = f"{name} took longer than {seconds:g}s"
+            if action is not None:
+                action.expire(reason)
+            raise ActionTimeoutError(reason)
+
+
+def remaining() -> Optional[float]:
+    """Returns the seconds left until the next deadline, None if there is none"""
+    expiry_times = [expires_at for _, _, expires_at in _phases.get()]
+    action = _action.get()
+    if action is not None and not math.isinf(action.expires_at):
+        expiry_times.append(action.expires_at)
+    if not expiry_times:
+        return None
+    return max(0.0, min(expiry_times) - time.monotonic())
+
+
+def kill_process_group(process: "subprocess.Popen[Any]") -> None:
+    """Terminate process and all of its children, kill them if they do not exit in time"""
+    if process.poll() is not None:
+        return
+    try:
+        if os.name == "posix":
+            os.killpg(process.pid, signal.SIGTERM)
+        else:
+            process.terminate()
+        try:
+            process.wait(KILL_GRACE)
+        except subprocess.TimeoutExpired:
+            if os.name == "posix":
+                os.killpg(process.pid, signal.SIGKILL)
+            else:
+                process.kill()
+    except ProcessLookupError:
+        pass  # Exited in the meantime
+
+
+def run(args: Sequence[Any], **kwargs: Any) -> "subprocess.CompletedProcess[Any]":
+    """
+    subprocess.run, but limited by COMMAND_TIMEOUT, the timeout argument (if
+    given) and the deadlines of the running action and its phases.
+    The command runs in its own process group, which is killed once it is
+    out of time. Like subprocess.run, subprocess.TimeoutExpired is raised if
+    the command itself took too long, ActionTimeoutError if the action (or
+    phase) it runs in is out of time.
+    """
+    check()
+    check_returncode = kwargs.pop("check", False)
+    input = kwargs.pop("input", None)
+    timeout = kwargs.pop("timeout", None)
+    limit = min(COMMAND_TIMEOUT, timeout) if timeout is not None else COMMAND_TIMEOUT
+    deadline = remaining()
+    if deadline is not None and deadline < limit:
+        limit = deadline
+        deadline_reached = True
+    else:
+        deadline_reached = False
+    if kwargs.pop("capture_output", False):
+        kwargs["stdout"] = kwargs["stderr"] = subprocess.PIPE
+    if input is not None:
+        kwargs["stdin"] = subprocess.PIPE
+    if os.name == "posix":
+        kwargs.setdefault("start_new_session", True)
+    action = _action.get()
+    with subprocess.Popen(args, **kwargs) as process:
+        if action is not None:
+            with action.lock:
+                action.processes.add(process)
+        try:
+            stdout, stderr = process.communicate(input, timeout=limit)
+        except subprocess.TimeoutExpired:
+            kill_process_group(process)
+            stdout, stderr = process.communicate()
+            if not deadline_reached:
+                raise subprocess.TimeoutExpired(args, limit, stdout, stderr) from None
+            # The deadline of the action or one of its phases passed
+            check()
+            raise ActionTimeoutError(f"{' '.join(map(str, args))} took longer than {limit:.1f}s") from None
+        except BaseException:
+            kill_process_group(process)
+            raise
+        finally:
+            if action is not None:
+                with action.lock:
+                    action.processes.discard(process)
+    # Killed because the action expired (e.g. by the watchdog)
+    check()
+    if check_returncode and process.returncode:
+        raise subprocess.CalledProcessError(process.returncode, args, stdout, stderr)
+    return subprocess.CompletedProcess(args, process.returncode, stdout, stderr)
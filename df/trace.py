@@ -0,0 +1,144 @@
+"""
+Chrome trace export of install, update and TUI runs (--trace FILE or DF_TRACE=FILE)
+
+Records nested spans of every thread, written at exit as a Chrome Trace
+Event file (open it in Perfetto, chrome://tracing or speedscope):
+- the run itself ("run")
+- every module action and its phases (see df.metrics.Phase, "phase")
+- every HTTP request of the shared session (see df.http_session, "http")
+- every command run with df.run_process (e.g. `bob install stable`, "process")
+- filesystem changes like links and backups (see df.symlink_path, "fs")
+Each worker thread gets its own track, so the overlap of parallel actions
+(--jobs) and background downloads (see df.prefetch) is visible.
+Without a running tracer, span() does nothing.
+"""
+
+import atexit
+import contextlib
+import functools
+import json
+import os
+import sys
+import threading
+import time
+from typing import Any, Callable, ContextManager, Dict, Iterator, List, Optional, TypeVar, cast
+
+F = TypeVar("F", bound=Callable[..., Any])
+
+
+class Tracer:
+    """Collects the spans of all threads and writes them to path"""
+
+    def __init__(self, path: str) -> None:
+        self.path = path
+        self.origin = time.perf_counter()
+        self.events: List[Dict[str, Any]] = []
+        self.thread_ids: Dict[int, int] = {}
+        self.lock = threading.Lock()
+
+    def _thread_id(self) -> int:
+        """Returns a small id of the current thread, must be called with self.lock held"""
+        ident = threading.get_ident()
+        if ident not in self.thread_ids:
+            self.thread_ids[ident] = len(self.thread_ids) + 1
+            self.events.append(
+                {
+                    "name": "thread_name",
+                    "ph": "M",
+                    "pid": os.getpid(),
+                    "tid": self.thread_ids[ident],
+                    "args": {"name": threading.current_thread().name},
+                }
+            )
+        return self.thread_ids[ident]
+
+    def add(self, name: str, category: str, start: float, end: float, args: Dict[str, Any]) -> None:
+        with self.lock:
+            self.events.append(
+                {
+                    "name": name,
+                    "cat": category,
+                    "ph": "X",
+                    "ts": (start - self.origin) * 1e6,
+                    "dur": (end - start) * 1e6,
+                    "pid": os.getpid(),
+                    "tid": self._thread_id(),
+                    "args": args,
+                }
+            )
+
+    @contextlib.contextmanager
+    def span(self, name: str, category: str, args: Dict[str, Any]) -> Iterator[Dict[str, Any]]:
+        start = time.perf_counter()
+        try:
+            yield args
+        except BaseException as e:
+            args["error"] = f"{type(e).__name__}: {e}"
+            raise
+        finally:
+            self.add(name, category, start, time.perf_counter(), args)
+
+    def write(self) -> None:
+        """Atomically write the trace file"""
+        with self.lock:
+            events = sorted(self.events, key=lambda event: (event.get("ts", -1), -event.get("dur", 0)))
+        tmp_path = f"{self.path}.{os.getpid()}.tmp"
+        with open(tmp_path, "w") as f:
+            json.dump({"traceEvents": events, "displayTimeUnit": "ms"}, f)
+        os.replace(tmp_path, self.path)
+
+
+_tracer: Optional[Tracer] = None
+
+
+def start(path: str) -> Tracer:
+    """Start tracing, the trace is written to path at exit"""
+    global _tracer
+    if _tracer is None:
+        _tracer = Tracer(path)
+        atexit.register(_write_at_exit)
+    return _tracer
+
+
+def start_from_env() -> Optional[Tracer]:
+    """Start tracing if $DF_TRACE is set to a file"""
+    path = os.environ.get("DF_TRACE")
+    return start(path) if path else None
+
+
+def _write_at_exit() -> None:
+    if _tracer is None:
+        return
+    try:
+        _tracer.write()
+        print(f"Trace written to {_tracer.path}", file=sys.stderr)
+    except OSError as e:
+        print(f"Could not write the trace to {_tracer.path}: {e}", file=sys.stderr)
+
+
+def span(name: str, category: str, **args: Any) -> ContextManager[Dict[str, Any]]:
+    """Record the with block as a span if tracing, yields the args of the span
+    (more can be added while it runs)
+    """
+    if _tracer is None:
+        return contextlib.nullcontext(args)
+    return _tracer.span(name, category, args)
+
+
+def traced(category: str) -> Callable[[F], F]:
+    """Decorator recording every call of a function as a span, named after
+    the function and its first argument (e.g. "symlink_path /home/user/.zshrc")
+    """
+
+    def decorator(func: F) -> F:
+        @functools.wraps(func)
+        def wrapper(*args: Any, **kwargs: Any) -> Any:
+            if _tracer is None:
+                return func(*args, **kwargs)
+            name = f"{func.__name__} {args[0]}" if args else func.__name__
+            with _tracer.span(name, category, {}):
+                return func(*args, **kwargs)
+
+        return cast(F, wrapper)
+
+    return decorator
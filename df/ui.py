@@ -2,7 +2,7 @@ import asyncio
 import os
 import re
 import traceback
-from typing import Any, List, Union
+from typing import Any, Dict, List, Set, Union
 
 from textual.app import App, ComposeResult
 from textual.binding import Binding
@@ -14,8 +14,20 @@ from textual.screen import Screen
 from textual.widgets import Button, LoadingIndicator, Static, TextLog
 
 import df.config
+import df.fingerprint
+import df.host
+import df.metrics
+import df.paths
+import df.prefetch
+import df.releases
+import df.scheduler
+import df.timeouts
+import df.trace
 from df.modules import MODULES
 
+# A real file, also when running from a zipapp
+UI_CSS_PATH = str(df.paths.resource_path("ui.css"))
+
 
 class ModuleItem(Static):
     """A Widget representing a module that can be installed/removed/updated."""
@@ -114,67 +126,108 @@ class ModuleItem(Static):
 class QueuedActionItem(Static):
     """A Widget representing a queued action."""
 
+    """State of the action.
+    One of "queued", "installing", "installed", "failed", "timeout" (ran out
+    of time, see df.timeouts) or "skipped" (a dependency failed). The widget
+    has a class with the same name, which is updated with the value.
+    """
+    state = reactive("queued")
+
+    STATE_LABELS = {
+        "queued": "",
+        "installing": " (running)",
+        "installed": " (done)",
+        "failed": " (failed)",
+        "timeout": " (timed out)",
+        "skipped": " (skipped)",
+    }
+
     def __init__(self, action, module, *args, **kwargs):
         super().__init__(*args, **kwargs)
         self.action = action
         self.module = module
         self.module_id = module.ID
         self.module_name = module.NAME
+        # Assigning the default value does not call watch_state, so add its class here
+        self.add_class(self.state)
 
     def compose(self) -> ComposeResult:
-        yield Static(f"- {self.action} {self.module_name}")
+        yield Static(self.label(), id="label")
         yield LoadingIndicator()
 
+    def label(self) -> str:
+        return f"- {self.action} {self.module_name}{self.STATE_LABELS.get(self.state, '')}"
 
-class InstallationScreen(Screen):
-    """Screen for showing the installation progress."""
+    def watch_state(self, old_state: str, new_state: str) -> None:
+        self.remove_class(old_state)
+        self.add_class(new_state)
+        try:
+            self.query("#label").first(Static).update(self.label())
+        except NoMatches:
+            # Not yet rendered, compose will use the new state
+            pass
 
-    CSS_PATH = "ui.css"
 
-    def __init__(self, Config: df.config.Config, queued_actions: List[Any], *args: Any, **kwargs: Any) -> None:
-        super().__init__(*args, **kwargs)
-        self.Config = Config
-        self.queued_actions = queued_actions
-        self.log_read_stream, self.log_write_stream = os.pipe()
-        # provide stdout with a file-like object that writes to the textlog
-        self.stdout = os.fdopen(self.log_write_stream, "w")
+class ModuleLog:
+    """File-like object, that writes the output of a module to the log of the
+    InstallationScreen, prefixed with the module name.
+    Must be used from a worker thread, not from the event loop.
+    """
 
-    def __del__(self):
-        os.close(self.log_read_stream)
-        self.stdout.close()
+    def __init__(self, screen: "InstallationScreen", prefix: str) -> None:
+        self.screen = screen
+        self.prefix = prefix
+        self.buffer = ""
 
-    async def pipe_log(self) -> None:
-        loop = asyncio.get_running_loop()
-        reader = asyncio.StreamReader(loop=loop)
-        fd = self.log_read_stream
+    def write(self, text: str) -> int:
+        self.buffer += text
+        *lines, self.buffer = self.buffer.split("\n")
+        for line in lines:
+            self.write_line(line)
+        return len(text)
 
-        def callback():
-            data = os.read(fd, 1024)
-            reader.feed_data(data)
+    def write_line(self, line: str) -> None:
+        line = re.sub(r"\x1b\[([0-9]{1,2}(;[0-9]{1,2})?)?[m|K]", "", line)
+        self.screen.call_in_ui(self.screen.print_log, f"[{self.prefix}] {line}")
 
-        loop.add_reader(fd, callback)
+    def flush(self) -> None:
+        if self.buffer:
+            self.write_line(self.buffer)
+            self.buffer = ""
+
+    def print(self, *args: Any, sep: str = " ", end: str = "\n", **kwargs: Any) -> None:
+        """Replacement for print() inside of modules"""
+        self.write(sep.join(map(str, args)) + end)
 
-        while True:
-            line = await reader.readline()
-            if not line:
-                break
-            text = line.decode()
-            text = re.sub(r"\x1b\[([0-9]{1,2}(;[0-9]{1,2})?)?[m|K]", "", text)
-            self.print_log(text, end="")
 
-        loop.remove_reader(fd)
+class InstallationScreen(Screen):
+    """Screen for showing the installation progress.
+    Independent actions are run in parallel (up to MAX_JOBS), an action is
+    only started after all actions it depends on are done.
+    """
+
+    CSS_PATH = UI_CSS_PATH
+    MAX_JOBS = int(os.environ.get("DF_JOBS", "4"))
+
+    def __init__(self, Config: df.config.Config, queued_actions: List[Any], *args: Any, **kwargs: Any) -> None:
+        super().__init__(*args, **kwargs)
+        self.Config = Config
+        self.queued_actions = queued_actions
+        self.queued_action_items: Dict[str, QueuedActionItem] = {}
+        # Module ids of the actions that were applied successfully
+        self.completed: Set[str] = set()
 
     def add_queued_actions(self, actions: list) -> None:
         container = self.query("#queued_actions").first(Container)
         # Remove old queued actions
         for child in container.query(QueuedActionItem):
             child.remove()
-        self.queued_action_items = []
+        self.queued_action_items = {}
         for action, module_id in actions:
             module = MODULES[module_id]
             item = QueuedActionItem(action, module)
-            item.add_class("queued")
-            self.queued_action_items.append(item)
+            item.state = "installed" if module_id in self.completed else "queued"
+            self.queued_action_items[module_id] = item
             container.mount(item)
 
     def compose(self) -> ComposeResult:
@@ -197,65 +250,122 @@ class InstallationScreen(Screen):
         self.textlog.write(s, shrink=False, scroll_end=True)
 
     def on_mount(self) -> None:
+        self.loop = asyncio.get_running_loop()
         # Start the installation in a separate thread
-        asyncio.create_task(self.pipe_log())
         asyncio.create_task(self.run_installation())
 
-    async def run_installation(self, resume_at: Union[int, None] = None) -> None:
-        self.add_queued_actions(self.queued_actions)
-        success = True
-        for i, (action, module_id) in enumerate(self.queued_actions):
-            if resume_at is not None and i < resume_at:
-                # Skip this action
-                self.queued_action_items[i].add_class("installed")
-                continue
-            module = MODULES[module_id]
-            # Mark the module as being installed
-            self.queued_action_items[i].remove_class("queued")
-            self.queued_action_items[i].add_class("installing")
-            self.print_log(f"Running {action} on {module.NAME}...")
-            try:
-                # Replace print with a function that writes to the textlog
-                module.print = self.print_log  # type: ignore[attr-defined]
-                # Run the action inside the module
-                config = self.Config.get_module(module_id)
+    def call_in_ui(self, callback: Any, *args: Any) -> None:
+        """Schedule callback to run on the event loop, can be called from any thread"""
+        self.loop.call_soon_threadsafe(callback, *args)
+
+    def action_dependencies(self, module_id: str) -> List[str]:
+        """Returns the module ids of the queued actions, that must be
+        applied before the action on module_id
+        """
+        actions = {id: action for action, id in self.queued_actions}
+        module = MODULES[module_id]
+        if actions[module_id] == "remove":
+            # Modules depending on this one are removed first
+            return [id for id, a in actions.items() if a == "remove" and module_id in MODULES[id].DEPENDENCIES]
+        # Dependencies are installed/updated first, conflicting modules are removed first
+        dependencies = [id for id in module.DEPENDENCIES if id in actions and actions[id] != "remove"]
+        for id, a in actions.items():
+            if a == "remove" and (id in module.CONFLICTING or module_id in MODULES[id].CONFLICTING):
+                dependencies.append(id)
+        return dependencies
+
+    def apply_action(self, module_id: str) -> bool:
+        """Apply the queued action of a module, runs in a worker thread"""
+        action = {id: a for a, id in self.queued_actions}[module_id]
+        module = MODULES[module_id]
+        log = ModuleLog(self, module.NAME)
+        log.print(f"Running {action} on {module.NAME}...")
+        try:
+            # Replace print with a function that writes to the log
+            module.print = log.print
+            # Run the action inside the module, while no other process can act on it
+            waiting = f"Waiting for another process to finish with {module.NAME}..."
+            with self.Config.locked_module(module_id, lambda: log.print(waiting)) as config:
                 if action == "install" or action == "install-no-deps":
-                    await asyncio.to_thread(module.install, config, self.stdout)
+                    if config.get_installed() and df.fingerprint.unchanged(module, config):
+                        log.print(f"{module.NAME} is unchanged since it was installed, skipping")
+                    else:
+                        with df.metrics.Phase("install", module_id), df.fingerprint.recording(module, config):
+                            module.install(config, log)
                     # Mark the module as installed
                     config.set_installed(True)
                     # save the installed version
                     if hasattr(module, "VERSION"):
                         config.set_installed_version(module.VERSION)
                 elif action == "update" or action == "update-no-deps":
-                    await asyncio.to_thread(module.update, config, self.stdout)
+                    if hasattr(module, "GITHUB_REPO") and df.fingerprint.unchanged(module, config):
+                        log.print(f"{module.NAME} is unchanged since it was installed, skipping")
+                    else:
+                        with df.metrics.Phase("update", module_id), df.fingerprint.recording(module, config):
+                            module.update(config, log)
                     # save the installed version
                     if hasattr(module, "VERSION"):
                         config.set_installed_version(module.VERSION)
                 elif action == "remove":
-                    await asyncio.to_thread(module.uninstall, config, self.stdout)
+                    with df.metrics.Phase("uninstall", module_id):
+                        module.uninstall(config, log)
+                    df.fingerprint.clear(config)
                     # Mark the module as not installed
                     config.set_installed(False)
-                self.stdout.flush()
-            except Exception as e:
-                self.stdout.flush()
-                # Mark the module as failed
-                self.queued_action_items[i].remove_class("installing")
-                self.queued_action_items[i].add_class("failed")
-                self.print_log(f"Error while running {action} on {module.NAME}: {e}")
-                # Print the traceback
-                self.print_log(traceback.format_exc())
-                success = False
-                self.failed_at = i
-                break
-            finally:
-                # Restore print
-                try:
-                    del module.print
-                except AttributeError:
-                    pass
-            # Mark the module as installed
-            self.queued_action_items[i].remove_class("installing")
-            self.queued_action_items[i].add_class("installed")
+            log.flush()
+        except Exception as e:
+            log.flush()
+            log.print(f"Error while running {action} on {module.NAME}: {e}")
+            # Print the traceback
+            log.print(traceback.format_exc())
+            log.flush()
+            return False
+        finally:
+            # Restore print
+            try:
+                del module.print
+            except AttributeError:
+                pass
+        self.completed.add(module_id)
+        return True
+
+    def set_action_state(self, module_id: str, state: str) -> None:
+        """Called by the scheduler (from its thread) when an action changes its state"""
+        item_states = {
+            df.scheduler.RUNNING: "installing",
+            df.scheduler.DONE: "installed",
+            df.scheduler.FAILED: "failed",
+            df.scheduler.TIMEOUT: "timeout",
+            df.scheduler.SKIPPED: "skipped",
+            df.scheduler.NOT_RUN: "queued",
+        }
+        item = self.queued_action_items[module_id]
+        self.call_in_ui(setattr, item, "state", item_states[state])
+
+    async def run_installation(self) -> None:
+        self.add_queued_actions(self.queued_actions)
+        remaining = [module_id for _, module_id in self.queued_actions if module_id not in self.completed]
+        # Download the files of all installs/updates in the background
+        actions = {id: action for action, id in self.queued_actions}
+        prefetcher = df.prefetch.start(MODULES[id] for id in remaining if actions[id] != "remove")
+        try:
+            with df.trace.span("apply changes", "run", actions={id: actions[id] for id in remaining}):
+                states = await asyncio.to_thread(
+                    df.scheduler.run_graph,
+                    remaining,
+                    self.action_dependencies,
+                    self.apply_action,
+                    self.MAX_JOBS,
+                    True,
+                    self.set_action_state,
+                    df.timeouts.ACTION_TIMEOUT,
+                )
+        finally:
+            prefetcher.shutdown()
+        success = all(state == df.scheduler.DONE for state in states.values())
+        timed_out = [id for id, state in states.items() if state == df.scheduler.TIMEOUT]
+        if timed_out:
+            self.print_log(f"Timed out after {df.timeouts.ACTION_TIMEOUT:.0f}s: {', '.join(timed_out)}")
         # Save the config
         self.Config.save()
         # Update the UI
@@ -276,13 +386,14 @@ class InstallationScreen(Screen):
             self.query("#title").first(Static).update("Applying changes...")
             self.query("#quit").first(Button).disabled = True
             self.query("#retry").first(Button).disabled = True
-            asyncio.create_task(self.run_installation(resume_at=self.failed_at))
+            # Only the actions that did not succeed are run again
+            asyncio.create_task(self.run_installation())
 
 
 class ErrorQueueingScreen(Screen):
     """Screen for showing incompatible modules."""
 
-    CSS_PATH = "ui.css"
+    CSS_PATH = UI_CSS_PATH
 
     def __init__(self, impossibleActionError, *args, **kwargs):
         super().__init__(*args, **kwargs)
@@ -330,7 +441,7 @@ class DotfilesApp(App):
     """A Terminal UI for managing dotfiles."""
 
     TITLE = "Dotfiles Manager"
-    CSS_PATH = "ui.css"
+    CSS_PATH = UI_CSS_PATH
     BINDINGS = [
         Binding("<ctrl-c>", "quit", "Quit the application"),
         Binding("down", "scroll_down", "Down", show=False),
@@ -378,17 +489,25 @@ class DotfilesApp(App):
                 self.modules_installed[module_id] = False
                 self.modules_installed_version[module_id] = None
                 self.modules_has_update[module_id] = False
-            self.modules_is_compatible[module_id] = module.is_compatible()
+            self.modules_is_compatible[module_id] = df.host.is_compatible(module)
+
+        # Resolve the upstream versions of all modules in one pass,
+        # has_update will then use the cached answers
+        df.releases.resolve_modules(MODULES[module_id] for module_id in updates_to_check)
 
         # Check for updates
         import concurrent.futures
 
+        def check_update(module: Any, module_config: df.config.ModuleConfig) -> Any:
+            with df.metrics.Phase("has_update", module.ID):
+                return module.has_update(module_config)
+
         with concurrent.futures.ThreadPoolExecutor() as executor:
             futures = []
             for module_id in updates_to_check:
                 module_config = self.Config.get_module(module_id)
                 module = MODULES[module_id]
-                future = executor.submit(module.has_update, module_config)
+                future = executor.submit(check_update, module, module_config)
                 futures.append(future)
 
             for future, module_id in zip(futures, updates_to_check, strict=False):
@@ -2,10 +2,13 @@
 # Dotfiles installer/updater/manager
 # Run this script with --help to see the available options
 
+import hashlib
 import importlib.util
+import json
 import os
 import subprocess
 import sys
+from typing import Any, Dict, Optional
 
 # To remove the hassle of having to install dependencies
 # for this script, it will automatically create a venv
@@ -27,32 +30,141 @@ def is_in_local_venv() -> bool:
     return False
 
 
+def read_stamp(venv_dir: str) -> Optional[Dict[str, Any]]:
+    """
+    Read the stamp file of the venv, written after the requirements were
+    installed. Returns None if it does not exist or is invalid.
+    """
+    try:
+        with open(os.path.join(venv_dir, ".df-stamp"), "r") as f:
+            return dict(json.load(f))
+    except (OSError, ValueError):
+        return None
+
+
+def requirements_match_stamp(requirements: str, stamp: Dict[str, Any]) -> bool:
+    """
+    Check if the requirements file is the one the venv was set up with
+    The file is only hashed if its size or modification time changed.
+    """
+    stat = os.stat(requirements)
+    if stat.st_mtime_ns == stamp.get("requirements_mtime_ns") and stat.st_size == stamp.get("requirements_size"):
+        return True
+    with open(requirements, "rb") as f:
+        return hashlib.sha256(f.read()).hexdigest() == stamp.get("requirements_sha256")
+
+
+def write_stamp(venv_dir: str, venv_python: str, requirements: str) -> None:
+    """
+    Write the stamp file of the venv, recording the installed requirements
+    and the interpreter (version and site-packages) of the venv
+    """
+    stat = os.stat(requirements)
+    with open(requirements, "rb") as f:
+        requirements_sha256 = hashlib.sha256(f.read()).hexdigest()
+    venv_info = subprocess.check_output(
+        [
+            venv_python,
+            "-c",
+            "import json, sys, sysconfig; "
+            "print(json.dumps({'python': sys.implementation.cache_tag, 'site_packages': sysconfig.get_path('purelib')}))",
+        ],
+        text=True,
+    )
+    stamp = {
+        "requirements_sha256": requirements_sha256,
+        "requirements_mtime_ns": stat.st_mtime_ns,
+        "requirements_size": stat.st_size,
+        **json.loads(venv_info),
+    }
+    with open(os.path.join(venv_dir, ".df-stamp"), "w") as f:
+        json.dump(stamp, f)
+
+
+def wheelhouse_dir() -> str:
+    """
+    Returns the directory of pre-downloaded wheels (see `dotfiles wheelhouse`)
+    $DF_WHEELHOUSE (e.g. on a shared drive) or .wheelhouse next to this script
+    """
+    return os.environ.get("DF_WHEELHOUSE") or os.path.join(os.path.dirname(os.path.realpath(__file__)), ".wheelhouse")
+
+
+def install_requirements(venv_pip: str, requirements: str) -> None:
+    """
+    Install the requirements into the venv, from the wheelhouse if it exists
+    (without network access), otherwise (or if it is incomplete) from PyPI
+    """
+    wheelhouse = wheelhouse_dir()
+    if os.path.isdir(wheelhouse):
+        result = subprocess.run([venv_pip, "install", "--no-index", "--find-links", wheelhouse, "-r", requirements])
+        if result.returncode == 0:
+            return
+        print("Installing from the wheelhouse failed, falling back to PyPI")
+    subprocess.check_call([venv_pip, "install", "-r", requirements])
+
+
 def create_venv_if_needed() -> None:
     """
     Create a venv in the same directory as the current script if the current
     Python interpreter is not in a venv. It will also install the dependencies
     from requirements.txt if the venv is created or if the requirements file
-    is newer than the venv.
+    changed since they were installed (see the stamp file).
     """
     if is_in_local_venv():
         return
 
     venv_dir = os.path.join(os.path.dirname(os.path.realpath(__file__)), ".venv")
     venv_pip = os.path.join(venv_dir, "bin", "pip")
+    venv_python = os.path.join(venv_dir, "bin", "python")
     if sys.platform == "win32":
         # On windows it's in a different location
         venv_pip = os.path.join(venv_dir, "Scripts", "pip.exe")
+        venv_python = os.path.join(venv_dir, "Scripts", "python.exe")
     requirements = os.path.join(os.path.dirname(os.path.realpath(__file__)), "requirements.txt")
 
     if not os.path.exists(venv_dir):
         # Create venv
         subprocess.check_call([sys.executable, "-m", "venv", venv_dir])
-        subprocess.check_call([venv_pip, "install", "-r", requirements])
-    elif os.path.getmtime(requirements) > os.path.getmtime(venv_dir):
-        # Update venv, requirements file is newer
-        subprocess.check_call([venv_pip, "install", "-r", requirements])
-        # Touch the venv directory to update its modification time
-        os.utime(venv_dir, None)
+        install_requirements(venv_pip, requirements)
+        write_stamp(venv_dir, venv_python, requirements)
+        return
+    stamp = read_stamp(venv_dir)
+    if stamp is None or not requirements_match_stamp(requirements, stamp):
+        # Update venv, requirements file changed
+        install_requirements(venv_pip, requirements)
+        write_stamp(venv_dir, venv_python, requirements)
+
+
+def use_venv_in_process() -> bool:
+    """
+    Fast path: if the venv is up to date and was created for the same
+    Python version as the current interpreter, add its site-packages to
+    sys.path instead of restarting in the venv.
+    Returns False if the script must be restarted with restart_with_venv().
+    """
+    venv_dir = os.path.join(os.path.dirname(os.path.realpath(__file__)), ".venv")
+    requirements = os.path.join(os.path.dirname(os.path.realpath(__file__)), "requirements.txt")
+    stamp = read_stamp(venv_dir)
+    if stamp is None or stamp.get("python") != sys.implementation.cache_tag:
+        return False
+    site_packages = stamp.get("site_packages")
+    if not site_packages or not os.path.isdir(site_packages) or not requirements_match_stamp(requirements, stamp):
+        return False
+
+    import site
+
+    # The packages of the venv take precedence over the ones of the interpreter
+    previous_path = list(sys.path)
+    site.addsitedir(site_packages)
+    venv_paths = [p for p in sys.path if p not in previous_path]
+    insert_at = next(
+        (i for i, p in enumerate(previous_path) if p.endswith(("site-packages", "dist-packages"))), len(previous_path)
+    )
+    sys.path[:] = previous_path[:insert_at] + venv_paths + previous_path[insert_at:]
+    # Same environment as after restart_with_venv()
+    os.environ["VIRTUAL_ENV"] = venv_dir
+    os.environ["DF_ORIGINAL_EXECUTABLE"] = sys.executable
+    return True
 
 
 def restart_with_venv() -> None:
@@ -76,11 +188,30 @@ def restart_with_venv() -> None:
         os.execl(venv_python, venv_python, *sys.argv)
 
 
+def start_profiler() -> None:
+    """
+    Start the startup profiler if requested (--profile-startup or
+    DF_PROFILE_STARTUP, see df/profiling.py). It is loaded by path, so the
+    import of df itself is profiled as well.
+    """
+    if not os.environ.get("DF_PROFILE_STARTUP") and not any(arg.startswith("--profile-startup") for arg in sys.argv):
+        return
+    path = os.path.join(os.path.dirname(os.path.realpath(__file__)), "df", "profiling.py")
+    spec = importlib.util.spec_from_file_location("df.profiling", path)
+    if spec is None or spec.loader is None:
+        return
+    profiling = importlib.util.module_from_spec(spec)
+    sys.modules["df.profiling"] = profiling
+    spec.loader.exec_module(profiling)
+    profiling.start_from_args(sys.argv[1:])
+
+
 # Relaunch this script in the venv if needed
 
 if __name__ == "__main__":
-    create_venv_if_needed()
-    if not is_in_local_venv():
+    start_profiler()
+    if not is_in_local_venv() and not use_venv_in_process():
+        create_venv_if_needed()
         restart_with_venv()
         exit()  # This line is never reached
 
@@ -152,7 +152,13 @@ create_and_activate_venv() {
     
     # Install dotfiles dependencies in the venv
     print_info "Installing dotfiles dependencies in .venv"
-    pip install -r requirements.txt >/dev/null 2>&1 || true
+    if [ -d "${DF_WHEELHOUSE:-.wheelhouse}" ]; then
+        # Pre-downloaded wheels, see `dotfiles.py wheelhouse`
+        pip install --no-index --find-links "${DF_WHEELHOUSE:-.wheelhouse}" -r requirements.txt >/dev/null 2>&1 \
+            || pip install -r requirements.txt >/dev/null 2>&1 || true
+    else
+        pip install -r requirements.txt >/dev/null 2>&1 || true
+    fi
 }
 
 # Sanity check: ensure we're in repo root
@@ -163,7 +169,14 @@ fi
 
 print_info "Preparing environment and ensuring python3/pip/venv are available..."
 ensure_python3_available
-create_and_activate_venv
+if [ -f "dotfiles.pyz" ]; then
+    # Prebuilt with scripts/build-zipapp.py, bundles all dependencies
+    print_info "Using dotfiles.pyz, skipping venv setup"
+    DOTFILES=dotfiles.pyz
+else
+    create_and_activate_venv
+    DOTFILES=dotfiles.py
+fi
 
 # Ensure GitHub CLI (gh) is present; attempt to install if it's missing
 if ! command -v gh >/dev/null 2>&1; then
@@ -188,7 +201,7 @@ print_info "Installing ${#MODULES[@]} essential modules for DevContainer..."
 
 # Install modules with continue-on-error to be resilient
 # Use python3 explicitly to avoid accidentally running Python 2 if `python` points to it
-if "$PY" dotfiles.py --quiet --continue-on-error install "${MODULES[@]}"; then
+if "$PY" "$DOTFILES" --quiet --continue-on-error install "${MODULES[@]}"; then
     print_success "DevContainer dotfiles installation completed successfully!"
 else
     exit_code=$?
@@ -197,7 +210,7 @@ else
 fi
 
 print_info "Installation summary:"
-"$PY" dotfiles.py list --installed
+"$PY" "$DOTFILES" list --installed
 
 print_success "DevContainer setup complete! 🎉"
 print_info "You may need to reload your shell or restart your terminal to see all changes."
@@ -0,0 +1,75 @@
+#!/usr/bin/env python3
+"""
+Build dotfiles.pyz, a single file distribution of the dotfiles manager
+
+The archive contains the df package (with all modules) and pure Python
+copies of its runtime dependencies, so it runs without creating a venv:
+
+    python3 dotfiles.pyz install zsh_config
+
+The dotfiles directory is the directory containing the archive, or
+$DF_DOTFILES_DIR. The bytecode is compiled for the Python version used to
+build the archive, other versions fall back to the bundled sources.
+"""
+
+import argparse
+import compileall
+import shutil
+import subprocess
+import sys
+import tempfile
+import zipapp
+from pathlib import Path
+from typing import List
+
+ROOT = Path(__file__).resolve().parent.parent
+# Requirements only needed for development, they are not bundled
+DEV_REQUIREMENTS = ("mypy", "types-")
+
+
+def runtime_requirements() -> List[str]:
+    """Returns the requirements from requirements.txt needed at runtime"""
+    requirements = []
+    for line in (ROOT / "requirements.txt").read_text().splitlines():
+        line = line.split("#")[0].strip()
+        if line and not line.startswith(DEV_REQUIREMENTS):
+            requirements.append(line)
+    return requirements
+
+
+def build(output: Path, python: str, compile_bytecode: bool) -> None:
+    with tempfile.TemporaryDirectory() as temp_dir_str:
+        staging = Path(temp_dir_str) / "app"
+        print("Installing dependencies...")
+        subprocess.check_call(
+            [python, "-m", "pip", "install", "--quiet", "--no-compile", "--target", str(staging), *runtime_requirements()]
+        )
+        # Native extensions can not be imported from a zip file, all bundled
+        # dependencies have pure Python fallbacks for them
+        for path in list(staging.rglob("*")):
+            if path.suffix in (".so", ".pyd"):
+                path.unlink()
+        shutil.rmtree(staging / "bin", ignore_errors=True)
+
+        print("Copying df...")
+        shutil.copytree(ROOT / "df", staging / "df", ignore=shutil.ignore_patterns("__pycache__", "*.pyc"))
+        if compile_bytecode:
+            # zipimport only uses .pyc files next to their sources
+            compileall.compile_dir(str(staging), quiet=1, legacy=True)
+
+        print(f"Writing {output}...")
+        zipapp.create_archive(staging, output, interpreter="/usr/bin/env python3", main="df.__main__:main", compressed=True)
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("-o", "--output", type=Path, default=ROOT / "dotfiles.pyz", help="Path of the archive")
+    parser.add_argument("--python", default=sys.executable, help="Python interpreter used to install the dependencies")
+    parser.add_argument("--no-compile", action="store_true", help="Do not include precompiled bytecode")
+    args = parser.parse_args()
+    build(args.output, args.python, not args.no_compile)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())